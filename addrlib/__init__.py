@@ -7,18 +7,59 @@
 # Addrlib
 # A Python/Cython Address Library for Wii U textures.
 
+backends = {}
+
 try:
     import pyximport
     pyximport.install()
 
-    from . import addrlib_cy as addrlib
+    from . import addrlib_cy
+    backends['cython'] = addrlib_cy
 
 except:
-    from . import addrlib
-
-# Define the functions that can be used
-getDefaultGX2TileMode = addrlib.getDefaultGX2TileMode
-deswizzle = addrlib.deswizzle
-swizzle = addrlib.swizzle
-surfaceGetBitsPerPixel = addrlib.surfaceGetBitsPerPixel
-getSurfaceInfo = addrlib.getSurfaceInfo
+    pass
+
+try:
+    from . import addrlib_np
+    backends['numpy'] = addrlib_np
+
+except ImportError:
+    pass
+
+from . import addrlib as addrlib_py
+backends['python'] = addrlib_py
+
+
+def setBackend(name):
+    """
+    name: 'cython', 'numpy' or 'python' (must be present in backends)
+    """
+
+    global addrlib
+    global getDefaultGX2TileMode, deswizzle, swizzle, deswizzleRegion, deswizzleBands
+    global surfaceGetBitsPerPixel, getSurfaceInfo
+    global getAddrMapCacheStats, setAddrMapCacheSize, clearAddrMapCache
+    global getSurfaceInfoCacheStats, setSurfaceInfoCacheSize, clearSurfaceInfoCache
+
+    if name not in backends:
+        raise ValueError("Addrlib backend not available: " + name)
+
+    addrlib = backends[name]
+
+    # Define the functions that can be used
+    getDefaultGX2TileMode = addrlib.getDefaultGX2TileMode
+    deswizzle = addrlib.deswizzle
+    swizzle = addrlib.swizzle
+    deswizzleRegion = addrlib.deswizzleRegion
+    deswizzleBands = addrlib.deswizzleBands
+    surfaceGetBitsPerPixel = addrlib.surfaceGetBitsPerPixel
+    getSurfaceInfo = addrlib.getSurfaceInfo
+    getAddrMapCacheStats = addrlib.getAddrMapCacheStats
+    setAddrMapCacheSize = addrlib.setAddrMapCacheSize
+    clearAddrMapCache = addrlib.clearAddrMapCache
+    getSurfaceInfoCacheStats = addrlib.getSurfaceInfoCacheStats
+    setSurfaceInfoCacheSize = addrlib.setSurfaceInfoCacheSize
+    clearSurfaceInfoCache = addrlib.clearSurfaceInfoCache
+
+
+setBackend(next(iter(backends)))
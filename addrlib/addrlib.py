@@ -8,6 +8,13 @@
 ################################################################
 ################################################################
 
+from array import array
+
+from . import cache
+
+# Zeros copied over the out buffers to clear them, see clearBuffer()
+zeroBlock = memoryview(bytes(0x10000))
+
 BCn_formats = [
     0x31, 0x431, 0x32, 0x432,
     0x33, 0x433, 0x34, 0x234,
@@ -58,8 +65,150 @@ def GX2TileModeToAddrTileMode(tileMode):
     return tileMode
 
 
+addrMapCache = cache.AddrMapCache()
+
+
+def getAddrMapCacheStats():
+    return addrMapCache.stats()
+
+
+def setAddrMapCacheSize(maxSize):
+    """
+    maxSize: maximum total size of the cached address maps in bytes (0 disables the cache)
+    """
+
+    addrMapCache.resize(maxSize)
+
+
+def clearAddrMapCache():
+    addrMapCache.clear()
+
+
+def computeMicroTileOffsets(tileMode, bpp, slice, isDepth):
+    """
+    Offsets of the 8x8 elements of a micro tile (in row-major order), relative to its first element.
+    Only the pixel index changes within a micro tile, and it only depends on the low 3 bits of x and y,
+    so the offsets are the same for every micro tile of the surface.
+    """
+
+    offsets = []
+    for y in range(8):
+        for x in range(8):
+            pixelIndex = computePixelIndexWithinMicroTile(x, y, slice, bpp, tileMode, isDepth)
+
+            if tileMode in [2, 3]:
+                offset = (bpp * pixelIndex) >> 3
+
+            else:
+                elemOffset = (bpp * pixelIndex + 7) // 8
+                offset = elemOffset & 255 | (elemOffset & -256) << 3
+
+            offsets.append(offset)
+
+    return [offset - offsets[0] for offset in offsets]
+
+
+def canCopyMicroTiles(tileMode, bpp, aa, slice, sample):
+    """
+    Whether the address of every element of a micro tile is the address of
+    its first element plus the offset from computeMicroTileOffsets().
+    Always true for micro tiled surfaces. For macro tiled surfaces, the micro tile
+    must not be split between samples nor slices, and must be a power of two in size.
+    """
+
+    if tileMode in [2, 3]:
+        return True
+
+    return not aa and not sample and slice < computeSurfaceThickness(tileMode) and bpp in [8, 16, 32, 64, 128]
+
+
+def computeAddrMap(width, height, depth, aa, use, tileMode, pipeSwizzle, bankSwizzle,
+                   pitch, bitsPerPixel, slice, sample):
+
+    """
+    Compute the tiled offset of every element of the surface, in linear order.
+    width and height are in elements (blocks for BCn formats), tileMode is an AddrTileMode.
+    """
+
+    return computeRegionAddrMap(0, 0, width, height, height, depth, aa, use, tileMode, pipeSwizzle, bankSwizzle,
+                                pitch, bitsPerPixel, slice, sample)
+
+
+def computeRegionAddrMap(x, y, width, height, surfHeight, depth, aa, use, tileMode, pipeSwizzle, bankSwizzle,
+                         pitch, bitsPerPixel, slice, sample):
+
+    """
+    Compute the tiled offset of every element of the width x height rectangle at (x, y), in linear order.
+    Only the micro tiles intersecting the rectangle are visited.
+    x, y, width, height and surfHeight (the height of the surface) are in elements (blocks for BCn formats),
+    tileMode is an AddrTileMode.
+    """
+
+    bytesPerPixel = bitsPerPixel // 8
+    isDepth = bool(use & 4)
+    addrMap = array('I', [0]) * (width * height)
+
+    if tileMode in [0, 1]:
+        # Rows are contiguous
+        for j in range(height):
+            pos = computeSurfaceAddrFromCoordLinear(x, y + j, slice, sample, bytesPerPixel, pitch, surfHeight, depth)
+            addrMap[j * width:(j + 1) * width] = array('I', range(pos, pos + width * bytesPerPixel, bytesPerPixel))
+
+    elif canCopyMicroTiles(tileMode, bitsPerPixel, aa, slice, sample):
+        # Compute the address once per micro tile
+        offsets = computeMicroTileOffsets(tileMode, bitsPerPixel, slice, isDepth)
+
+        for tileY in range(y & ~7, y + height, 8):
+            y0 = max(y, tileY)
+            y1 = min(y + height, tileY + 8)
+
+            for tileX in range(x & ~7, x + width, 8):
+                x0 = max(x, tileX)
+                x1 = min(x + width, tileX + 8)
+
+                if tileMode in [2, 3]:
+                    pos = computeSurfaceAddrFromCoordMicroTiled(tileX, tileY, slice, bitsPerPixel, pitch, surfHeight,
+                                                                tileMode, isDepth)
+
+                else:
+                    pos = computeSurfaceAddrFromCoordMacroTiled(tileX, tileY, slice, sample, bitsPerPixel, pitch, surfHeight,
+                                                                1 << aa, tileMode, isDepth, pipeSwizzle, bankSwizzle)
+
+                for j in range(y0, y1):
+                    i = (j - y) * width + x0 - x
+                    row = (j - tileY) * 8 - tileX
+                    addrMap[i:i + x1 - x0] = array('I', [pos + offset for offset in offsets[row + x0:row + x1]])
+
+    else:
+        i = 0
+        for j in range(y, y + height):
+            for k in range(x, x + width):
+                addrMap[i] = computeSurfaceAddrFromCoordMacroTiled(k, j, slice, sample, bitsPerPixel, pitch, surfHeight,
+                                                                   1 << aa, tileMode, isDepth, pipeSwizzle, bankSwizzle)
+                i += 1
+
+    return addrMap
+
+
+def getAddrMap(width, height, depth, aa, use, tileMode, pipeSwizzle, bankSwizzle,
+               pitch, bitsPerPixel, slice, sample):
+
+    key = (width, height, depth, aa, use & 4, tileMode, pipeSwizzle, bankSwizzle,
+           pitch, bitsPerPixel, slice, sample)
+
+    return addrMapCache.get(key, computeAddrMap, *key)
+
+
+def remapElement(element, remap):
+    fields, element_ = remap
+    for srcShift, mask, dstShift in fields:
+        element_ |= ((element >> srcShift) & mask) << dstShift
+
+    return element_
+
+
 def swizzleSurf(width, height, depth, format_, aa, use, tileMode, swizzle_,
-                pitch, bitsPerPixel, slice, sample, data, dataSize, swizzle):
+                pitch, bitsPerPixel, slice, sample, data, result, swizzle, remap=None):
 
     """
     width: width of the surface
@@ -72,12 +221,17 @@ def swizzleSurf(width, height, depth, format_, aa, use, tileMode, swizzle_,
     swizzle_: swizzle of the surface (GX2Surface.swizzle)
     pitch: aligned width of the surface (can be calculated using getSurfaceInfo())
     bitsPerPixel: bits per element for the given format (use surfaceGetBitsPerPixel())
-    data: data to be (un)swizzled
+    data: data to be (un)swizzled (bytes-like, indexed by byte)
+    result: writable bytes-like object where the (un)swizzled data will be written
+            (data is read as zero-extended to its size)
     swizzle: boolen where the data will be swizzled if true, otherwise unswizzled
+    remap: (fields, const) plan converting each 16 or 32 bits element, read as little endian, on the way:
+           const | ((element >> srcShift) & mask) << dstShift for every (srcShift, mask, dstShift) in fields
     """
 
     bytesPerPixel = bitsPerPixel // 8
-    result = bytearray(len(data))
+    dataSize = len(data)
+    resultSize = len(result)
 
     if format_ in BCn_formats:
         width = (width + 3) // 4
@@ -88,42 +242,200 @@ def swizzleSurf(width, height, depth, format_, aa, use, tileMode, swizzle_,
 
     tileMode = GX2TileModeToAddrTileMode(tileMode)
 
-    for y in range(height):
-        for x in range(width):
-            if tileMode in [0, 1]:
-                pos = computeSurfaceAddrFromCoordLinear(x, y, slice, sample, bytesPerPixel, pitch, height, depth)
+    addrMap = getAddrMap(width, height, depth, aa, use, tileMode, pipeSwizzle, bankSwizzle,
+                         pitch, bitsPerPixel, slice, sample)
+
+    pos_ = 0
+    for pos in addrMap:
+        if swizzle == 0:
+            src, dst = pos, pos_
 
-            elif tileMode in [2, 3]:
-                pos = computeSurfaceAddrFromCoordMicroTiled(x, y, slice, bitsPerPixel, pitch, height, tileMode, bool(use & 4))
+        else:
+            src, dst = pos_, pos
+
+        if src + bytesPerPixel <= dataSize and dst + bytesPerPixel <= resultSize:
+            if remap is None:
+                result[dst:dst + bytesPerPixel] = data[src:src + bytesPerPixel]
 
             else:
-                pos = computeSurfaceAddrFromCoordMacroTiled(x, y, slice, sample, bitsPerPixel, pitch, height, 1 << aa,
-                                                            tileMode, bool(use & 4), pipeSwizzle, bankSwizzle)
+                element = int.from_bytes(data[src:src + bytesPerPixel], 'little')
+                result[dst:dst + bytesPerPixel] = remapElement(element, remap).to_bytes(bytesPerPixel, 'little')
 
-            pos_ = (y * width + x) * bytesPerPixel
+        pos_ += bytesPerPixel
 
-            if pos_ + bytesPerPixel <= len(data) and pos + bytesPerPixel <= len(data):
-                if swizzle == 0:
-                    result[pos_:pos_ + bytesPerPixel] = data[pos:pos + bytesPerPixel]
 
-                else:
-                    result[pos:pos + bytesPerPixel] = data[pos_:pos_ + bytesPerPixel]
+def clearBuffer(buffer):
+    """
+    Zero a writable byte memoryview in place, copying zeroBlock over it chunk by chunk
+    rather than allocating zeros of its size.
+    """
+
+    size = len(buffer)
+    for pos in range(0, size, len(zeroBlock)):
+        end = min(size, pos + len(zeroBlock))
+        buffer[pos:end] = zeroBlock[:end - pos]
+
+
+def swizzleBuffer(width, height, depth, format_, aa, use, tileMode, swizzle_,
+                  pitch, bpp, slice, sample, data, swizzle, out, remap=None):
+
+    """
+    Run swizzleSurf() on byte views of data and out (any contiguous buffers),
+    allocating a new bytes object for the result if out is None.
+    """
+
+    if remap is not None and bpp not in [16, 32]:
+        raise ValueError("Elements can only be remapped for 16 and 32 bpp formats")
+
+    data = memoryview(data).cast('B')
+
+    if out is None:
+        result = bytearray(len(data))
+        swizzleSurf(width, height, depth, format_, aa, use, tileMode, swizzle_, pitch, bpp,
+                    slice, sample, data, result, swizzle, remap)
 
-    return bytes(result)
+        return bytes(result)
+
+    result = memoryview(out).cast('B')
+    if result.readonly:
+        raise BufferError("out is not writable")
+
+    clearBuffer(result)
+
+    swizzleSurf(width, height, depth, format_, aa, use, tileMode, swizzle_, pitch, bpp,
+                slice, sample, data, result, swizzle, remap)
+
+    return out
 
 
 def deswizzle(width, height, depth, format_, aa, use, tileMode, swizzle_,
-              pitch, bpp, slice, sample, data):
+              pitch, bpp, slice, sample, data, threads=1, out=None, remap=None):
+
+    """
+    data: any contiguous buffer (bytes, bytearray, memoryview, mmap, NumPy array...), it isn't copied
+    threads: ignored, only the Cython backend is multithreaded
+    out: writable buffer to write the result into and return, a new bytes object of the size of data if None.
+         The size of out is the size of the surface: data is truncated or zero-extended to it
+    remap: plan converting the elements while they're deswizzled (see swizzleSurf()), e.g. form_conv.getRemapPlan()
+    """
 
-    return swizzleSurf(width, height, depth, format_, aa, use, tileMode, swizzle_, pitch, bpp,
-                       slice, sample, data, len(data), False)
+    return swizzleBuffer(width, height, depth, format_, aa, use, tileMode, swizzle_, pitch, bpp,
+                         slice, sample, data, False, out, remap)
 
 
 def swizzle(width, height, depth, format_, aa, use, tileMode, swizzle_,
-            pitch, bpp, slice, sample, data):
+            pitch, bpp, slice, sample, data, threads=1, out=None, remap=None):
+
+    """
+    data: any contiguous buffer (bytes, bytearray, memoryview, mmap, NumPy array...), it isn't copied
+    threads: ignored, only the Cython backend is multithreaded
+    out: writable buffer to write the result into and return, a new bytes object of the size of data if None.
+         The size of out is the size of the surface: data is truncated or zero-extended to it
+    remap: plan converting the elements while they're swizzled (see swizzleSurf()), e.g. form_conv.getRemapPlan()
+    """
+
+    return swizzleBuffer(width, height, depth, format_, aa, use, tileMode, swizzle_, pitch, bpp,
+                         slice, sample, data, True, out, remap)
+
+
+def computeBandHeight(tileMode):
+    # Height of the row bands the surface is split into when (un)swizzling it band by band:
+    # one macro tile row for macro tiled surfaces, one micro tile row otherwise
+    if tileMode in [0, 1, 2, 3]:
+        return 8
+
+    return 16 * computeMacroTileAspectRatio(tileMode)
+
+
+def getRegionInElements(format_, width, height, x, y, regionWidth, regionHeight):
+    """
+    Convert a rectangle of the surface from pixels to elements,
+    expanding it to whole blocks for BCn formats.
+    Returns (x, y, regionWidth, regionHeight, surfHeight) in elements.
+    """
+
+    if regionWidth <= 0 or regionHeight <= 0 or x < 0 or y < 0 or x + regionWidth > width or y + regionHeight > height:
+        raise ValueError("Region (%d, %d, %d, %d) is outside of the %dx%d surface"
+                         % (x, y, regionWidth, regionHeight, width, height))
+
+    if format_ in BCn_formats:
+        return (x // 4, y // 4, (x + regionWidth + 3) // 4 - x // 4,
+                (y + regionHeight + 3) // 4 - y // 4, (height + 3) // 4)
+
+    return x, y, regionWidth, regionHeight, height
+
+
+def deswizzleRegion(width, height, depth, format_, aa, use, tileMode, swizzle_,
+                    pitch, bpp, slice, sample, data, x, y, regionWidth, regionHeight, out=None):
+
+    """
+    Deswizzle only the regionWidth x regionHeight rectangle at (x, y) of the surface,
+    computing the addresses of the micro tiles intersecting it only.
+    x, y, regionWidth and regionHeight are in pixels, for BCn formats the rectangle is expanded to whole blocks.
+    data: any contiguous buffer holding the whole swizzled surface, it isn't copied
+    out: writable buffer at least as large as the region to write the result into and return,
+         a new bytes object is returned if None
+    """
+
+    bytesPerPixel = bpp // 8
+    x, y, regionWidth, regionHeight, surfHeight = getRegionInElements(format_, width, height, x, y,
+                                                                     regionWidth, regionHeight)
+
+    data = memoryview(data).cast('B')
+    dataSize = len(data)
+    resultSize = regionWidth * regionHeight * bytesPerPixel
+
+    if out is None:
+        result = bytearray(resultSize)
+
+    else:
+        result = memoryview(out).cast('B')
+        if result.readonly:
+            raise BufferError("out is not writable")
+
+        if len(result) < resultSize:
+            raise ValueError("out is smaller than the region (%d < %d bytes)" % (len(result), resultSize))
+
+        result = result[:resultSize]
+        clearBuffer(result)
+
+    pipeSwizzle = (swizzle_ >> 8) & 1
+    bankSwizzle = (swizzle_ >> 9) & 3
 
-    return swizzleSurf(width, height, depth, format_, aa, use, tileMode, swizzle_, pitch, bpp,
-                       slice, sample, data, len(data), True)
+    addrMap = computeRegionAddrMap(x, y, regionWidth, regionHeight, surfHeight, depth, aa, use,
+                                   GX2TileModeToAddrTileMode(tileMode), pipeSwizzle, bankSwizzle,
+                                   pitch, bpp, slice, sample)
+
+    pos_ = 0
+    for pos in addrMap:
+        if pos + bytesPerPixel <= dataSize:
+            result[pos_:pos_ + bytesPerPixel] = data[pos:pos + bytesPerPixel]
+
+        pos_ += bytesPerPixel
+
+    if out is None:
+        return bytes(result)
+
+    return out
+
+
+def deswizzleBands(width, height, depth, format_, aa, use, tileMode, swizzle_,
+                   pitch, bpp, slice, sample, data):
+
+    """
+    Generator deswizzling the surface one row band (a macro tile row) at a time,
+    yielding the linear data of each band as bytes.
+    Only the address map of the current band is kept in memory.
+    data: any contiguous buffer holding the whole swizzled surface, it isn't copied
+    """
+
+    bandHeight = computeBandHeight(GX2TileModeToAddrTileMode(tileMode))
+    if format_ in BCn_formats:
+        bandHeight *= 4
+
+    for y in range(0, height, bandHeight):
+        yield deswizzleRegion(width, height, depth, format_, aa, use, tileMode, swizzle_, pitch, bpp,
+                              slice, sample, data, 0, y, width, min(bandHeight, height - y))
 
 
 formatHwInfo = [
@@ -445,11 +757,6 @@ def computeSurfaceAddrFromCoordMacroTiled(x, y, slice, sample, bpp, pitch, heigh
     return bank << 9 | pipe << 8 | totalOffset & 255 | (totalOffset & -256) << 3
 
 
-expPitch = 0
-expHeight = 0
-expNumSlices = 0
-
-
 class Flags:
     def __init__(self):
         self.value = 0
@@ -508,10 +815,6 @@ class surfaceOut:
         self.tileIndex = 0
 
 
-pIn = surfaceIn()
-pOut = surfaceOut()
-
-
 def powTwoAlign(x, align):
     return ~(align - 1) & (x + align - 1)
 
@@ -534,7 +837,7 @@ def getBitsPerPixel(format_):
             formatExInfo[fmtIdx + 2], formatExInfo[fmtIdx + 3])
 
 
-def adjustSurfaceInfo(elemMode, expandX, expandY, bpp, width, height):
+def adjustSurfaceInfo(pIn, elemMode, expandX, expandY, bpp, width, height):
     bBCnFormat = 0
     if bpp and elemMode in [9, 10, 11, 12, 13]:
         bBCnFormat = 1
@@ -583,7 +886,7 @@ def adjustSurfaceInfo(elemMode, expandX, expandY, bpp, width, height):
     return 0
 
 
-def hwlComputeMipLevel():
+def hwlComputeMipLevel(pIn):
     handled = 0
 
     if 49 <= pIn.format <= 55:
@@ -612,7 +915,7 @@ def hwlComputeMipLevel():
     return handled
 
 
-def computeMipLevel():
+def computeMipLevel(pIn):
     slices = 0
     height = 0
     width = 0
@@ -622,7 +925,7 @@ def computeMipLevel():
         pIn.width = powTwoAlign(pIn.width, 4)
         pIn.height = powTwoAlign(pIn.height, 4)
 
-    hwlHandled = hwlComputeMipLevel()
+    hwlHandled = hwlComputeMipLevel(pIn)
     if not hwlHandled and pIn.mipLevel and (pIn.flags.value >> 12) & 1:
         width = max(1, pIn.width >> pIn.mipLevel)
         height = max(1, pIn.height >> pIn.mipLevel)
@@ -769,11 +1072,7 @@ def computeSurfaceMipLevelTileMode(baseTileMode, bpp, level, width, height, numS
         1)
 
 
-def padDimensions(tileMode, padDims, isCube, pitchAlign, heightAlign, sliceAlign):
-    global expPitch
-    global expHeight
-    global expNumSlices
-
+def padDimensions(expPitch, expHeight, expNumSlices, tileMode, padDims, isCube, pitchAlign, heightAlign, sliceAlign):
     thickness = computeSurfaceThickness(tileMode)
     if not padDims:
         padDims = 3
@@ -828,11 +1127,7 @@ def computeSurfaceAlignmentsLinear(tileMode, bpp, flags):
     return baseAlign, pitchAlign, heightAlign
 
 
-def computeSurfaceInfoLinear(tileMode, bpp, numSamples, pitch, height, numSlices, mipLevel, padDims, flags):
-    global expPitch
-    global expHeight
-    global expNumSlices
-
+def computeSurfaceInfoLinear(pOut, tileMode, bpp, numSamples, pitch, height, numSlices, mipLevel, padDims, flags):
     expPitch = pitch
     expHeight = height
     expNumSlices = numSlices
@@ -863,6 +1158,9 @@ def computeSurfaceInfoLinear(tileMode, bpp, numSamples, pitch, height, numSlices
             expNumSlices = nextPow2(numSlices)
 
     expPitch, expHeight, expNumSlices = padDimensions(
+        expPitch,
+        expHeight,
+        expNumSlices,
         tileMode,
         padDims,
         (flags.value >> 4) & 1,
@@ -900,11 +1198,7 @@ def computeSurfaceAlignmentsMicroTiled(tileMode, bpp, flags, numSamples):
     return baseAlign, pitchAlign, heightAlign
 
 
-def computeSurfaceInfoMicroTiled(tileMode, bpp, numSamples, pitch, height, numSlices, mipLevel, padDims, flags):
-    global expPitch
-    global expHeight
-    global expNumSlices
-
+def computeSurfaceInfoMicroTiled(pOut, tileMode, bpp, numSamples, pitch, height, numSlices, mipLevel, padDims, flags):
     expTileMode = tileMode
     expPitch = pitch
     expHeight = height
@@ -939,6 +1233,9 @@ def computeSurfaceInfoMicroTiled(tileMode, bpp, numSamples, pitch, height, numSl
         numSamples)
 
     expPitch, expHeight, expNumSlices = padDimensions(
+        expPitch,
+        expHeight,
+        expNumSlices,
         expTileMode,
         padDims,
         (flags.value >> 4) & 1,
@@ -991,11 +1288,7 @@ def computeSurfaceAlignmentsMacroTiled(tileMode, bpp, flags, numSamples):
     return baseAlign, pitchAlign, heightAlign, macroTileWidth, macroTileHeight
 
 
-def computeSurfaceInfoMacroTiled(tileMode, baseTileMode, bpp, numSamples, pitch, height, numSlices, mipLevel, padDims, flags):
-    global expPitch
-    global expHeight
-    global expNumSlices
-
+def computeSurfaceInfoMacroTiled(pOut, tileMode, baseTileMode, bpp, numSamples, pitch, height, numSlices, mipLevel, padDims, flags):
     expPitch = pitch
     expHeight = height
     expNumSlices = numSlices
@@ -1035,6 +1328,9 @@ def computeSurfaceInfoMacroTiled(tileMode, baseTileMode, bpp, numSamples, pitch,
             pitchAlign = bankSwappedWidth
 
         expPitch, expHeight, expNumSlices = padDimensions(
+            expPitch,
+            expHeight,
+            expNumSlices,
             tileMode,
             padDims,
             (flags.value >> 4) & 1,
@@ -1066,6 +1362,7 @@ def computeSurfaceInfoMacroTiled(tileMode, baseTileMode, bpp, numSamples, pitch,
             expTileMode = 2
 
             result = computeSurfaceInfoMicroTiled(
+                pOut,
                 2,
                 bpp,
                 numSamples,
@@ -1088,6 +1385,9 @@ def computeSurfaceInfoMacroTiled(tileMode, baseTileMode, bpp, numSamples, pitch,
                 pitchAlign = bankSwappedWidth
 
             expPitch, expHeight, expNumSlices = padDimensions(
+                expPitch,
+                expHeight,
+                expNumSlices,
                 tileMode,
                 padDims,
                 (flags.value >> 4) & 1,
@@ -1109,7 +1409,7 @@ def computeSurfaceInfoMacroTiled(tileMode, baseTileMode, bpp, numSamples, pitch,
     return result
 
 
-def ComputeSurfaceInfoEx():
+def ComputeSurfaceInfoEx(pIn, pOut):
     tileMode = pIn.tileMode
     bpp = pIn.bpp
     numSamples = max(1, pIn.numSamples)
@@ -1143,6 +1443,7 @@ def ComputeSurfaceInfoEx():
 
     if tileMode in [0, 1]:
         valid = computeSurfaceInfoLinear(
+            pOut,
             tileMode,
             bpp,
             numSamples,
@@ -1157,6 +1458,7 @@ def ComputeSurfaceInfoEx():
 
     elif tileMode in [2, 3]:
         valid = computeSurfaceInfoMicroTiled(
+            pOut,
             tileMode,
             bpp,
             numSamples,
@@ -1169,6 +1471,7 @@ def ComputeSurfaceInfoEx():
 
     elif tileMode in [4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15]:
         valid = computeSurfaceInfoMacroTiled(
+            pOut,
             tileMode,
             baseTileMode,
             bpp,
@@ -1186,7 +1489,7 @@ def ComputeSurfaceInfoEx():
     return 0
 
 
-def restoreSurfaceInfo(elemMode, expandX, expandY, bpp):
+def restoreSurfaceInfo(pOut, elemMode, expandX, expandY, bpp):
     if pOut.pixelPitch and pOut.pixelHeight:
         width = pOut.pixelPitch
         height = pOut.pixelHeight
@@ -1221,13 +1524,7 @@ def restoreSurfaceInfo(elemMode, expandX, expandY, bpp):
     return 0
 
 
-def computeSurfaceInfo(aSurfIn, pSurfOut):
-    global pIn
-    global pOut
-
-    pIn = aSurfIn
-    pOut = pSurfOut
-
+def computeSurfaceInfo(pIn, pOut):
     returnCode = 0
     elemMode = 0
 
@@ -1235,7 +1532,7 @@ def computeSurfaceInfo(aSurfIn, pSurfOut):
         returnCode = 3
 
     if returnCode == 0:
-        computeMipLevel()
+        computeMipLevel(pIn)
 
         width = pIn.width
         height = pIn.height
@@ -1251,7 +1548,7 @@ def computeSurfaceInfo(aSurfIn, pSurfOut):
             if elemMode == 4 and expandX == 3 and pIn.tileMode == 1:
                 pIn.flags.value |= 0x200
 
-            bpp = adjustSurfaceInfo(elemMode, expandX, expandY, bpp, width, height)
+            bpp = adjustSurfaceInfo(pIn, elemMode, expandX, expandY, bpp, width, height)
 
         elif pIn.bpp:
             pIn.width = max(1, pIn.width)
@@ -1261,7 +1558,7 @@ def computeSurfaceInfo(aSurfIn, pSurfOut):
             returnCode = 3
 
         if returnCode == 0:
-            returnCode = ComputeSurfaceInfoEx()
+            returnCode = ComputeSurfaceInfoEx(pIn, pOut)
 
         if returnCode == 0:
             pOut.bpp = pIn.bpp
@@ -1269,7 +1566,7 @@ def computeSurfaceInfo(aSurfIn, pSurfOut):
             pOut.pixelHeight = pOut.height
 
             if pIn.format and (not (pIn.flags.value >> 9) & 1 or not pIn.mipLevel):
-                bpp = restoreSurfaceInfo(elemMode, expandX, expandY, bpp)
+                bpp = restoreSurfaceInfo(pOut, elemMode, expandX, expandY, bpp)
 
             if (pIn.flags.value >> 5) & 1:
                 pOut.sliceSize = pOut.surfSize
@@ -1285,6 +1582,25 @@ def computeSurfaceInfo(aSurfIn, pSurfOut):
             pOut.sliceTileMax = (pOut.height * pOut.pitch >> 6) - 1
 
 
+surfaceInfoCache = cache.LRUCache(4096)
+
+
+def getSurfaceInfoCacheStats():
+    return surfaceInfoCache.stats()
+
+
+def setSurfaceInfoCacheSize(maxSize):
+    """
+    maxSize: maximum number of cached surface infos (0 disables the cache)
+    """
+
+    surfaceInfoCache.resize(maxSize)
+
+
+def clearSurfaceInfoCache():
+    surfaceInfoCache.clear()
+
+
 def getSurfaceInfo(surfaceFormat, surfaceWidth, surfaceHeight, surfaceDepth, surfaceDim, surfaceTileMode, surfaceAA, level):
     """
     surfaceFormat: format of the surface (GX2SurfaceFormat)
@@ -1295,8 +1611,16 @@ def getSurfaceInfo(surfaceFormat, surfaceWidth, surfaceHeight, surfaceDepth, sur
     surfaceTileMode: GX2TileMode (note: NOT AddrTileMode)
     surfaceAA: AA mode of the surface (GX2AAMode)
     level: mip level of which the info will be calculated for (first mipmap corresponds to value 1)
+
+    The result is memoized, and is an immutable SurfaceInfo shared between calls with the same arguments.
     """
 
+    key = (surfaceFormat, surfaceWidth, surfaceHeight, surfaceDepth, surfaceDim, surfaceTileMode, surfaceAA, level)
+
+    return surfaceInfoCache.get(key, cache.freezeSurfaceInfo, computeGX2SurfaceInfo, *key)
+
+
+def computeGX2SurfaceInfo(surfaceFormat, surfaceWidth, surfaceHeight, surfaceDepth, surfaceDim, surfaceTileMode, surfaceAA, level):
     dim = 0
     width = 0
     blockSize = 0
@@ -1417,8 +1741,6 @@ def getSurfaceInfo(surfaceFormat, surfaceWidth, surfaceHeight, surfaceDepth, sur
         pSurfOut.size = 96
         computeSurfaceInfo(aSurfIn, pSurfOut)
 
-        pSurfOut = pOut
-
     if not pSurfOut.tileMode:
         pSurfOut.tileMode = 16
 
@@ -9,6 +9,13 @@
 ################################################################
 
 from cpython cimport array
+from cpython.buffer cimport PyObject_GetBuffer, PyBuffer_Release, PyBUF_SIMPLE, PyBUF_WRITABLE
+from cpython.bytes cimport PyBytes_FromStringAndSize, PyBytes_AS_STRING
+from cython.parallel cimport prange
+from libc.string cimport memset
+import os
+
+from . import cache
 
 
 ctypedef unsigned char u8
@@ -17,6 +24,14 @@ ctypedef long long int64
 ctypedef unsigned long long u64
 
 
+cdef struct RemapPlan:
+    u32 numFields
+    u32 srcShift[32]
+    u32 mask[32]
+    u32 dstShift[32]
+    u32 const_
+
+
 cdef list BCn_formats = [
     0x31, 0x431, 0x32, 0x432,
     0x33, 0x433, 0x34, 0x234,
@@ -68,8 +83,220 @@ cdef u32 GX2TileModeToAddrTileMode(u32 tileMode):
     return tileMode
 
 
-cdef bytes swizzleSurf(u32 width, u32 height, u32 depth, u32 format_, u32 aa, u32 use, u32 tileMode, u32 swizzle_,
-                       u32 pitch, u32 bitsPerPixel, u32 slice, u32 sample, u8 *data, u32 dataSize, int swizzle):
+addrMapCache = cache.AddrMapCache()
+
+
+def getAddrMapCacheStats():
+    return addrMapCache.stats()
+
+
+def setAddrMapCacheSize(maxSize):
+    """
+    maxSize: maximum total size of the cached address maps in bytes (0 disables the cache)
+    """
+
+    addrMapCache.resize(maxSize)
+
+
+def clearAddrMapCache():
+    addrMapCache.clear()
+
+
+cdef array.array addrMapTemplate = array.array('I', [])
+
+
+cdef void computeMicroTileOffsets(u32 tileMode, u32 bpp, u32 slice, int isDepth, int64 *offsets):
+    """
+    Offsets of the 8x8 elements of a micro tile (in row-major order), relative to its first element.
+    Only the pixel index changes within a micro tile, and it only depends on the low 3 bits of x and y,
+    so the offsets are the same for every micro tile of the surface.
+    """
+
+    cdef:
+        u32 y, x, pixelIndex
+        int64 elemOffset, first
+
+    for y in range(8):
+        for x in range(8):
+            pixelIndex = computePixelIndexWithinMicroTile(x, y, slice, bpp, tileMode, isDepth)
+
+            if tileMode in [2, 3]:
+                offsets[y * 8 + x] = (<int64>bpp * pixelIndex) >> 3
+
+            else:
+                elemOffset = (<int64>bpp * pixelIndex + 7) // 8
+                offsets[y * 8 + x] = elemOffset & 255 | (elemOffset & -256) << 3
+
+    first = offsets[0]
+    for x in range(64):
+        offsets[x] -= first
+
+
+cdef int canCopyMicroTiles(u32 tileMode, u32 bpp, u32 aa, u32 slice, u32 sample):
+    """
+    Whether the address of every element of a micro tile is the address of
+    its first element plus the offset from computeMicroTileOffsets().
+    Always true for micro tiled surfaces. For macro tiled surfaces, the micro tile
+    must not be split between samples nor slices, and must be a power of two in size.
+    """
+
+    if tileMode in [2, 3]:
+        return 1
+
+    return not aa and not sample and slice < computeSurfaceThickness(tileMode) and bpp in [8, 16, 32, 64, 128]
+
+
+cpdef array.array computeAddrMap(u32 width, u32 height, u32 depth, u32 aa, u32 use, u32 tileMode, u32 pipeSwizzle,
+                                 u32 bankSwizzle, u32 pitch, u32 bitsPerPixel, u32 slice, u32 sample):
+
+    """
+    Compute the tiled offset of every element of the surface, in linear order.
+    width and height are in elements (blocks for BCn formats), tileMode is an AddrTileMode.
+    """
+
+    return computeRegionAddrMap(0, 0, width, height, height, depth, aa, use, tileMode, pipeSwizzle, bankSwizzle,
+                                pitch, bitsPerPixel, slice, sample)
+
+
+cpdef array.array computeRegionAddrMap(u32 x, u32 y, u32 width, u32 height, u32 surfHeight, u32 depth, u32 aa, u32 use,
+                                       u32 tileMode, u32 pipeSwizzle, u32 bankSwizzle, u32 pitch, u32 bitsPerPixel,
+                                       u32 slice, u32 sample):
+
+    """
+    Compute the tiled offset of every element of the width x height rectangle at (x, y), in linear order.
+    Only the micro tiles intersecting the rectangle are visited.
+    x, y, width, height and surfHeight (the height of the surface) are in elements (blocks for BCn formats),
+    tileMode is an AddrTileMode.
+    """
+
+    cdef:
+        u32 bytesPerPixel = bitsPerPixel // 8
+        int isDepth = use & 4
+        array.array addrMap = array.clone(addrMapTemplate, width * height, zero=False)
+        u32 *addrs = addrMap.data.as_uints
+
+        int64 offsets[64]
+        u32 tileY, tileX, x0, x1, y0, y1, j, k, i = 0
+        u64 pos
+
+    if tileMode in [0, 1]:
+        # Rows are contiguous
+        for j in range(height):
+            pos = computeSurfaceAddrFromCoordLinear(x, y + j, slice, sample, bytesPerPixel, pitch, surfHeight, depth)
+            for k in range(width):
+                addrs[i] = <u32>(pos + k * bytesPerPixel)
+                i += 1
+
+    elif canCopyMicroTiles(tileMode, bitsPerPixel, aa, slice, sample):
+        # Compute the address once per micro tile
+        computeMicroTileOffsets(tileMode, bitsPerPixel, slice, isDepth, offsets)
+
+        for tileY in range(y & ~7, y + height, 8):
+            y0 = max(y, tileY)
+            y1 = min(y + height, tileY + 8)
+
+            for tileX in range(x & ~7, x + width, 8):
+                x0 = max(x, tileX)
+                x1 = min(x + width, tileX + 8)
+
+                if tileMode in [2, 3]:
+                    pos = computeSurfaceAddrFromCoordMicroTiled(tileX, tileY, slice, bitsPerPixel, pitch, surfHeight,
+                                                                tileMode, isDepth)
+
+                else:
+                    pos = computeSurfaceAddrFromCoordMacroTiled(tileX, tileY, slice, sample, bitsPerPixel, pitch, surfHeight,
+                                                                1 << aa, tileMode, isDepth, pipeSwizzle, bankSwizzle)
+
+                for j in range(y0, y1):
+                    i = (j - y) * width - x
+                    for k in range(x0, x1):
+                        addrs[i + k] = <u32>(pos + offsets[(j - tileY) * 8 + k - tileX])
+
+    else:
+        for j in range(y, y + height):
+            for k in range(x, x + width):
+                addrs[i] = <u32>computeSurfaceAddrFromCoordMacroTiled(k, j, slice, sample, bitsPerPixel, pitch, surfHeight,
+                                                                      1 << aa, tileMode, isDepth, pipeSwizzle, bankSwizzle)
+                i += 1
+
+    return addrMap
+
+
+cdef array.array getAddrMap(u32 width, u32 height, u32 depth, u32 aa, u32 use, u32 tileMode, u32 pipeSwizzle,
+                            u32 bankSwizzle, u32 pitch, u32 bitsPerPixel, u32 slice, u32 sample):
+
+    key = (width, height, depth, aa, use & 4, tileMode, pipeSwizzle, bankSwizzle,
+           pitch, bitsPerPixel, slice, sample)
+
+    return addrMapCache.get(key, computeAddrMap, *key)
+
+
+cdef u32 computeBandHeight(u32 tileMode):
+    # Height of the row bands the surface is split into when (un)swizzling with multiple threads:
+    # one macro tile row for macro tiled surfaces, one micro tile row otherwise
+    if tileMode in [0, 1, 2, 3]:
+        return 8
+
+    return 16 * computeMacroTileAspectRatio(tileMode)
+
+
+cdef void compileRemapPlan(object remap, RemapPlan *plan) except *:
+    cdef u32 i
+
+    fields, const = remap
+    if len(fields) > 32:
+        raise ValueError("Invalid remap plan: too many fields")
+
+    plan.numFields = len(fields)
+    plan.const_ = const
+
+    for i in range(plan.numFields):
+        plan.srcShift[i], plan.mask[i], plan.dstShift[i] = fields[i]
+        if plan.srcShift[i] >= 32 or plan.dstShift[i] >= 32:
+            raise ValueError("Invalid remap plan: shifts must be smaller than 32")
+
+
+cdef inline void remapElement(u8 *src, u8 *dst, u32 bytesPerPixel, const RemapPlan *plan) noexcept nogil:
+    cdef u32 n, element = 0, element_ = plan.const_
+
+    for n in range(bytesPerPixel):
+        element |= src[n] << (8 * n)
+
+    for n in range(plan.numFields):
+        element_ |= ((element >> plan.srcShift[n]) & plan.mask[n]) << plan.dstShift[n]
+
+    for n in range(bytesPerPixel):
+        dst[n] = (element_ >> (8 * n)) & 0xFF
+
+
+cdef void swizzleBand(u8 *data, u8 *out, u32 *addrs, u32 width, u32 y0, u32 y1,
+                      u32 bytesPerPixel, u32 dataSize, u32 outSize, int swizzle,
+                      const RemapPlan *remap) noexcept nogil:
+
+    cdef u32 i, pos, pos_, src, dst, n
+
+    for i in range(y0 * width, y1 * width):
+        pos = addrs[i]
+        pos_ = i * bytesPerPixel
+
+        if swizzle == 0:
+            src, dst = pos, pos_
+
+        else:
+            src, dst = pos_, pos
+
+        if src + bytesPerPixel <= dataSize and dst + bytesPerPixel <= outSize:
+            if remap == NULL:
+                for n in range(bytesPerPixel):
+                    out[dst + n] = data[src + n]
+
+            else:
+                remapElement(data + src, out + dst, bytesPerPixel, remap)
+
+
+cdef void swizzleSurf(u32 width, u32 height, u32 depth, u32 format_, u32 aa, u32 use, u32 tileMode, u32 swizzle_,
+                      u32 pitch, u32 bitsPerPixel, u32 slice, u32 sample, u8 *data, u32 dataSize, u8 *out, u32 outSize,
+                      int swizzle, int threads, const RemapPlan *remap) except *:
 
     """
     width: width of the surface
@@ -82,15 +309,21 @@ cdef bytes swizzleSurf(u32 width, u32 height, u32 depth, u32 format_, u32 aa, u3
     swizzle_: swizzle of the surface (GX2Surface.swizzle)
     pitch: aligned width of the surface (can be calculated using getSurfaceInfo())
     bitsPerPixel: bits per element for the given format (use surfaceGetBitsPerPixel())
-    data: data to be (un)swizzled
+    data: dataSize bytes of data to be (un)swizzled
+    out: outSize bytes where the (un)swizzled data will be written (data is read as zero-extended to outSize)
     swizzle: boolen where the data will be swizzled if true, otherwise unswizzled
+    threads: number of threads the row bands of the surface are split across
+    remap: plan converting each 16 or 32 bits element, read as little endian, on the way (NULL to copy them as is):
+           const | ((element >> srcShift) & mask) << dstShift for every (srcShift, mask, dstShift) in fields
     """
 
     cdef:
         u32 bytesPerPixel = bitsPerPixel // 8
-        bytearray result = bytearray(dataSize)
 
-        u32 pipeSwizzle, bankSwizzle, y, x, pos, pos_, n
+        array.array addrMap
+        u32 *addrs
+        u32 pipeSwizzle, bankSwizzle, bandHeight, numBands
+        int band
 
     if format_ in BCn_formats:
         width = (width + 3) // 4
@@ -101,48 +334,213 @@ cdef bytes swizzleSurf(u32 width, u32 height, u32 depth, u32 format_, u32 aa, u3
 
     tileMode = GX2TileModeToAddrTileMode(tileMode)
 
-    for y in range(height):
-        for x in range(width):
-            if tileMode in [0, 1]:
-                pos = <u32>computeSurfaceAddrFromCoordLinear(x, y, slice, sample, bytesPerPixel, pitch, height, depth)
+    addrMap = getAddrMap(width, height, depth, aa, use, tileMode, pipeSwizzle, bankSwizzle,
+                         pitch, bitsPerPixel, slice, sample)
+    addrs = addrMap.data.as_uints
 
-            elif tileMode in [2, 3]:
-                pos = <u32>computeSurfaceAddrFromCoordMicroTiled(x, y, slice, bitsPerPixel, pitch, height, tileMode, use & 4)
+    bandHeight = computeBandHeight(tileMode)
+    numBands = (height + bandHeight - 1) // bandHeight
 
-            else:
-                pos = <u32>computeSurfaceAddrFromCoordMacroTiled(x, y, slice, sample, bitsPerPixel, pitch, height, 1 << aa,
-                                                                 tileMode, use & 4, pipeSwizzle, bankSwizzle)
+    with nogil:
+        memset(out, 0, outSize)
 
-            pos_ = (y * width + x) * bytesPerPixel
+        if threads > 1 and numBands > 1:
+            for band in prange(<int>numBands, num_threads=threads, schedule='static'):
+                swizzleBand(data, out, addrs, width, band * bandHeight, min(height, (band + 1) * bandHeight),
+                            bytesPerPixel, dataSize, outSize, swizzle, remap)
 
-            if pos_ + bytesPerPixel <= dataSize and pos + bytesPerPixel <= dataSize:
-                if swizzle == 0:
-                    for n in range(bytesPerPixel):
-                        result[pos_ + n] = <u8>data[pos + n]
+        else:
+            swizzleBand(data, out, addrs, width, 0, height, bytesPerPixel, dataSize, outSize, swizzle, remap)
 
-                else:
-                    for n in range(bytesPerPixel):
-                        result[pos + n] = <u8>data[pos_ + n]
 
-    return bytes(result)
+cdef object swizzleBuffer(u32 width, u32 height, u32 depth, u32 format_, u32 aa, u32 use, u32 tileMode, u32 swizzle_,
+                          u32 pitch, u32 bpp, u32 slice, u32 sample, object data, int swizzle, int threads, object out,
+                          object remap):
+
+    """
+    Run swizzleSurf() directly on the memory of data and out (any contiguous buffers),
+    allocating a new bytes object for the result if out is None.
+    """
+
+    cdef:
+        Py_buffer dataBuf
+        Py_buffer outBuf
+        object result
+        RemapPlan plan
+        RemapPlan *remapPlan = NULL
+
+    if threads <= 0:
+        threads = os.cpu_count() or 1
+
+    if remap is not None:
+        if bpp not in [16, 32]:
+            raise ValueError("Elements can only be remapped for 16 and 32 bpp formats")
+
+        compileRemapPlan(remap, &plan)
+        remapPlan = &plan
+
+    PyObject_GetBuffer(data, &dataBuf, PyBUF_SIMPLE)
+    try:
+        if out is None:
+            result = PyBytes_FromStringAndSize(NULL, dataBuf.len)
+            swizzleSurf(width, height, depth, format_, aa, use, tileMode, swizzle_, pitch, bpp, slice, sample,
+                        <u8 *>dataBuf.buf, dataBuf.len, <u8 *>PyBytes_AS_STRING(result), dataBuf.len,
+                        swizzle, threads, remapPlan)
+
+            return result
+
+        PyObject_GetBuffer(out, &outBuf, PyBUF_SIMPLE | PyBUF_WRITABLE)
+        try:
+            swizzleSurf(width, height, depth, format_, aa, use, tileMode, swizzle_, pitch, bpp, slice, sample,
+                        <u8 *>dataBuf.buf, dataBuf.len, <u8 *>outBuf.buf, outBuf.len, swizzle, threads, remapPlan)
+
+        finally:
+            PyBuffer_Release(&outBuf)
+
+    finally:
+        PyBuffer_Release(&dataBuf)
+
+    return out
+
+
+cpdef object deswizzle(u32 width, u32 height, u32 depth, u32 format_, u32 aa, u32 use, u32 tileMode, u32 swizzle_,
+                       u32 pitch, u32 bpp, u32 slice, u32 sample, object data, int threads=1, object out=None,
+                       object remap=None):
+
+    """
+    data: any contiguous buffer (bytes, bytearray, memoryview, mmap, NumPy array...), it isn't copied
+    threads: number of threads to use (0 uses one per CPU)
+    out: writable buffer to write the result into and return, a new bytes object of the size of data if None.
+         The size of out is the size of the surface: data is truncated or zero-extended to it
+    remap: plan converting the elements while they're deswizzled (see swizzleSurf()), e.g. form_conv.getRemapPlan()
+    """
+
+    return swizzleBuffer(width, height, depth, format_, aa, use, tileMode, swizzle_, pitch, bpp,
+                         slice, sample, data, 0, threads, out, remap)
+
+
+cpdef object swizzle(u32 width, u32 height, u32 depth, u32 format_, u32 aa, u32 use, u32 tileMode, u32 swizzle_,
+                     u32 pitch, u32 bpp, u32 slice, u32 sample, object data, int threads=1, object out=None,
+                     object remap=None):
+
+    """
+    data: any contiguous buffer (bytes, bytearray, memoryview, mmap, NumPy array...), it isn't copied
+    threads: number of threads to use (0 uses one per CPU)
+    out: writable buffer to write the result into and return, a new bytes object of the size of data if None.
+         The size of out is the size of the surface: data is truncated or zero-extended to it
+    remap: plan converting the elements while they're swizzled (see swizzleSurf()), e.g. form_conv.getRemapPlan()
+    """
+
+    return swizzleBuffer(width, height, depth, format_, aa, use, tileMode, swizzle_, pitch, bpp,
+                         slice, sample, data, 1, threads, out, remap)
+
+
+cdef void regionCopy(u8 *data, u8 *out, u32 *addrs, u32 numElems, u32 bytesPerPixel, u32 dataSize) noexcept nogil:
+    cdef u32 i, pos, n
+
+    memset(out, 0, numElems * bytesPerPixel)
+
+    for i in range(numElems):
+        pos = addrs[i]
+        if pos + bytesPerPixel <= dataSize:
+            for n in range(bytesPerPixel):
+                out[i * bytesPerPixel + n] = data[pos + n]
+
+
+cpdef tuple getRegionInElements(u32 format_, int width, int height, int x, int y, int regionWidth, int regionHeight):
+    """
+    Convert a rectangle of the surface from pixels to elements,
+    expanding it to whole blocks for BCn formats.
+    Returns (x, y, regionWidth, regionHeight, surfHeight) in elements.
+    """
+
+    if regionWidth <= 0 or regionHeight <= 0 or x < 0 or y < 0 or x + regionWidth > width or y + regionHeight > height:
+        raise ValueError("Region (%d, %d, %d, %d) is outside of the %dx%d surface"
+                         % (x, y, regionWidth, regionHeight, width, height))
+
+    if format_ in BCn_formats:
+        return (x // 4, y // 4, (x + regionWidth + 3) // 4 - x // 4,
+                (y + regionHeight + 3) // 4 - y // 4, (height + 3) // 4)
+
+    return x, y, regionWidth, regionHeight, height
+
+
+cpdef object deswizzleRegion(u32 width, u32 height, u32 depth, u32 format_, u32 aa, u32 use, u32 tileMode, u32 swizzle_,
+                             u32 pitch, u32 bpp, u32 slice, u32 sample, object data, int x, int y,
+                             int regionWidth, int regionHeight, object out=None):
+
+    """
+    Deswizzle only the regionWidth x regionHeight rectangle at (x, y) of the surface,
+    computing the addresses of the micro tiles intersecting it only.
+    x, y, regionWidth and regionHeight are in pixels, for BCn formats the rectangle is expanded to whole blocks.
+    data: any contiguous buffer holding the whole swizzled surface, it isn't copied
+    out: writable buffer at least as large as the region to write the result into and return,
+         a new bytes object is returned if None
+    """
+
+    cdef:
+        u32 bytesPerPixel = bpp // 8
+        u32 surfHeight, resultSize
+        u32 *addrs
+        array.array addrMap
+        Py_buffer dataBuf
+        Py_buffer outBuf
+        object result
+
+    x, y, regionWidth, regionHeight, surfHeight = getRegionInElements(format_, width, height, x, y,
+                                                                     regionWidth, regionHeight)
+
+    resultSize = regionWidth * regionHeight * bytesPerPixel
+
+    addrMap = computeRegionAddrMap(x, y, regionWidth, regionHeight, surfHeight, depth, aa, use,
+                                   GX2TileModeToAddrTileMode(tileMode), (swizzle_ >> 8) & 1, (swizzle_ >> 9) & 3,
+                                   pitch, bpp, slice, sample)
+    addrs = addrMap.data.as_uints
+
+    PyObject_GetBuffer(data, &dataBuf, PyBUF_SIMPLE)
+    try:
+        if out is None:
+            result = PyBytes_FromStringAndSize(NULL, resultSize)
+            regionCopy(<u8 *>dataBuf.buf, <u8 *>PyBytes_AS_STRING(result), addrs, regionWidth * regionHeight,
+                       bytesPerPixel, dataBuf.len)
 
+            return result
 
-cpdef bytes deswizzle(u32 width, u32 height, u32 depth, u32 format_, u32 aa, u32 use, u32 tileMode, u32 swizzle_,
-                      u32 pitch, u32 bpp, u32 slice, u32 sample, bytes data):
+        PyObject_GetBuffer(out, &outBuf, PyBUF_SIMPLE | PyBUF_WRITABLE)
+        try:
+            if outBuf.len < resultSize:
+                raise ValueError("out is smaller than the region (%d < %d bytes)" % (outBuf.len, resultSize))
 
-    cdef array.array dataArr = array.array('B', data)
+            regionCopy(<u8 *>dataBuf.buf, <u8 *>outBuf.buf, addrs, regionWidth * regionHeight,
+                       bytesPerPixel, dataBuf.len)
 
-    return swizzleSurf(width, height, depth, format_, aa, use, tileMode, swizzle_, pitch, bpp,
-                       slice, sample, dataArr.data.as_uchars, len(data), 0)
+        finally:
+            PyBuffer_Release(&outBuf)
 
+    finally:
+        PyBuffer_Release(&dataBuf)
 
-cpdef bytes swizzle(u32 width, u32 height, u32 depth, u32 format_, u32 aa, u32 use, u32 tileMode, u32 swizzle_,
-                    u32 pitch, u32 bpp, u32 slice, u32 sample, bytes data):
+    return out
 
-    cdef array.array dataArr = array.array('B', data)
 
-    return swizzleSurf(width, height, depth, format_, aa, use, tileMode, swizzle_, pitch, bpp,
-                       slice, sample, dataArr.data.as_uchars, len(data), 1)
+def deswizzleBands(u32 width, u32 height, u32 depth, u32 format_, u32 aa, u32 use, u32 tileMode, u32 swizzle_,
+                   u32 pitch, u32 bpp, u32 slice, u32 sample, object data):
+
+    """
+    Generator deswizzling the surface one row band (a macro tile row) at a time,
+    yielding the linear data of each band as bytes.
+    Only the address map of the current band is kept in memory.
+    data: any contiguous buffer holding the whole swizzled surface, it isn't copied
+    """
+
+    cdef u32 y, bandHeight = computeBandHeight(GX2TileModeToAddrTileMode(tileMode))
+
+    if format_ in BCn_formats:
+        bandHeight *= 4
+
+    for y in range(0, height, bandHeight):
+        yield deswizzleRegion(width, height, depth, format_, aa, use, tileMode, swizzle_, pitch, bpp,
+                              slice, sample, data, 0, y, width, min(bandHeight, height - y))
 
 
 cdef u8 formatHwInfo[0x100]
@@ -486,12 +884,6 @@ cdef u64 computeSurfaceAddrFromCoordMacroTiled(u32 x, u32 y, u32 slice, u32 samp
     return bank << 9 | pipe << 8 | totalOffset & 255 | (totalOffset & -256) << 3
 
 
-cdef:
-    u32 expPitch = 0
-    u32 expHeight = 0
-    u32 expNumSlices = 0
-
-
 cdef class Flags:
     cdef u32 value
 
@@ -639,11 +1031,6 @@ def surfaceOutToPyClass(surfaceOut pSurfOut):
     return pypOut
 
 
-cdef:
-    surfaceIn pIn = surfaceIn()
-    surfaceOut pOut = surfaceOut()
-
-
 cdef u32 powTwoAlign(u32 x, u32 align):
     return ~(align - 1) & (x + align - 1)
 
@@ -666,7 +1053,7 @@ cdef (u32, u32, u32, u32) getBitsPerPixel(u32 format_):
             formatExInfo[fmtIdx + 2], formatExInfo[fmtIdx + 3])
 
 
-cdef u32 adjustSurfaceInfo(u32 elemMode, u32 expandX, u32 expandY, u32 bpp, u32 width, u32 height):
+cdef u32 adjustSurfaceInfo(surfaceIn pIn, u32 elemMode, u32 expandX, u32 expandY, u32 bpp, u32 width, u32 height):
     cdef:
         u32 bBCnFormat = 0
         u32 widtha, heighta
@@ -712,7 +1099,7 @@ cdef u32 adjustSurfaceInfo(u32 elemMode, u32 expandX, u32 expandY, u32 bpp, u32
     return 0
 
 
-cdef u32 hwlComputeMipLevel():
+cdef u32 hwlComputeMipLevel(surfaceIn pIn):
     cdef:
         u32 width, widtha
         u32 height, heighta
@@ -746,7 +1133,7 @@ cdef u32 hwlComputeMipLevel():
     return handled
 
 
-cdef void computeMipLevel():
+cdef void computeMipLevel(surfaceIn pIn):
     cdef:
         u32 slices = 0
         u32 height = 0
@@ -757,7 +1144,7 @@ cdef void computeMipLevel():
         pIn.width = powTwoAlign(pIn.width, 4)
         pIn.height = powTwoAlign(pIn.height, 4)
 
-    hwlHandled = hwlComputeMipLevel()
+    hwlHandled = hwlComputeMipLevel(pIn)
     if not hwlHandled and pIn.mipLevel and (pIn.flags.value >> 12) & 1:
         width = max(1, pIn.width >> pIn.mipLevel)
         height = max(1, pIn.height >> pIn.mipLevel)
@@ -910,11 +1297,8 @@ cdef u32 computeSurfaceMipLevelTileMode(u32 baseTileMode, u32 bpp, u32 level, u3
         1)
 
 
-cdef (u32, u32, u32) padDimensions(u32 tileMode, u32 padDims, u32 isCube, u32 pitchAlign, u32 heightAlign, u32 sliceAlign):
-    global expPitch
-    global expHeight
-    global expNumSlices
-
+cdef (u32, u32, u32) padDimensions(u32 expPitch, u32 expHeight, u32 expNumSlices, u32 tileMode, u32 padDims, u32 isCube,
+                                   u32 pitchAlign, u32 heightAlign, u32 sliceAlign):
     cdef u32 thickness = computeSurfaceThickness(tileMode)
     if not padDims:
         padDims = 3
@@ -973,16 +1357,12 @@ cdef (u32, u32, u32) computeSurfaceAlignmentsLinear(u32 tileMode, u32 bpp, Flags
     return baseAlign, pitchAlign, heightAlign
 
 
-cdef u32 computeSurfaceInfoLinear(u32 tileMode, u32 bpp, u32 numSamples, u32 pitch, u32 height, u32 numSlices, u32 mipLevel, u32 padDims, Flags flags):
-    global expPitch
-    global expHeight
-    global expNumSlices
-
-    expPitch = pitch
-    expHeight = height
-    expNumSlices = numSlices
-
+cdef u32 computeSurfaceInfoLinear(surfaceOut pOut, u32 tileMode, u32 bpp, u32 numSamples, u32 pitch, u32 height, u32 numSlices, u32 mipLevel, u32 padDims, Flags flags):
     cdef:
+        u32 expPitch = pitch
+        u32 expHeight = height
+        u32 expNumSlices = numSlices
+
         u32 valid = 1
         u32 microTileThickness = computeSurfaceThickness(tileMode)
 
@@ -1011,6 +1391,9 @@ cdef u32 computeSurfaceInfoLinear(u32 tileMode, u32 bpp, u32 numSamples, u32 pit
             expNumSlices = nextPow2(numSlices)
 
     expPitch, expHeight, expNumSlices = padDimensions(
+        expPitch,
+        expHeight,
+        expNumSlices,
         tileMode,
         padDims,
         (flags.value >> 4) & 1,
@@ -1049,16 +1432,12 @@ cdef (u32, u32, u32) computeSurfaceAlignmentsMicroTiled(u32 tileMode, u32 bpp, F
     return baseAlign, pitchAlign, heightAlign
 
 
-cdef u32 computeSurfaceInfoMicroTiled(u32 tileMode, u32 bpp, u32 numSamples, u32 pitch, u32 height, u32 numSlices, u32 mipLevel, u32 padDims, Flags flags):
-    global expPitch
-    global expHeight
-    global expNumSlices
-
-    expPitch = pitch
-    expHeight = height
-    expNumSlices = numSlices
-
+cdef u32 computeSurfaceInfoMicroTiled(surfaceOut pOut, u32 tileMode, u32 bpp, u32 numSamples, u32 pitch, u32 height, u32 numSlices, u32 mipLevel, u32 padDims, Flags flags):
     cdef:
+        u32 expPitch = pitch
+        u32 expHeight = height
+        u32 expNumSlices = numSlices
+
         u32 valid = 1
         u32 expTileMode = tileMode
         u32 microTileThickness = computeSurfaceThickness(tileMode)
@@ -1090,6 +1469,9 @@ cdef u32 computeSurfaceInfoMicroTiled(u32 tileMode, u32 bpp, u32 numSamples, u32
         numSamples)
 
     expPitch, expHeight, expNumSlices = padDimensions(
+        expPitch,
+        expHeight,
+        expNumSlices,
         expTileMode,
         padDims,
         (flags.value >> 4) & 1,
@@ -1149,16 +1531,12 @@ cdef (u32, u32, u32, u32, u32) computeSurfaceAlignmentsMacroTiled(u32 tileMode,
     return baseAlign, pitchAlign, heightAlign, macroTileWidth, macroTileHeight
 
 
-cdef u32 computeSurfaceInfoMacroTiled(u32 tileMode, u32 baseTileMode, u32 bpp, u32 numSamples, u32 pitch, u32 height, u32 numSlices, u32 mipLevel, u32 padDims, Flags flags):
-    global expPitch
-    global expHeight
-    global expNumSlices
-
-    expPitch = pitch
-    expHeight = height
-    expNumSlices = numSlices
-
+cdef u32 computeSurfaceInfoMacroTiled(surfaceOut pOut, u32 tileMode, u32 baseTileMode, u32 bpp, u32 numSamples, u32 pitch, u32 height, u32 numSlices, u32 mipLevel, u32 padDims, Flags flags):
     cdef:
+        u32 expPitch = pitch
+        u32 expHeight = height
+        u32 expNumSlices = numSlices
+
         u32 valid = 1
         u32 expTileMode = tileMode
         u32 microTileThickness = computeSurfaceThickness(tileMode)
@@ -1197,6 +1575,9 @@ cdef u32 computeSurfaceInfoMacroTiled(u32 tileMode, u32 baseTileMode, u32 bpp, u
             pitchAlign = bankSwappedWidth
 
         expPitch, expHeight, expNumSlices = padDimensions(
+            expPitch,
+            expHeight,
+            expNumSlices,
             tileMode,
             padDims,
             (flags.value >> 4) & 1,
@@ -1228,6 +1609,7 @@ cdef u32 computeSurfaceInfoMacroTiled(u32 tileMode, u32 baseTileMode, u32 bpp, u
             expTileMode = 2
 
             result = computeSurfaceInfoMicroTiled(
+                pOut,
                 2,
                 bpp,
                 numSamples,
@@ -1250,6 +1632,9 @@ cdef u32 computeSurfaceInfoMacroTiled(u32 tileMode, u32 baseTileMode, u32 bpp, u
                 pitchAlign = bankSwappedWidth
 
             expPitch, expHeight, expNumSlices = padDimensions(
+                expPitch,
+                expHeight,
+                expNumSlices,
                 tileMode,
                 padDims,
                 (flags.value >> 4) & 1,
@@ -1271,7 +1656,7 @@ cdef u32 computeSurfaceInfoMacroTiled(u32 tileMode, u32 baseTileMode, u32 bpp, u
     return result
 
 
-cdef u32 ComputeSurfaceInfoEx():
+cdef u32 ComputeSurfaceInfoEx(surfaceIn pIn, surfaceOut pOut):
     cdef:
         u32 tileMode = pIn.tileMode
         u32 bpp = pIn.bpp
@@ -1307,6 +1692,7 @@ cdef u32 ComputeSurfaceInfoEx():
 
     if tileMode in [0, 1]:
         valid = computeSurfaceInfoLinear(
+            pOut,
             tileMode,
             bpp,
             numSamples,
@@ -1321,6 +1707,7 @@ cdef u32 ComputeSurfaceInfoEx():
 
     elif tileMode in [2, 3]:
         valid = computeSurfaceInfoMicroTiled(
+            pOut,
             tileMode,
             bpp,
             numSamples,
@@ -1333,6 +1720,7 @@ cdef u32 ComputeSurfaceInfoEx():
 
     elif tileMode in [4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15]:
         valid = computeSurfaceInfoMacroTiled(
+            pOut,
             tileMode,
             baseTileMode,
             bpp,
@@ -1350,7 +1738,7 @@ cdef u32 ComputeSurfaceInfoEx():
     return 0
 
 
-cdef u32 restoreSurfaceInfo(u32 elemMode, u32 expandX, u32 expandY, u32 bpp):
+cdef u32 restoreSurfaceInfo(surfaceOut pOut, u32 elemMode, u32 expandX, u32 expandY, u32 bpp):
     cdef u32 width, height
 
     if pOut.pixelPitch and pOut.pixelHeight:
@@ -1387,13 +1775,7 @@ cdef u32 restoreSurfaceInfo(u32 elemMode, u32 expandX, u32 expandY, u32 bpp):
     return 0
 
 
-cdef void computeSurfaceInfo(surfaceIn aSurfIn, surfaceOut pSurfOut):
-    global pIn
-    global pOut
-
-    pIn = aSurfIn
-    pOut = pSurfOut
-
+cdef void computeSurfaceInfo(surfaceIn pIn, surfaceOut pOut):
     cdef:
         u32 returnCode = 0
         u32 elemMode = 0
@@ -1405,7 +1787,7 @@ cdef void computeSurfaceInfo(surfaceIn aSurfIn, surfaceOut pSurfOut):
         returnCode = 3
 
     if returnCode == 0:
-        computeMipLevel()
+        computeMipLevel(pIn)
 
         width = pIn.width
         height = pIn.height
@@ -1421,7 +1803,7 @@ cdef void computeSurfaceInfo(surfaceIn aSurfIn, surfaceOut pSurfOut):
             if elemMode == 4 and expandX == 3 and pIn.tileMode == 1:
                 pIn.flags.value |= 0x200
 
-            bpp = adjustSurfaceInfo(elemMode, expandX, expandY, bpp, width, height)
+            bpp = adjustSurfaceInfo(pIn, elemMode, expandX, expandY, bpp, width, height)
 
         elif pIn.bpp:
             pIn.width = max(1, pIn.width)
@@ -1431,7 +1813,7 @@ cdef void computeSurfaceInfo(surfaceIn aSurfIn, surfaceOut pSurfOut):
             returnCode = 3
 
         if returnCode == 0:
-            returnCode = ComputeSurfaceInfoEx()
+            returnCode = ComputeSurfaceInfoEx(pIn, pOut)
 
         if returnCode == 0:
             pOut.bpp = pIn.bpp
@@ -1439,7 +1821,7 @@ cdef void computeSurfaceInfo(surfaceIn aSurfIn, surfaceOut pSurfOut):
             pOut.pixelHeight = pOut.height
 
             if pIn.format and (not (pIn.flags.value >> 9) & 1 or not pIn.mipLevel):
-                bpp = restoreSurfaceInfo(elemMode, expandX, expandY, bpp)
+                bpp = restoreSurfaceInfo(pOut, elemMode, expandX, expandY, bpp)
 
             if (pIn.flags.value >> 5) & 1:
                 pOut.sliceSize = pOut.surfSize
@@ -1455,6 +1837,25 @@ cdef void computeSurfaceInfo(surfaceIn aSurfIn, surfaceOut pSurfOut):
             pOut.sliceTileMax = (pOut.height * pOut.pitch >> 6) - 1
 
 
+surfaceInfoCache = cache.LRUCache(4096)
+
+
+def getSurfaceInfoCacheStats():
+    return surfaceInfoCache.stats()
+
+
+def setSurfaceInfoCacheSize(maxSize):
+    """
+    maxSize: maximum number of cached surface infos (0 disables the cache)
+    """
+
+    surfaceInfoCache.resize(maxSize)
+
+
+def clearSurfaceInfoCache():
+    surfaceInfoCache.clear()
+
+
 def getSurfaceInfo(u32 surfaceFormat, u32 surfaceWidth, u32 surfaceHeight, u32 surfaceDepth, u32 surfaceDim, u32 surfaceTileMode, u32 surfaceAA, u32 level):
     """
     surfaceFormat: format of the surface (GX2SurfaceFormat)
@@ -1465,8 +1866,16 @@ def getSurfaceInfo(u32 surfaceFormat, u32 surfaceWidth, u32 surfaceHeight, u32 s
     surfaceTileMode: GX2TileMode (note: NOT AddrTileMode)
     surfaceAA: AA mode of the surface (GX2AAMode)
     level: mip level of which the info will be calculated for (first mipmap corresponds to value 1)
+
+    The result is memoized, and is an immutable SurfaceInfo shared between calls with the same arguments.
     """
 
+    key = (surfaceFormat, surfaceWidth, surfaceHeight, surfaceDepth, surfaceDim, surfaceTileMode, surfaceAA, level)
+
+    return surfaceInfoCache.get(key, cache.freezeSurfaceInfo, computeGX2SurfaceInfo, *key)
+
+
+def computeGX2SurfaceInfo(u32 surfaceFormat, u32 surfaceWidth, u32 surfaceHeight, u32 surfaceDepth, u32 surfaceDim, u32 surfaceTileMode, u32 surfaceAA, u32 level):
     cdef:
         u32 dim = 0
         u32 width = 0
@@ -1588,8 +1997,6 @@ def getSurfaceInfo(u32 surfaceFormat, u32 surfaceWidth, u32 surfaceHeight, u32 s
         pSurfOut.size = 96
         computeSurfaceInfo(aSurfIn, pSurfOut)
 
-        pSurfOut = pOut
-
     if not pSurfOut.tileMode:
         pSurfOut.tileMode = 16
 
@@ -0,0 +1,440 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# addrlib_np.py
+# A NumPy Address Library for Wii U textures.
+# Only the (un)swizzling is vectorized, everything else is taken from addrlib.py.
+
+
+################################################################
+################################################################
+
+import numpy as np
+
+from . import cache
+from .addrlib import (
+    BCn_formats, bankSwapOrder, GX2TileModeToAddrTileMode,
+    getDefaultGX2TileMode, surfaceGetBitsPerPixel, getSurfaceInfo,
+    getSurfaceInfoCacheStats, setSurfaceInfoCacheSize, clearSurfaceInfoCache,
+    computeSurfaceThickness, computePixelIndexWithinMicroTile,
+    computePipeFromCoordWoRotation, computeBankFromCoordWoRotation,
+    computeSurfaceRotationFromTileMode, isThickMacroTiled, isBankSwappedTileMode,
+    computeSurfaceBankSwappedWidth, computeSurfaceAddrFromCoordLinear,
+    computeSurfaceAddrFromCoordMicroTiled, computeMicroTileOffsets, canCopyMicroTiles,
+    getRegionInElements, computeBandHeight,
+)
+
+# computePixelIndexWithinMicroTile(), computePipeFromCoordWoRotation(),
+# computeBankFromCoordWoRotation(), computeSurfaceAddrFromCoordLinear() and
+# computeSurfaceAddrFromCoordMicroTiled() only use bitwise and integer
+# arithmetic on x and y, so they work element-wise on coordinate arrays as-is.
+
+elemTypes = {1: np.uint8, 2: np.uint16, 4: np.uint32, 8: np.uint64}
+
+
+def computeSurfaceAddrFromCoordMacroTiled(x, y, slice, sample, bpp, pitch, height,
+                                          numSamples, tileMode, isDepth,
+                                          pipeSwizzle, bankSwizzle):
+
+    """
+    Same as addrlib.computeSurfaceAddrFromCoordMacroTiled(),
+    but x and y are int64 arrays (broadcastable against each other).
+    """
+
+    microTileThickness = computeSurfaceThickness(tileMode)
+
+    microTileBits = numSamples * bpp * (microTileThickness * 64)
+    microTileBytes = (microTileBits + 7) // 8
+
+    pixelIndex = computePixelIndexWithinMicroTile(x, y, slice, bpp, tileMode, isDepth)
+    bytesPerSample = microTileBytes // numSamples
+
+    if isDepth:
+        sampleOffset = bpp * sample
+        pixelOffset = numSamples * bpp * pixelIndex
+
+    else:
+        sampleOffset = sample * (microTileBits // numSamples)
+        pixelOffset = bpp * pixelIndex
+
+    elemOffset = pixelOffset + sampleOffset
+
+    if numSamples <= 1 or microTileBytes <= 2048:
+        numSampleSplits = 1
+        sampleSlice = 0
+
+    else:
+        samplesPerSlice = 2048 // bytesPerSample
+        numSampleSplits = numSamples // samplesPerSlice
+        numSamples = samplesPerSlice
+
+        tileSliceBits = microTileBits // numSampleSplits
+        sampleSlice = elemOffset // tileSliceBits
+        elemOffset %= tileSliceBits
+
+    elemOffset = (elemOffset + 7) // 8
+
+    pipe = computePipeFromCoordWoRotation(x, y)
+    bank = computeBankFromCoordWoRotation(x, y)
+
+    swizzle_ = pipeSwizzle + 2 * bankSwizzle
+    bankPipe = pipe + 2 * bank
+    rotation = computeSurfaceRotationFromTileMode(tileMode)
+    sliceIn = slice
+
+    if isThickMacroTiled(tileMode):
+        sliceIn >>= 2
+
+    bankPipe ^= 2 * sampleSlice * 3 ^ (swizzle_ + sliceIn * rotation)
+    bankPipe %= 8
+    pipe = bankPipe % 2
+    bank = bankPipe // 2
+
+    sliceBytes = (height * pitch * microTileThickness * bpp * numSamples + 7) // 8
+    sliceOffset = sliceBytes * ((sampleSlice + numSampleSplits * slice) // microTileThickness)
+
+    macroTilePitch = 32
+    macroTileHeight = 16
+
+    if tileMode in [5, 9]:  # GX2_TILE_MODE_2D_TILED_THIN2 and GX2_TILE_MODE_2B_TILED_THIN2
+        macroTilePitch = 16
+        macroTileHeight = 32
+
+    elif tileMode in [6, 10]:  # GX2_TILE_MODE_2D_TILED_THIN4 and GX2_TILE_MODE_2B_TILED_THIN4
+        macroTilePitch = 8
+        macroTileHeight = 64
+
+    macroTilesPerRow = pitch // macroTilePitch
+    macroTileBytes = (numSamples * microTileThickness * bpp * macroTileHeight
+                      * macroTilePitch + 7) // 8
+    macroTileIndexX = x // macroTilePitch
+    macroTileIndexY = y // macroTileHeight
+    macroTileOffset = (macroTileIndexX + macroTilesPerRow * macroTileIndexY) * macroTileBytes
+
+    if isBankSwappedTileMode(tileMode):
+        bankSwapWidth = computeSurfaceBankSwappedWidth(tileMode, bpp, numSamples, pitch)
+        swapIndex = macroTilePitch * macroTileIndexX // bankSwapWidth
+        bank ^= np.take(np.array(bankSwapOrder, np.int64), swapIndex & 3)
+
+    totalOffset = elemOffset + ((macroTileOffset + sliceOffset) >> 3)
+    return bank << 9 | pipe << 8 | totalOffset & 255 | (totalOffset & -256) << 3
+
+
+addrMapCache = cache.AddrMapCache()
+
+
+def getAddrMapCacheStats():
+    return addrMapCache.stats()
+
+
+def setAddrMapCacheSize(maxSize):
+    """
+    maxSize: maximum total size of the cached address maps in bytes (0 disables the cache)
+    """
+
+    addrMapCache.resize(maxSize)
+
+
+def clearAddrMapCache():
+    addrMapCache.clear()
+
+
+def computeAddrMap(width, height, depth, aa, use, tileMode, pipeSwizzle, bankSwizzle,
+                   pitch, bitsPerPixel, slice, sample):
+
+    """
+    Compute the tiled offset of every element of the surface, in linear order.
+    width and height are in elements (blocks for BCn formats), tileMode is an AddrTileMode.
+    """
+
+    return computeRegionAddrMap(0, 0, width, height, height, depth, aa, use, tileMode, pipeSwizzle, bankSwizzle,
+                                pitch, bitsPerPixel, slice, sample)
+
+
+def computeRegionAddrMap(x, y, width, height, surfHeight, depth, aa, use, tileMode, pipeSwizzle, bankSwizzle,
+                         pitch, bitsPerPixel, slice, sample):
+
+    """
+    Compute the tiled offset of every element of the width x height rectangle at (x, y), in linear order.
+    Only the micro tiles intersecting the rectangle are visited.
+    x, y, width, height and surfHeight (the height of the surface) are in elements (blocks for BCn formats),
+    tileMode is an AddrTileMode.
+    """
+
+    bytesPerPixel = bitsPerPixel // 8
+    isDepth = bool(use & 4)
+
+    if tileMode in [0, 1]:
+        j, i = np.ogrid[y:y + height, x:x + width]
+        pos = computeSurfaceAddrFromCoordLinear(i.astype(np.int64), j.astype(np.int64), slice, sample,
+                                                bytesPerPixel, pitch, surfHeight, depth)
+
+    elif canCopyMicroTiles(tileMode, bitsPerPixel, aa, slice, sample):
+        # Compute the address once per micro tile,
+        # then add the offsets of the elements within the micro tile
+        offsets = np.array(computeMicroTileOffsets(tileMode, bitsPerPixel, slice, isDepth), np.int64).reshape(8, 8)
+
+        tileY, tileX = np.ogrid[y & ~7:y + height:8, x & ~7:x + width:8]
+        tileX = tileX.astype(np.int64)
+        tileY = tileY.astype(np.int64)
+
+        if tileMode in [2, 3]:
+            base = computeSurfaceAddrFromCoordMicroTiled(tileX, tileY, slice, bitsPerPixel, pitch, surfHeight,
+                                                         tileMode, isDepth)
+
+        else:
+            base = computeSurfaceAddrFromCoordMacroTiled(tileX, tileY, slice, sample, bitsPerPixel, pitch, surfHeight,
+                                                         1 << aa, tileMode, isDepth, pipeSwizzle, bankSwizzle)
+
+        tilesY, tilesX = len(tileY), tileX.shape[1]
+        base = np.broadcast_to(base, (tilesY, tilesX))
+
+        pos = base[:, None, :, None] + offsets[None, :, None, :]
+        pos = pos.reshape(tilesY * 8, tilesX * 8)[y & 7:(y & 7) + height, x & 7:(x & 7) + width]
+
+    else:
+        j, i = np.ogrid[y:y + height, x:x + width]
+        pos = computeSurfaceAddrFromCoordMacroTiled(i.astype(np.int64), j.astype(np.int64), slice, sample, bitsPerPixel,
+                                                    pitch, surfHeight, 1 << aa, tileMode, isDepth, pipeSwizzle, bankSwizzle)
+
+    return np.broadcast_to(pos, (height, width)).astype(np.uint32).ravel()
+
+
+def getAddrMap(width, height, depth, aa, use, tileMode, pipeSwizzle, bankSwizzle,
+               pitch, bitsPerPixel, slice, sample):
+
+    key = (width, height, depth, aa, use & 4, tileMode, pipeSwizzle, bankSwizzle,
+           pitch, bitsPerPixel, slice, sample)
+
+    return addrMapCache.get(key, computeAddrMap, *key)
+
+
+def remapElements(elements, remap):
+    fields, const = remap
+    result = np.full_like(elements, const)
+    for srcShift, mask, dstShift in fields:
+        result |= ((elements >> srcShift) & mask) << dstShift
+
+    return result
+
+
+def swizzleSurf(width, height, depth, format_, aa, use, tileMode, swizzle_,
+                pitch, bitsPerPixel, slice, sample, data, result, swizzle, remap=None):
+
+    """
+    width: width of the surface
+    height: height of the surface
+    depth: depth of the surface
+    format_: format of the surface (GX2SurfaceFormat)
+    aa: AA mode of the surface (GX2AAMode)
+    use: use of the surface (GX2SurfaceUse)
+    tileMode: tileMode of the surface (GX2TileMode)
+    swizzle_: swizzle of the surface (GX2Surface.swizzle)
+    pitch: aligned width of the surface (can be calculated using getSurfaceInfo())
+    bitsPerPixel: bits per element for the given format (use surfaceGetBitsPerPixel())
+    data: data to be (un)swizzled (uint8 array)
+    result: uint8 array where the (un)swizzled data will be written (data is read as zero-extended to its size)
+    swizzle: boolen where the data will be swizzled if true, otherwise unswizzled
+    remap: (fields, const) plan converting each 16 or 32 bits element, read as little endian, on the way:
+           const | ((element >> srcShift) & mask) << dstShift for every (srcShift, mask, dstShift) in fields
+    """
+
+    bytesPerPixel = bitsPerPixel // 8
+
+    if format_ in BCn_formats:
+        width = (width + 3) // 4
+        height = (height + 3) // 4
+
+    pipeSwizzle = (swizzle_ >> 8) & 1
+    bankSwizzle = (swizzle_ >> 9) & 3
+
+    tileMode = GX2TileModeToAddrTileMode(tileMode)
+
+    addrMap = getAddrMap(width, height, depth, aa, use, tileMode, pipeSwizzle, bankSwizzle,
+                         pitch, bitsPerPixel, slice, sample)
+
+    if swizzle == 0:
+        tiledSize, linearSize = len(data), len(result)
+
+    else:
+        linearSize, tiledSize = len(data), len(result)
+
+    if bytesPerPixel & (bytesPerPixel - 1):
+        # Elements that aren't a power of two in size (96bpp) can straddle
+        # the pipe/bank interleave, copy them byte by byte instead
+        src = data
+        dst = result
+
+        tiled = addrMap.astype(np.int64)[:, None] + np.arange(bytesPerPixel)
+        linear = np.arange(len(addrMap) * bytesPerPixel).reshape(-1, bytesPerPixel)
+        inside = (tiled[:, -1] < tiledSize) & (linear[:, -1] < linearSize)
+        linear = linear[inside]
+        tiled = tiled[inside]
+
+    else:
+        # Tiled offsets are a multiple of the element size,
+        # so the copy can be done on whole elements
+        if remap is None:
+            elemType = elemTypes.get(bytesPerPixel, np.dtype((np.void, bytesPerPixel)))
+
+        else:
+            elemType = np.dtype('<u%d' % bytesPerPixel)
+
+        src = data[:len(data) // bytesPerPixel * bytesPerPixel].view(elemType)
+        dst = result[:len(result) // bytesPerPixel * bytesPerPixel].view(elemType)
+
+        tiledElems = tiledSize // bytesPerPixel
+        linear = np.arange(min(len(addrMap), linearSize // bytesPerPixel))
+        tiled = addrMap[:len(linear)] // bytesPerPixel
+
+        if len(tiled) and tiled.max() >= tiledElems:
+            inside = tiled < tiledElems
+            linear = linear[inside]
+            tiled = tiled[inside]
+
+    if swizzle == 0:
+        elements = src[tiled]
+
+    else:
+        elements = src[linear]
+
+    if remap is not None:
+        elements = remapElements(elements, remap)
+
+    if swizzle == 0:
+        dst[linear] = elements
+
+    else:
+        dst[tiled] = elements
+
+
+def swizzleBuffer(width, height, depth, format_, aa, use, tileMode, swizzle_,
+                  pitch, bpp, slice, sample, data, swizzle, out, remap=None):
+
+    """
+    Run swizzleSurf() on uint8 views of data and out (any contiguous buffers),
+    allocating a new bytes object for the result if out is None.
+    """
+
+    if remap is not None and bpp not in [16, 32]:
+        raise ValueError("Elements can only be remapped for 16 and 32 bpp formats")
+
+    data = np.frombuffer(data, np.uint8)
+
+    if out is None:
+        result = np.zeros(len(data), np.uint8)
+        swizzleSurf(width, height, depth, format_, aa, use, tileMode, swizzle_, pitch, bpp,
+                    slice, sample, data, result, swizzle, remap)
+
+        return result.tobytes()
+
+    result = np.frombuffer(out, np.uint8)
+    if not result.flags.writeable:
+        raise BufferError("out is not writable")
+
+    result[:] = 0
+
+    swizzleSurf(width, height, depth, format_, aa, use, tileMode, swizzle_, pitch, bpp,
+                slice, sample, data, result, swizzle, remap)
+
+    return out
+
+
+def deswizzle(width, height, depth, format_, aa, use, tileMode, swizzle_,
+              pitch, bpp, slice, sample, data, threads=1, out=None, remap=None):
+
+    """
+    data: any contiguous buffer (bytes, bytearray, memoryview, mmap, NumPy array...), it isn't copied
+    threads: ignored, only the Cython backend is multithreaded
+    out: writable buffer to write the result into and return, a new bytes object of the size of data if None.
+         The size of out is the size of the surface: data is truncated or zero-extended to it
+    remap: plan converting the elements while they're deswizzled (see swizzleSurf()), e.g. form_conv.getRemapPlan()
+    """
+
+    return swizzleBuffer(width, height, depth, format_, aa, use, tileMode, swizzle_, pitch, bpp,
+                         slice, sample, data, False, out, remap)
+
+
+def swizzle(width, height, depth, format_, aa, use, tileMode, swizzle_,
+            pitch, bpp, slice, sample, data, threads=1, out=None, remap=None):
+
+    """
+    data: any contiguous buffer (bytes, bytearray, memoryview, mmap, NumPy array...), it isn't copied
+    threads: ignored, only the Cython backend is multithreaded
+    out: writable buffer to write the result into and return, a new bytes object of the size of data if None.
+         The size of out is the size of the surface: data is truncated or zero-extended to it
+    remap: plan converting the elements while they're swizzled (see swizzleSurf()), e.g. form_conv.getRemapPlan()
+    """
+
+    return swizzleBuffer(width, height, depth, format_, aa, use, tileMode, swizzle_, pitch, bpp,
+                         slice, sample, data, True, out, remap)
+
+
+def deswizzleRegion(width, height, depth, format_, aa, use, tileMode, swizzle_,
+                    pitch, bpp, slice, sample, data, x, y, regionWidth, regionHeight, out=None):
+
+    """
+    Deswizzle only the regionWidth x regionHeight rectangle at (x, y) of the surface,
+    computing the addresses of the micro tiles intersecting it only.
+    x, y, regionWidth and regionHeight are in pixels, for BCn formats the rectangle is expanded to whole blocks.
+    data: any contiguous buffer holding the whole swizzled surface, it isn't copied
+    out: writable buffer at least as large as the region to write the result into and return,
+         a new bytes object is returned if None
+    """
+
+    bytesPerPixel = bpp // 8
+    x, y, regionWidth, regionHeight, surfHeight = getRegionInElements(format_, width, height, x, y,
+                                                                     regionWidth, regionHeight)
+
+    data = np.frombuffer(data, np.uint8)
+    resultSize = regionWidth * regionHeight * bytesPerPixel
+
+    if out is None:
+        result = np.zeros(resultSize, np.uint8)
+
+    else:
+        result = np.frombuffer(out, np.uint8)
+        if not result.flags.writeable:
+            raise BufferError("out is not writable")
+
+        if len(result) < resultSize:
+            raise ValueError("out is smaller than the region (%d < %d bytes)" % (len(result), resultSize))
+
+        result = result[:resultSize]
+        result[:] = 0
+
+    pipeSwizzle = (swizzle_ >> 8) & 1
+    bankSwizzle = (swizzle_ >> 9) & 3
+
+    addrMap = computeRegionAddrMap(x, y, regionWidth, regionHeight, surfHeight, depth, aa, use,
+                                   GX2TileModeToAddrTileMode(tileMode), pipeSwizzle, bankSwizzle,
+                                   pitch, bpp, slice, sample)
+
+    tiled = addrMap.astype(np.int64)[:, None] + np.arange(bytesPerPixel)
+    inside = tiled[:, -1] < len(data)
+
+    result.reshape(-1, bytesPerPixel)[inside] = data[tiled[inside]]
+
+    if out is None:
+        return result.tobytes()
+
+    return out
+
+
+def deswizzleBands(width, height, depth, format_, aa, use, tileMode, swizzle_,
+                   pitch, bpp, slice, sample, data):
+
+    """
+    Generator deswizzling the surface one row band (a macro tile row) at a time,
+    yielding the linear data of each band as bytes.
+    Only the address map of the current band is kept in memory.
+    data: any contiguous buffer holding the whole swizzled surface, it isn't copied
+    """
+
+    bandHeight = computeBandHeight(GX2TileModeToAddrTileMode(tileMode))
+    if format_ in BCn_formats:
+        bandHeight *= 4
+
+    for y in range(0, height, bandHeight):
+        yield deswizzleRegion(width, height, depth, format_, aa, use, tileMode, swizzle_, pitch, bpp,
+                              slice, sample, data, 0, y, width, min(bandHeight, height - y))
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# cache.py
+# Bounded caches shared by the Address Library backends.
+
+
+################################################################
+################################################################
+
+import threading
+from collections import OrderedDict, namedtuple
+
+
+class LRUCache:
+    """
+    LRU cache bounded by the total size of its values (each value counts as 1 by default).
+    """
+
+    def __init__(self, maxSize):
+        self.maxSize = maxSize
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._values = OrderedDict()
+        self._lock = threading.Lock()
+
+    def sizeOf(self, value):
+        return 1
+
+    def get(self, key, build, *args):
+        """
+        key: hashable key of the value
+        build: function called with args to build the value on a miss
+        """
+
+        with self._lock:
+            value = self._values.get(key)
+            if value is not None:
+                self._values.move_to_end(key)
+                self.hits += 1
+                return value
+
+            self.misses += 1
+
+        value = build(*args)
+        valueSize = self.sizeOf(value)
+
+        with self._lock:
+            if valueSize <= self.maxSize and key not in self._values:
+                self._values[key] = value
+                self.size += valueSize
+                self._evict()
+
+        return value
+
+    def _evict(self):
+        while self.size > self.maxSize:
+            _, value = self._values.popitem(last=False)
+            self.size -= self.sizeOf(value)
+            self.evictions += 1
+
+    def resize(self, maxSize):
+        with self._lock:
+            self.maxSize = maxSize
+            self._evict()
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+            self.size = 0
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self._values),
+                'size': self.size,
+                'maxSize': self.maxSize,
+            }
+
+
+class AddrMapCache(LRUCache):
+    """
+    LRU cache of address maps (linear element index -> tiled byte offset),
+    bounded by the total size of the cached maps in bytes.
+    """
+
+    def __init__(self, maxSize=64 * 1024 * 1024):
+        super().__init__(maxSize)
+
+    def sizeOf(self, addrMap):
+        return memoryview(addrMap).nbytes
+
+
+TileInfo = namedtuple('TileInfo', [
+    'banks', 'bankWidth', 'bankHeight', 'macroAspectRatio', 'tileSplitBytes', 'pipeConfig',
+])
+
+SurfaceInfo = namedtuple('SurfaceInfo', [
+    'size', 'pitch', 'height', 'depth', 'surfSize', 'tileMode', 'baseAlign', 'pitchAlign',
+    'heightAlign', 'depthAlign', 'bpp', 'pixelPitch', 'pixelHeight', 'pixelBits', 'sliceSize',
+    'pitchTileMax', 'heightTileMax', 'sliceTileMax', 'pTileInfo', 'tileType', 'tileIndex',
+])
+
+
+def freezeSurfaceInfo(getSurfaceInfo, *args):
+    """
+    Call getSurfaceInfo with args and return its result as an immutable SurfaceInfo,
+    so that it can be shared between callers.
+    """
+
+    pSurfOut = getSurfaceInfo(*args)
+
+    fields = {field: getattr(pSurfOut, field) for field in SurfaceInfo._fields}
+    fields['pTileInfo'] = TileInfo(*(getattr(pSurfOut.pTileInfo, field) for field in TileInfo._fields))
+
+    return SurfaceInfo(**fields)
@@ -0,0 +1,888 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright © 2016-2018 AboodXD
+
+# Decoders of the BC1-BC5 and ETC1 block formats to RGBA8, and encoders of RGBA8 to BC1, BC3, BC4, BC5 and ETC1,
+# one 4x4 block at a time.
+
+################################################################
+################################################################
+
+from cpython.bytes cimport PyBytes_FromStringAndSize, PyBytes_AS_STRING
+cimport cython
+from cython.parallel cimport prange
+from libc.math cimport INFINITY, fabs
+import os
+
+
+ctypedef unsigned char u8
+ctypedef unsigned short u16
+ctypedef unsigned int u32
+ctypedef unsigned long long u64
+
+cdef enum BlockFormat:
+    FORMAT_BC1
+    FORMAT_BC2
+    FORMAT_BC3
+    FORMAT_BC4U
+    FORMAT_BC4S
+    FORMAT_BC5U
+    FORMAT_BC5S
+    FORMAT_ETC1
+
+blockSizes = {
+    "BC1": 8, "BC2": 16, "BC3": 16,
+    "BC4U": 8, "BC4S": 8, "BC5U": 16, "BC5S": 16,
+    "ETC1": 8,
+}
+
+cdef dict blockFormats = {
+    "BC1": FORMAT_BC1, "BC2": FORMAT_BC2, "BC3": FORMAT_BC3,
+    "BC4U": FORMAT_BC4U, "BC4S": FORMAT_BC4S, "BC5U": FORMAT_BC5U, "BC5S": FORMAT_BC5S,
+    "ETC1": FORMAT_ETC1,
+}
+
+encodeFormats = ("BC1", "BC3", "BC4U", "BC5U", "ETC1")
+
+cdef int etc1Modifiers[8][2]
+etc1Modifiers[:] = [[2, 8], [5, 17], [9, 29], [13, 42], [18, 60], [24, 80], [33, 106], [47, 183]]
+
+
+cdef inline u32 readU16(const u8 *data) noexcept nogil:
+    return data[0] | (data[1] << 8)
+
+
+cdef inline u32 readU32(const u8 *data) noexcept nogil:
+    return data[0] | (data[1] << 8) | (data[2] << 16) | (<u32>data[3] << 24)
+
+
+cdef inline u32 readU32BE(const u8 *data) noexcept nogil:
+    return (<u32>data[0] << 24) | (data[1] << 16) | (data[2] << 8) | data[3]
+
+
+cdef inline int clamp(int value) noexcept nogil:
+    return 0 if value < 0 else (255 if value > 255 else value)
+
+
+@cython.cdivision(True)
+cdef inline int floorDiv(int value, int divisor) noexcept nogil:
+    # Round towards minus infinity like Python and NumPy, for the signed formats
+    if value < 0:
+        return -((divisor - 1 - value) // divisor)
+
+    return value // divisor
+
+
+@cython.cdivision(True)
+cdef void colorPalette(u32 color0, u32 color1, bint punchThrough, int palette[4][4]) noexcept nogil:
+    """
+    Compute the RGBA colors of a BC1 color block from its RGB565 endpoints.
+    punchThrough: whether color0 <= color1 selects the 3 colors + transparent black mode (BC1 only)
+    """
+
+    cdef:
+        u32 colors[2]
+        u32 color
+        int i, c
+
+    colors[0] = color0
+    colors[1] = color1
+
+    for i in range(2):
+        color = colors[i]
+        palette[i][0] = ((color >> 11) << 3) | (color >> 13)
+        palette[i][1] = (((color >> 5) & 0x3F) << 2) | ((color >> 9) & 3)
+        palette[i][2] = ((color & 0x1F) << 3) | ((color >> 2) & 7)
+        palette[i][3] = 255
+
+    if color0 > color1 or not punchThrough:
+        for c in range(4):
+            palette[2][c] = (2 * palette[0][c] + palette[1][c]) // 3
+            palette[3][c] = (palette[0][c] + 2 * palette[1][c]) // 3
+
+    else:
+        for c in range(4):
+            palette[2][c] = (palette[0][c] + palette[1][c]) // 2
+            palette[3][c] = 0
+
+
+cdef void decodeColorBlock(const u8 *block, u8 *pixels, bint punchThrough) noexcept nogil:
+    """
+    Decode a BC1 color block to 16 RGBA pixels.
+    punchThrough: whether c0 <= c1 selects the 3 colors + transparent black mode (BC1 only)
+    """
+
+    cdef:
+        u32 indices = readU32(block + 4)
+        int palette[4][4]
+        int i, c
+
+    colorPalette(readU16(block), readU16(block + 2), punchThrough, palette)
+
+    for i in range(16):
+        for c in range(4):
+            pixels[i * 4 + c] = palette[(indices >> (2 * i)) & 3][c]
+
+
+cdef void alphaPalette(int a0, int a1, bint signed, int palette[8]) noexcept nogil:
+    """
+    Compute the values of a BC3 alpha / BC4 block from its endpoints.
+    signed: whether the endpoints are signed (BC4S, BC5S)
+    """
+
+    cdef int i
+
+    if signed:
+        palette[6], palette[7] = -127, 127
+
+    else:
+        palette[6], palette[7] = 0, 255
+
+    palette[0] = a0
+    palette[1] = a1
+
+    if a0 > a1:
+        for i in range(1, 7):
+            palette[i + 1] = floorDiv((7 - i) * a0 + i * a1, 7)
+
+    else:
+        for i in range(1, 5):
+            palette[i + 1] = floorDiv((5 - i) * a0 + i * a1, 5)
+
+
+cdef void decodeAlphaBlock(const u8 *block, u8 *pixels, bint signed) noexcept nogil:
+    """
+    Decode a BC3 alpha / BC4 block to the component of 16 RGBA pixels pixels points to.
+    signed: whether the endpoints are signed (BC4S, BC5S), the values are then converted to unsigned
+    """
+
+    cdef:
+        int i
+        int palette[8]
+        u64 indices = 0
+
+    if signed:
+        alphaPalette(<signed char>block[0], <signed char>block[1], True, palette)
+
+        for i in range(8):
+            palette[i] = floorDiv(((palette[i] if palette[i] > -127 else -127) + 127) * 255 + 127, 254)
+
+    else:
+        alphaPalette(block[0], block[1], False, palette)
+
+    for i in range(6):
+        indices |= <u64>block[2 + i] << (8 * i)
+
+    for i in range(16):
+        pixels[i * 4] = palette[(indices >> (3 * i)) & 7]
+
+
+cdef void decodeETC1Block(const u8 *block, u8 *pixels) noexcept nogil:
+    """
+    Decode an ETC1 block to 16 RGBA pixels.
+    """
+
+    cdef:
+        u32 high = readU32BE(block), low = readU32BE(block + 4)
+        bint flip = high & 1
+        int bases[2][3]
+        int tables[2]
+        int channel, shift, base, delta, x, y, bit, index, modifier, subblock
+
+    for channel in range(3):
+        shift = 24 - 8 * channel
+
+        if high & 2:
+            # Differential mode: a 5 bits color and a signed 3 bits delta
+            base = (high >> (shift + 3)) & 0x1F
+            delta = (high >> shift) & 7
+            if delta >= 4:
+                delta -= 8
+
+            bases[0][channel] = (base << 3) | (base >> 2)
+            base = (base + delta) & 0x1F
+            bases[1][channel] = (base << 3) | (base >> 2)
+
+        else:
+            # Individual mode: two 4 bits colors
+            bases[0][channel] = ((high >> (shift + 4)) & 0xF) * 17
+            bases[1][channel] = ((high >> shift) & 0xF) * 17
+
+    tables[0] = (high >> 5) & 7
+    tables[1] = (high >> 2) & 7
+
+    for y in range(4):
+        for x in range(4):
+            bit = x * 4 + y
+            index = (((low >> (bit + 16)) & 1) << 1) | ((low >> bit) & 1)
+            subblock = (y >= 2) if flip else (x >= 2)
+
+            modifier = etc1Modifiers[tables[subblock]][index & 1]
+            if index & 2:
+                modifier = -modifier
+
+            for channel in range(3):
+                pixels[(y * 4 + x) * 4 + channel] = clamp(bases[subblock][channel] + modifier)
+
+            pixels[(y * 4 + x) * 4 + 3] = 255
+
+
+@cython.cdivision(True)
+cdef void decodeBlock(BlockFormat format_, const u8 *block, u8 *pixels) noexcept nogil:
+    """
+    Decode a block of format_ to 16 RGBA pixels.
+    """
+
+    cdef int i
+
+    if format_ == FORMAT_BC1:
+        decodeColorBlock(block, pixels, True)
+
+    elif format_ == FORMAT_ETC1:
+        decodeETC1Block(block, pixels)
+
+    elif format_ == FORMAT_BC2:
+        decodeColorBlock(block + 8, pixels, False)
+        for i in range(16):
+            pixels[i * 4 + 3] = ((block[i // 2] >> (4 * (i & 1))) & 0xF) * 17
+
+    elif format_ == FORMAT_BC3:
+        decodeColorBlock(block + 8, pixels, False)
+        decodeAlphaBlock(block, pixels + 3, False)
+
+    else:
+        for i in range(16):
+            pixels[i * 4 + 1] = 0
+            pixels[i * 4 + 2] = 0
+            pixels[i * 4 + 3] = 255
+
+        decodeAlphaBlock(block, pixels, format_ in (FORMAT_BC4S, FORMAT_BC5S))
+        if format_ in (FORMAT_BC5U, FORMAT_BC5S):
+            decodeAlphaBlock(block + 8, pixels + 1, format_ == FORMAT_BC5S)
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef void decodeRow(BlockFormat format_, const u8 *blocks, u8 *out, u32 blockSize, u32 width, u32 height,
+                    u32 blocksWidth, u32 by) noexcept nogil:
+    """
+    Decode the row of blocks by, writing the pixels inside the image to out.
+    """
+
+    cdef:
+        u8 pixels[64]
+        u32 bx, x, y, rowWidth
+
+    for bx in range(blocksWidth):
+        decodeBlock(format_, blocks + (by * blocksWidth + bx) * blockSize, pixels)
+
+        rowWidth = min(4, width - bx * 4)
+        for y in range(min(4, height - by * 4)):
+            for x in range(rowWidth * 4):
+                out[((by * 4 + y) * width + bx * 4) * 4 + x] = pixels[y * 16 + x]
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def decode(format_, data, u32 width, u32 height, int threads=1):
+    """
+    Decode the deswizzled blocks of a BC1-BC5 or ETC1 texture to RGBA8.
+    format_: "BC1", "BC2", "BC3", "BC4U", "BC4S", "BC5U", "BC5S" or "ETC1" (as returned by get_dds_format())
+    data: any contiguous buffer holding the blocks, row by row
+    threads: number of threads the rows of blocks are split across (0 uses one per CPU)
+    Returns the width * height * 4 bytes of the RGBA8 image.
+    BC4 and BC5 are decoded to the R (and G) channels, with B = 0 and A = 255.
+    """
+
+    cdef:
+        const u8[::1] blocks
+        BlockFormat blockFormat
+        u32 blockSize, blocksWidth, blocksHeight
+        bytes result
+        u8 *out
+        int by
+
+    if format_ not in blockFormats:
+        raise ValueError("Unsupported block format: " + str(format_))
+
+    if threads <= 0:
+        threads = os.cpu_count() or 1
+
+    blockFormat = blockFormats[format_]
+    blockSize = blockSizes[format_]
+    blocksWidth = (width + 3) // 4
+    blocksHeight = (height + 3) // 4
+
+    blocks = memoryview(data).cast('B')
+    if blocks.shape[0] < <size_t>blocksWidth * blocksHeight * blockSize:
+        raise ValueError("Not enough data for a %dx%d %s texture" % (width, height, format_))
+
+    result = PyBytes_FromStringAndSize(NULL, <Py_ssize_t>width * height * 4)
+    out = <u8 *>PyBytes_AS_STRING(result)
+
+    if blocksWidth * blocksHeight == 0:
+        return result
+
+    with nogil:
+        if threads > 1 and blocksHeight > 1:
+            for by in prange(<int>blocksHeight, num_threads=threads, schedule='static'):
+                decodeRow(blockFormat, &blocks[0], out, blockSize, width, height, blocksWidth, by)
+
+        else:
+            for by in range(<int>blocksHeight):
+                decodeRow(blockFormat, &blocks[0], out, blockSize, width, height, blocksWidth, by)
+
+    return result
+
+
+def decodeBC1(data, width, height, threads=1):
+    return decode("BC1", data, width, height, threads)
+
+
+def decodeBC2(data, width, height, threads=1):
+    return decode("BC2", data, width, height, threads)
+
+
+def decodeBC3(data, width, height, threads=1):
+    return decode("BC3", data, width, height, threads)
+
+
+def decodeBC4(data, width, height, snorm=False, threads=1):
+    return decode("BC4S" if snorm else "BC4U", data, width, height, threads)
+
+
+def decodeBC5(data, width, height, snorm=False, threads=1):
+    return decode("BC5S" if snorm else "BC5U", data, width, height, threads)
+
+
+def decodeETC1(data, width, height, threads=1):
+    return decode("ETC1", data, width, height, threads)
+
+
+@cython.cdivision(True)
+cdef inline u32 quantize565(const int color[3]) noexcept nogil:
+    # Round a RGB8 color to RGB565
+    return ((color[0] * 31 + 127) // 255) << 11 | ((color[1] * 63 + 127) // 255) << 5 | (color[2] * 31 + 127) // 255
+
+
+cdef void rangeFit(const int pixels[64], const bint opaque[16], int high[3], int low[3]) noexcept nogil:
+    """
+    Find the endpoints of a BC1 color block with a range fit: take the principal axis of the colors of the block,
+    then the colors whose projections on it are the furthest apart.
+    Mirrors bcn_np.rangeFit() operation for operation, so that both give the same endpoints.
+    """
+
+    cdef:
+        long long count = 0
+        long long sums[3]
+        long long covariance[3][3]
+        double axis[3]
+        double newAxis[3]
+        double norm, projection, highest = -INFINITY, lowest = INFINITY
+        int i, j, p, largest = 0, highPixel = 0, lowPixel = 0
+
+    for i in range(3):
+        sums[i] = 0
+        for j in range(3):
+            covariance[i][j] = 0
+
+    for p in range(16):
+        if opaque[p]:
+            count += 1
+            for i in range(3):
+                sums[i] += pixels[p * 4 + i]
+                for j in range(3):
+                    covariance[i][j] += pixels[p * 4 + i] * pixels[p * 4 + j]
+
+    # Covariance matrix times count ** 2, in integers so that it is exact
+    for i in range(3):
+        for j in range(3):
+            covariance[i][j] = count * covariance[i][j] - sums[i] * sums[j]
+
+    # Principal axis, by power iteration starting from the column of the largest variance
+    for i in range(1, 3):
+        if covariance[i][i] > covariance[largest][largest]:
+            largest = i
+
+    for i in range(3):
+        axis[i] = <double>covariance[i][largest]
+
+    for _ in range(4):
+        for i in range(3):
+            newAxis[i] = (<double>covariance[i][0] * axis[0]
+                          + <double>covariance[i][1] * axis[1]
+                          + <double>covariance[i][2] * axis[2])
+
+        norm = max(max(fabs(newAxis[0]), fabs(newAxis[1])), fabs(newAxis[2]))
+        for i in range(3):
+            axis[i] = newAxis[i] / norm if norm > 0 else newAxis[i]
+
+    for p in range(16):
+        if opaque[p]:
+            projection = pixels[p * 4] * axis[0] + pixels[p * 4 + 1] * axis[1] + pixels[p * 4 + 2] * axis[2]
+
+            if projection > highest:
+                highest = projection
+                highPixel = p
+
+            if projection < lowest:
+                lowest = projection
+                lowPixel = p
+
+    for i in range(3):
+        high[i] = pixels[highPixel * 4 + i]
+        low[i] = pixels[lowPixel * 4 + i]
+
+
+cdef void orderEndpoints(const int high[3], const int low[3], bint anyTransparent, u32 *color0,
+                         u32 *color1) noexcept nogil:
+    """
+    Round the endpoints of a BC1 color block to RGB565, ordering them for the mode the block needs,
+    see bcn_np.orderEndpoints().
+    """
+
+    color0[0] = quantize565(high)
+    color1[0] = quantize565(low)
+
+    if (color0[0] > color1[0]) if anyTransparent else (color0[0] < color1[0]):
+        color0[0], color1[0] = color1[0], color0[0]
+
+
+cdef int fitColorIndices(const int pixels[64], const bint opaque[16], u32 color0, u32 color1, bint punchThrough,
+                         int indices[16]) noexcept nogil:
+    """
+    Pick the closest color of the palette of a BC1 color block for each opaque pixel,
+    see bcn_np.fitColorIndices().
+    Returns the sum of the squared errors of the opaque pixels.
+    """
+
+    cdef:
+        bint threeColors = punchThrough and color0 <= color1
+        int palette[4][4]
+        int i, p, error, bestError, total = 0
+
+    colorPalette(color0, color1, punchThrough, palette)
+
+    for p in range(16):
+        if not opaque[p]:
+            indices[p] = 3
+            continue
+
+        indices[p] = 0
+        bestError = 0x7FFFFFFF
+        for i in range(3 if threeColors else 4):
+            error = ((pixels[p * 4] - palette[i][0]) ** 2 + (pixels[p * 4 + 1] - palette[i][1]) ** 2
+                     + (pixels[p * 4 + 2] - palette[i][2]) ** 2)
+
+            if error < bestError:
+                bestError = error
+                indices[p] = i
+
+        total += bestError
+
+    return total
+
+
+cdef void leastSquaresFit(const int pixels[64], const bint opaque[16], u32 color0, u32 color1,
+                          const int indices[16], bint punchThrough, int high[3], int low[3]) noexcept nogil:
+    """
+    Refit the endpoints of a BC1 color block to the indices of its pixels, see bcn_np.leastSquaresFit().
+    high and low are left as they are if the indices don't define a line.
+    """
+
+    cdef:
+        bint threeColors = punchThrough and color0 <= color1
+        int total = 2 if threeColors else 3
+        int weightTable[4]
+        int weight, other, a = 0, b = 0, c = 0, det
+        int r0[3]
+        int r1[3]
+        int i, p
+
+    if threeColors:
+        weightTable[:] = [2, 0, 1, 0]
+
+    else:
+        weightTable[:] = [3, 0, 2, 1]
+
+    for i in range(3):
+        r0[i] = r1[i] = 0
+
+    for p in range(16):
+        if opaque[p]:
+            weight = weightTable[indices[p]]
+            other = total - weight
+
+            a += weight * weight
+            b += weight * other
+            c += other * other
+
+            for i in range(3):
+                r0[i] += weight * pixels[p * 4 + i]
+                r1[i] += other * pixels[p * 4 + i]
+
+    det = a * c - b * b
+    if det <= 0:
+        return
+
+    # Round to the nearest integer
+    for i in range(3):
+        high[i] = clamp(floorDiv(2 * (c * r0[i] - b * r1[i]) * total + det, 2 * det))
+        low[i] = clamp(floorDiv(2 * (a * r1[i] - b * r0[i]) * total + det, 2 * det))
+
+
+cdef void encodeColorBlock(const int pixels[64], u8 *block, int quality, bint punchThrough) noexcept nogil:
+    """
+    Encode 16 RGBA pixels to a BC1 color block, see bcn_np.encodeColorBlocks().
+    """
+
+    cdef:
+        bint opaque[16]
+        bint anyTransparent = False, threeColors
+        int high[3]
+        int low[3]
+        int direction[3]
+        int palette[4][4]
+        int positionIndices[4]
+        int indices[16]
+        int newIndices[16]
+        u32 color0, color1, newColor0, newColor1, bits = 0
+        int i, p, step, dot, error, newError, steps = 0, length = 0
+
+    for p in range(16):
+        opaque[p] = not punchThrough or pixels[p * 4 + 3] >= 128
+        if not opaque[p]:
+            anyTransparent = True
+
+    for i in range(3):
+        high[i], low[i] = 0, 255
+
+    for p in range(16):
+        if opaque[p]:
+            for i in range(3):
+                high[i] = max(high[i], pixels[p * 4 + i])
+                low[i] = min(low[i], pixels[p * 4 + i])
+
+    orderEndpoints(high, low, anyTransparent, &color0, &color1)
+
+    if quality:
+        error = fitColorIndices(pixels, opaque, color0, color1, punchThrough, indices)
+
+        for step in range(3):
+            if step == 0:
+                rangeFit(pixels, opaque, high, low)
+
+            else:
+                leastSquaresFit(pixels, opaque, color0, color1, indices, punchThrough, high, low)
+
+            orderEndpoints(high, low, anyTransparent, &newColor0, &newColor1)
+            newError = fitColorIndices(pixels, opaque, newColor0, newColor1, punchThrough, newIndices)
+
+            if newError < error:
+                color0, color1, error = newColor0, newColor1, newError
+                for p in range(16):
+                    indices[p] = newIndices[p]
+
+    else:
+        colorPalette(color0, color1, punchThrough, palette)
+        threeColors = punchThrough and color0 <= color1
+
+        # Round the position of each color on the line between the endpoints
+        steps = 2 if threeColors else 3
+        for i in range(3):
+            direction[i] = palette[0][i] - palette[1][i]
+            length += direction[i] * direction[i]
+
+        if threeColors:
+            positionIndices[:] = [1, 2, 0, 0]
+
+        else:
+            positionIndices[:] = [1, 3, 2, 0]
+
+        for p in range(16):
+            if not opaque[p]:
+                indices[p] = 3
+
+            else:
+                dot = 0
+                for i in range(3):
+                    dot += (pixels[p * 4 + i] - palette[1][i]) * direction[i]
+
+                indices[p] = positionIndices[min(max(floorDiv(2 * steps * dot + length, max(2 * length, 1)), 0),
+                                                 steps)]
+
+    for p in range(16):
+        bits |= <u32>indices[p] << (2 * p)
+
+    for i in range(2):
+        block[i] = (color0 >> (8 * i)) & 0xFF
+        block[2 + i] = (color1 >> (8 * i)) & 0xFF
+
+    for i in range(4):
+        block[4 + i] = (bits >> (8 * i)) & 0xFF
+
+
+@cython.cdivision(True)
+cdef void encodeAlphaBlock(const int *values, u8 *block, int quality) noexcept nogil:
+    """
+    Encode the component of 16 RGBA pixels values points to to a BC3 alpha / BC4 block,
+    see bcn_np.encodeAlphaBlocks().
+    """
+
+    cdef:
+        int palette[8]
+        int positionIndices[8]
+        int a0 = 0, a1 = 255
+        int i, p, index, span, error, bestError
+        u64 indices = 0
+
+    positionIndices[:] = [1, 7, 6, 5, 4, 3, 2, 0]
+
+    for p in range(16):
+        a0 = max(a0, values[p * 4])
+        a1 = min(a1, values[p * 4])
+
+    alphaPalette(a0, a1, False, palette)
+    span = a0 - a1
+
+    for p in range(16):
+        if quality:
+            index = 0
+            bestError = 0x7FFFFFFF
+            for i in range(8):
+                error = abs(values[p * 4] - palette[i])
+                if error < bestError:
+                    bestError = error
+                    index = i
+
+        else:
+            index = positionIndices[((values[p * 4] - a1) * 14 + span) // max(2 * span, 1)]
+
+        indices |= <u64>index << (3 * p)
+
+    block[0] = a0
+    block[1] = a1
+    for i in range(6):
+        block[2 + i] = (indices >> (8 * i)) & 0xFF
+
+
+cdef int fitETC1Subblocks(const int pixels[64], const int bases[2][3], const int subblocks[16],
+                          int tables[2], int indices[16]) noexcept nogil:
+    """
+    Pick the modifier table of each sub-block of an ETC1 block, and the modifier of each pixel,
+    minimizing the squared error of the colors, see bcn_np.fitETC1Subblocks().
+    Returns the error of the block.
+    """
+
+    cdef:
+        int tableErrors[2][8]
+        int tableIndices[16][8]
+        int table, subblock, p, i, c, value, error, bestError, total = 0
+
+    for subblock in range(2):
+        for table in range(8):
+            tableErrors[subblock][table] = 0
+
+    for table in range(8):
+        for p in range(16):
+            bestError = 0x7FFFFFFF
+            for i in range(4):
+                error = 0
+                for c in range(3):
+                    value = clamp(bases[subblocks[p]][c] + (-1 if i & 2 else 1) * etc1Modifiers[table][i & 1])
+                    error += (value - pixels[p * 4 + c]) ** 2
+
+                if error < bestError:
+                    bestError = error
+                    tableIndices[p][table] = i
+
+            tableErrors[subblocks[p]][table] += bestError
+
+    for subblock in range(2):
+        tables[subblock] = 0
+        for table in range(1, 8):
+            if tableErrors[subblock][table] < tableErrors[subblock][tables[subblock]]:
+                tables[subblock] = table
+
+        total += tableErrors[subblock][tables[subblock]]
+
+    for p in range(16):
+        indices[p] = tableIndices[p][tables[subblocks[p]]]
+
+    return total
+
+
+@cython.cdivision(True)
+cdef void encodeETC1Block(const int pixels[64], u8 *block, int quality) noexcept nogil:
+    """
+    Encode 16 RGBA pixels to an ETC1 block, see bcn_np.encodeETC1Blocks().
+    """
+
+    cdef:
+        int subblocks[16]
+        int averages[2][3]
+        int colors5[2][3]
+        int colors4[2][3]
+        int delta[3]
+        int bases[2][3]
+        int tables[2]
+        int indices[16]
+        int flip, mode, diff, canDiff, subblock, c, p, x, y, bit, error, bestError = 0x7FFFFFFF
+        u32 high, low, bestHigh = 0, bestLow = 0
+
+    for flip in range(2 if quality else 1):
+        for p in range(16):
+            y, x = p // 4, p % 4
+            subblocks[p] = (y >= 2) if flip else (x >= 2)
+
+        for subblock in range(2):
+            for c in range(3):
+                averages[subblock][c] = 4
+
+        for p in range(16):
+            for c in range(3):
+                averages[subblocks[p]][c] += pixels[p * 4 + c]
+
+        canDiff = True
+        for c in range(3):
+            for subblock in range(2):
+                averages[subblock][c] //= 8
+                colors5[subblock][c] = (averages[subblock][c] * 31 + 127) // 255
+                colors4[subblock][c] = (averages[subblock][c] * 15 + 127) // 255
+
+            delta[c] = colors5[1][c] - colors5[0][c]
+            if not -4 <= delta[c] <= 3:
+                canDiff = False
+
+        for mode in range(2 if quality else 1):
+            # Same candidates as bcn_np: the differential mode when possible, then the individual one
+            diff = canDiff and mode == 0
+
+            for subblock in range(2):
+                for c in range(3):
+                    if diff:
+                        bases[subblock][c] = (colors5[subblock][c] << 3) | (colors5[subblock][c] >> 2)
+
+                    else:
+                        bases[subblock][c] = colors4[subblock][c] * 17
+
+            error = fitETC1Subblocks(pixels, bases, subblocks, tables, indices)
+
+            high = (2 if diff else 0) | flip | (tables[0] << 5) | (tables[1] << 2)
+            for c in range(3):
+                if diff:
+                    high |= (<u32>colors5[0][c] << (27 - 8 * c)) | (<u32>(delta[c] & 7) << (24 - 8 * c))
+
+                else:
+                    high |= (<u32>colors4[0][c] << (28 - 8 * c)) | (<u32>colors4[1][c] << (24 - 8 * c))
+
+            low = 0
+            for p in range(16):
+                bit = (p % 4) * 4 + p // 4
+                low |= (<u32>(indices[p] >> 1) << (bit + 16)) | (<u32>(indices[p] & 1) << bit)
+
+            if error < bestError:
+                bestError = error
+                bestHigh = high
+                bestLow = low
+
+    for c in range(4):
+        block[c] = (bestHigh >> (24 - 8 * c)) & 0xFF
+        block[4 + c] = (bestLow >> (24 - 8 * c)) & 0xFF
+
+
+cdef void encodeBlock(BlockFormat format_, const int pixels[64], u8 *block, int quality) noexcept nogil:
+    """
+    Encode 16 RGBA pixels to a block of format_.
+    """
+
+    if format_ == FORMAT_BC1:
+        encodeColorBlock(pixels, block, quality, True)
+
+    elif format_ == FORMAT_ETC1:
+        encodeETC1Block(pixels, block, quality)
+
+    elif format_ == FORMAT_BC3:
+        encodeAlphaBlock(pixels + 3, block, quality)
+        encodeColorBlock(pixels, block + 8, quality, False)
+
+    else:
+        encodeAlphaBlock(pixels, block, quality)
+        if format_ == FORMAT_BC5U:
+            encodeAlphaBlock(pixels + 1, block + 8, quality)
+
+
+cdef void encodeRow(BlockFormat format_, const u8 *image, u8 *blocks, u32 blockSize, u32 width, u32 height,
+                    u32 blocksWidth, u32 by, int quality) noexcept nogil:
+    """
+    Encode the row of blocks by, filling the partial blocks by repeating the last row and column of the image.
+    """
+
+    cdef:
+        int pixels[64]
+        u32 bx, x, y, c
+        const u8 *pixel
+
+    for bx in range(blocksWidth):
+        for y in range(4):
+            for x in range(4):
+                pixel = image + (min(by * 4 + y, height - 1) * width + min(bx * 4 + x, width - 1)) * 4
+                for c in range(4):
+                    pixels[(y * 4 + x) * 4 + c] = pixel[c]
+
+        encodeBlock(format_, pixels, blocks + (by * blocksWidth + bx) * blockSize, quality)
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def encode(format_, data, u32 width, u32 height, int quality=1, int threads=1):
+    """
+    Encode a RGBA8 image to BC1, BC3, BC4, BC5 or ETC1 blocks, ready to be swizzled.
+    format_: "BC1", "BC3", "BC4U", "BC5U" or "ETC1" (BC4 and BC5 encode the R and G channels)
+    data: any contiguous buffer holding the width * height * 4 bytes of the image
+    quality: 0 for the fast tier, 1 for the better but slower one (see bcn_np.encode())
+    threads: number of threads the rows of blocks are split across (0 uses one per CPU)
+    The pixels of BC1 blocks with an alpha < 128 are encoded as transparent black.
+    Returns the blocks, row by row (the same bytes as bcn_np.encode()).
+    """
+
+    cdef:
+        const u8[::1] image
+        BlockFormat blockFormat
+        u32 blockSize, blocksWidth, blocksHeight
+        bytes result
+        u8 *out
+        int by
+
+    if format_ not in encodeFormats:
+        raise ValueError("Unsupported block format for encoding: " + str(format_))
+
+    if threads <= 0:
+        threads = os.cpu_count() or 1
+
+    blockFormat = blockFormats[format_]
+    blockSize = blockSizes[format_]
+    blocksWidth = (width + 3) // 4
+    blocksHeight = (height + 3) // 4
+
+    image = memoryview(data).cast('B')
+    if image.shape[0] < <Py_ssize_t>width * height * 4:
+        raise ValueError("Not enough data for a %dx%d RGBA8 image" % (width, height))
+
+    result = PyBytes_FromStringAndSize(NULL, <Py_ssize_t>blocksWidth * blocksHeight * blockSize)
+    out = <u8 *>PyBytes_AS_STRING(result)
+
+    if blocksWidth * blocksHeight == 0:
+        return result
+
+    with nogil:
+        if threads > 1 and blocksHeight > 1:
+            for by in prange(<int>blocksHeight, num_threads=threads, schedule='static'):
+                encodeRow(blockFormat, &image[0], out, blockSize, width, height, blocksWidth, by, quality)
+
+        else:
+            for by in range(<int>blocksHeight):
+                encodeRow(blockFormat, &image[0], out, blockSize, width, height, blocksWidth, by, quality)
+
+    return result
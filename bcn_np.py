@@ -0,0 +1,663 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright © 2016-2018 AboodXD
+
+# Decoders of the BC1-BC5 and ETC1 block formats to RGBA8, and encoders of RGBA8 to BC1, BC3, BC4, BC5 and ETC1,
+# working on whole arrays of 4x4 blocks.
+
+################################################################
+################################################################
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+
+blockSizes = {
+    "BC1": 8, "BC2": 16, "BC3": 16,
+    "BC4U": 8, "BC4S": 8, "BC5U": 16, "BC5S": 16,
+    "ETC1": 8,
+}
+
+encodeFormats = ("BC1", "BC3", "BC4U", "BC5U", "ETC1")
+
+etc1Modifiers = np.array([
+    [2, 8, -2, -8],
+    [5, 17, -5, -17],
+    [9, 29, -9, -29],
+    [13, 42, -13, -42],
+    [18, 60, -18, -60],
+    [24, 80, -24, -80],
+    [33, 106, -33, -106],
+    [47, 183, -47, -183],
+], np.int32)
+
+
+def expand(value, width):
+    # Expand a bitfield to 8 bits by repeating its bits
+    value = value << (8 - width)
+    return value | (value >> width)
+
+
+def colorPalette(color0, color1, punchThrough):
+    """
+    color0, color1: (n,) arrays of the RGB565 endpoints of BC1 color blocks
+    punchThrough: whether color0 <= color1 selects the 3 colors + transparent black mode (BC1 only)
+    Returns the (n, 4, 4) array of the RGBA colors of the blocks.
+    """
+
+    palette = np.empty((len(color0), 4, 4), np.int32)
+
+    for i, color in enumerate((color0, color1)):
+        palette[:, i, 0] = expand(color >> 11, 5)
+        palette[:, i, 1] = expand((color >> 5) & 0x3F, 6)
+        palette[:, i, 2] = expand(color & 0x1F, 5)
+        palette[:, i, 3] = 255
+
+    c0 = palette[:, 0]
+    c1 = palette[:, 1]
+
+    fourColors = (color0 > color1)[:, None]
+    if not punchThrough:
+        fourColors[:] = True
+
+    palette[:, 2] = np.where(fourColors, (2 * c0 + c1) // 3, (c0 + c1) // 2)
+    palette[:, 3] = np.where(fourColors, (c0 + 2 * c1) // 3, 0)
+
+    return palette
+
+
+def decodeColorBlocks(blocks, punchThrough):
+    """
+    blocks: (n, 8) array of BC1 color blocks
+    punchThrough: whether c0 <= c1 selects the 3 colors + transparent black mode (BC1 only)
+    Returns a (n, 16, 4) array of RGBA pixels.
+    """
+
+    colors = blocks[:, :4].copy().view('<u2').astype(np.int32)
+    palette = colorPalette(colors[:, 0], colors[:, 1], punchThrough)
+
+    indices = blocks[:, 4:8].copy().view('<u4')
+    indices = (indices >> (2 * np.arange(16, dtype=np.uint32))) & 3
+
+    return palette[np.arange(len(blocks))[:, None], indices]
+
+
+def alphaPalette(a0, a1, signed=False):
+    """
+    a0, a1: (n,) arrays of the endpoints of BC3 alpha / BC4 blocks
+    signed: whether the endpoints are signed (BC4S, BC5S)
+    Returns the (n, 8) array of the values of the blocks.
+    """
+
+    minimum, maximum = (-127, 127) if signed else (0, 255)
+
+    a0 = a0[:, None]
+    a1 = a1[:, None]
+
+    palette = np.empty((len(a0), 8), np.int32)
+    palette[:, 0:1] = a0
+    palette[:, 1:2] = a1
+
+    eight = a0 > a1
+    for i in range(1, 7):
+        interpolated = ((7 - i) * a0 + i * a1) // 7
+        if i < 5:
+            palette[:, i + 1:i + 2] = np.where(eight, interpolated, ((5 - i) * a0 + i * a1) // 5)
+
+        else:
+            palette[:, i + 1:i + 2] = np.where(eight, interpolated, minimum if i == 5 else maximum)
+
+    return palette
+
+
+def decodeAlphaBlocks(blocks, signed=False):
+    """
+    blocks: (n, 8) array of BC3 alpha / BC4 blocks
+    signed: whether the endpoints are signed (BC4S, BC5S)
+    Returns a (n, 16) array of values (-128 to 127 if signed, else 0 to 255).
+    """
+
+    if signed:
+        endpoints = blocks[:, :2].view(np.int8).astype(np.int32)
+
+    else:
+        endpoints = blocks[:, :2].astype(np.int32)
+
+    palette = alphaPalette(endpoints[:, 0], endpoints[:, 1], signed)
+
+    indices = np.zeros((len(blocks), 8), np.uint8)
+    indices[:, :6] = blocks[:, 2:8]
+    indices = (indices.view('<u8') >> (3 * np.arange(16, dtype=np.uint64))) & 7
+
+    return palette[np.arange(len(blocks))[:, None], indices.astype(np.intp)]
+
+
+def snormToUnorm(values):
+    return ((np.maximum(values, -127) + 127) * 255 + 127) // 254
+
+
+def decodeETC1Blocks(blocks):
+    """
+    blocks: (n, 8) array of ETC1 blocks
+    Returns a (n, 16, 4) array of RGBA pixels.
+    """
+
+    high = blocks[:, :4].copy().view('>u4').astype(np.int64)[:, 0]
+    low = blocks[:, 4:].copy().view('>u4').astype(np.int64)[:, 0]
+
+    diff = (high >> 1) & 1
+    flip = high & 1
+
+    bases = np.empty((len(blocks), 2, 3), np.int32)
+    for channel, shift in enumerate([24, 16, 8]):
+        # Individual mode: two 4 bits colors
+        individual0 = ((high >> (shift + 4)) & 0xF) * 17
+        individual1 = ((high >> shift) & 0xF) * 17
+
+        # Differential mode: a 5 bits color and a signed 3 bits delta
+        base = (high >> (shift + 3)) & 0x1F
+        delta = (high >> shift) & 7
+        delta = np.where(delta >= 4, delta - 8, delta)
+
+        bases[:, 0, channel] = np.where(diff, expand(base, 5), individual0)
+        bases[:, 1, channel] = np.where(diff, expand((base + delta) & 0x1F, 5), individual1)
+
+    tables = np.stack([(high >> 5) & 7, (high >> 2) & 7], 1)
+
+    # Pixel i = y * 4 + x has the index bits number x * 4 + y
+    y, x = np.divmod(np.arange(16), 4)
+    bits = x * 4 + y
+    indices = (((low[:, None] >> (bits + 16)) & 1) << 1) | ((low[:, None] >> bits) & 1)
+
+    subblocks = np.where(flip[:, None], y >= 2, x >= 2).astype(np.intp)
+    rows = np.arange(len(blocks))[:, None]
+
+    modifiers = etc1Modifiers[tables[rows, subblocks], indices]
+
+    pixels = np.empty((len(blocks), 16, 4), np.int32)
+    pixels[:, :, :3] = np.clip(bases[rows, subblocks] + modifiers[:, :, None], 0, 255)
+    pixels[:, :, 3] = 255
+
+    return pixels
+
+
+def decodeBlocks(format_, blocks):
+    """
+    Decode a (n, blockSize) array of blocks of format_ to a (n, 16, 4) array of RGBA pixels.
+    """
+
+    n = len(blocks)
+
+    if format_ == "BC1":
+        return decodeColorBlocks(blocks, True)
+
+    elif format_ == "ETC1":
+        return decodeETC1Blocks(blocks)
+
+    pixels = np.zeros((n, 16, 4), np.int32)
+    pixels[:, :, 3] = 255
+
+    if format_ == "BC2":
+        pixels[:] = decodeColorBlocks(blocks[:, 8:], False)
+
+        alpha = blocks[:, :8].copy().view('<u8')
+        pixels[:, :, 3] = ((alpha >> (4 * np.arange(16, dtype=np.uint64))) & 0xF) * 17
+
+    elif format_ == "BC3":
+        pixels[:] = decodeColorBlocks(blocks[:, 8:], False)
+        pixels[:, :, 3] = decodeAlphaBlocks(blocks[:, :8])
+
+    else:
+        signed = format_.endswith("S")
+
+        for channel in range(2 if format_.startswith("BC5") else 1):
+            values = decodeAlphaBlocks(blocks[:, 8 * channel:8 * channel + 8], signed)
+            pixels[:, :, channel] = snormToUnorm(values) if signed else values
+
+    return pixels
+
+
+def processRows(func, blocksWidth, blocksHeight, threads):
+    """
+    Call func with slices covering the blocksHeight rows of blocks, across threads threads.
+    NumPy releases the GIL while working on the chunks, so they are processed in parallel.
+    """
+
+    chunk = max(1, 4096 // max(1, blocksWidth))
+    chunks = [slice(y, min(y + chunk, blocksHeight)) for y in range(0, blocksHeight, chunk)]
+
+    if threads > 1 and len(chunks) > 1:
+        with ThreadPoolExecutor(threads) as executor:
+            list(executor.map(func, chunks))
+
+    else:
+        for rows in chunks:
+            func(rows)
+
+
+def decode(format_, data, width, height, threads=1):
+    """
+    Decode the deswizzled blocks of a BC1-BC5 or ETC1 texture to RGBA8.
+    format_: "BC1", "BC2", "BC3", "BC4U", "BC4S", "BC5U", "BC5S" or "ETC1" (as returned by get_dds_format())
+    data: any contiguous buffer holding the blocks, row by row
+    threads: number of threads the rows of blocks are split across (0 uses one per CPU)
+    Returns the width * height * 4 bytes of the RGBA8 image.
+    BC4 and BC5 are decoded to the R (and G) channels, with B = 0 and A = 255.
+    """
+
+    if format_ not in blockSizes:
+        raise ValueError("Unsupported block format: " + str(format_))
+
+    if threads <= 0:
+        threads = os.cpu_count() or 1
+
+    blockSize = blockSizes[format_]
+    blocksWidth = (width + 3) // 4
+    blocksHeight = (height + 3) // 4
+
+    blocks = np.frombuffer(data, np.uint8)
+    if len(blocks) < blocksWidth * blocksHeight * blockSize:
+        raise ValueError("Not enough data for a %dx%d %s texture" % (width, height, format_))
+
+    if blocksWidth * blocksHeight == 0:
+        return b''
+
+    blocks = blocks[:blocksWidth * blocksHeight * blockSize].reshape(blocksHeight, blocksWidth, blockSize)
+    result = np.empty((blocksHeight * 4, blocksWidth * 4, 4), np.uint8)
+
+    def decodeRows(rows):
+        pixels = decodeBlocks(format_, blocks[rows].reshape(-1, blockSize))
+        pixels = pixels.reshape(-1, blocksWidth, 4, 4, 4).transpose(0, 2, 1, 3, 4)
+        result[rows.start * 4:rows.stop * 4] = pixels.reshape(-1, blocksWidth * 4, 4)
+
+    processRows(decodeRows, blocksWidth, blocksHeight, threads)
+
+    return result[:height, :width].tobytes()
+
+
+def decodeBC1(data, width, height, threads=1):
+    return decode("BC1", data, width, height, threads)
+
+
+def decodeBC2(data, width, height, threads=1):
+    return decode("BC2", data, width, height, threads)
+
+
+def decodeBC3(data, width, height, threads=1):
+    return decode("BC3", data, width, height, threads)
+
+
+def decodeBC4(data, width, height, snorm=False, threads=1):
+    return decode("BC4S" if snorm else "BC4U", data, width, height, threads)
+
+
+def decodeBC5(data, width, height, snorm=False, threads=1):
+    return decode("BC5S" if snorm else "BC5U", data, width, height, threads)
+
+
+def decodeETC1(data, width, height, threads=1):
+    return decode("ETC1", data, width, height, threads)
+
+
+def quantize565(colors):
+    # Round (n, 3) arrays of RGB8 colors to RGB565
+    return (((colors[:, 0] * 31 + 127) // 255) << 11
+            | ((colors[:, 1] * 63 + 127) // 255) << 5
+            | (colors[:, 2] * 31 + 127) // 255)
+
+
+def rangeFit(rgb, opaque):
+    """
+    Find the endpoints of BC1 color blocks with a range fit: take the principal axis of the colors of each block,
+    then the colors whose projections on it are the furthest apart.
+    rgb: (n, 16, 3) array of the colors of the pixels
+    opaque: (n, 16) array of the pixels to fit
+    Returns (high, low), (n, 3) arrays of the endpoints.
+    """
+
+    rows = np.arange(len(rgb))
+    colors = np.where(opaque[:, :, None], rgb, 0).astype(np.int64)
+    count = opaque.sum(1)
+    sums = colors.sum(1)
+
+    # Covariance matrices times count ** 2, in integers so that they are exact
+    covariance = (count[:, None, None] * np.einsum('npi,npj->nij', colors, colors)
+                  - sums[:, :, None] * sums[:, None, :])
+
+    # Principal axis, by power iteration starting from the column of the largest variance
+    largest = covariance[:, [0, 1, 2], [0, 1, 2]].argmax(1)
+    axis = covariance[rows, :, largest].astype(np.float64)
+
+    for _ in range(4):
+        axis = np.stack([covariance[:, i, 0] * axis[:, 0]
+                         + covariance[:, i, 1] * axis[:, 1]
+                         + covariance[:, i, 2] * axis[:, 2] for i in range(3)], 1)
+
+        norm = np.maximum(np.maximum(np.abs(axis[:, 0]), np.abs(axis[:, 1])), np.abs(axis[:, 2]))
+        axis = np.where(norm[:, None] > 0, axis / np.where(norm > 0, norm, 1)[:, None], axis)
+
+    projections = rgb[:, :, 0] * axis[:, None, 0] + rgb[:, :, 1] * axis[:, None, 1] + rgb[:, :, 2] * axis[:, None, 2]
+
+    high = np.where(opaque, projections, -np.inf).argmax(1)
+    low = np.where(opaque, projections, np.inf).argmin(1)
+
+    return rgb[rows, high], rgb[rows, low]
+
+
+def orderEndpoints(high, low, transparent):
+    """
+    Round the endpoints of BC1 color blocks to RGB565, ordering them for the mode the blocks need:
+    the 3 colors mode (color0 <= color1) for the blocks with transparent pixels, else the 4 colors one.
+    Returns (color0, color1).
+    """
+
+    color0 = quantize565(high)
+    color1 = quantize565(low)
+
+    swap = np.where(transparent.any(1), color0 > color1, color0 < color1)
+
+    return np.where(swap, color1, color0), np.where(swap, color0, color1)
+
+
+def fitColorIndices(rgb, transparent, color0, color1, punchThrough):
+    """
+    Pick the closest color of the palette of BC1 color blocks for each opaque pixel.
+    Returns (indices, errors): the (n, 16) indices, 3 for the transparent pixels,
+    and the (n,) sums of the squared errors of the opaque pixels.
+    """
+
+    palette = colorPalette(color0, color1, punchThrough)
+    threeColors = (color0 <= color1) if punchThrough else np.zeros(len(rgb), bool)
+
+    errors = ((rgb[:, :, None, :] - palette[:, None, :, :3]) ** 2).sum(3)
+    errors[:, :, 3] = np.where(threeColors[:, None], 0x40000, errors[:, :, 3])
+
+    indices = np.where(transparent, 3, errors.argmin(2))
+    errors = np.where(transparent, 0, errors.min(2)).sum(1)
+
+    return indices, errors
+
+
+def leastSquaresFit(rgb, transparent, color0, color1, indices, punchThrough, high, low):
+    """
+    Refit the endpoints of BC1 color blocks to the indices of their pixels, minimizing the squared error
+    of the opaque pixels. The weights of the endpoints are integers out of 3 (or 2 in the 3 colors mode),
+    so that the fit is exact and bcn_cy gives the same endpoints.
+    high, low: (n, 3) arrays of the endpoints kept by the blocks whose indices don't define a line
+    Returns (high, low), the (n, 3) arrays of the refitted endpoints.
+    """
+
+    threeColors = (color0 <= color1) if punchThrough else np.zeros(len(rgb), bool)
+
+    total = np.where(threeColors, 2, 3)[:, None]
+    weights = np.where(threeColors[:, None], np.array([2, 0, 1, 0])[indices], np.array([3, 0, 2, 1])[indices])
+    weights = np.where(transparent, 0, weights).astype(np.int64)
+    others = np.where(transparent, 0, total - weights)
+
+    a = (weights * weights).sum(1)
+    b = (weights * others).sum(1)
+    c = (others * others).sum(1)
+    r0 = (weights[:, :, None] * rgb).sum(1) * total
+    r1 = (others[:, :, None] * rgb).sum(1) * total
+
+    det = (a * c - b * b)[:, None]
+    valid = det > 0
+    det = np.where(valid, det, 1)
+
+    # Round to the nearest integer
+    fitHigh = np.clip((2 * (c[:, None] * r0 - b[:, None] * r1) + det) // (2 * det), 0, 255)
+    fitLow = np.clip((2 * (a[:, None] * r1 - b[:, None] * r0) + det) // (2 * det), 0, 255)
+
+    return np.where(valid, fitHigh, high), np.where(valid, fitLow, low)
+
+
+def encodeColorBlocks(pixels, quality, punchThrough):
+    """
+    pixels: (n, 16, 4) array of RGBA pixels
+    quality: 0 to fit the endpoints to the bounding box of the colors and project the colors on them,
+             1 to try the endpoints of the bounding box and of rangeFit(), then refit the best ones with
+             leastSquaresFit(), keeping the endpoints giving the smallest error with the closest color
+             of the palette for each pixel (so it never does worse than 0)
+    punchThrough: whether to encode the pixels with an alpha < 128 as transparent black (BC1 only)
+    Returns a (n, 8) array of BC1 color blocks.
+    """
+
+    n = len(pixels)
+    rgb = pixels[:, :, :3]
+
+    transparent = pixels[:, :, 3] < 128
+    if not punchThrough:
+        transparent[:] = False
+
+    opaque = ~transparent
+
+    high = np.where(opaque[:, :, None], rgb, 0).max(1)
+    low = np.where(opaque[:, :, None], rgb, 255).min(1)
+
+    color0, color1 = orderEndpoints(high, low, transparent)
+
+    if quality:
+        indices, errors = fitColorIndices(rgb, transparent, color0, color1, punchThrough)
+
+        for step in range(3):
+            if step == 0:
+                high, low = rangeFit(rgb, opaque)
+
+            else:
+                high, low = leastSquaresFit(rgb, transparent, color0, color1, indices, punchThrough, high, low)
+
+            newColor0, newColor1 = orderEndpoints(high, low, transparent)
+            newIndices, newErrors = fitColorIndices(rgb, transparent, newColor0, newColor1, punchThrough)
+
+            better = newErrors < errors
+            color0 = np.where(better, newColor0, color0)
+            color1 = np.where(better, newColor1, color1)
+            indices = np.where(better[:, None], newIndices, indices)
+            errors = np.where(better, newErrors, errors)
+
+    else:
+        palette = colorPalette(color0, color1, punchThrough)
+        threeColors = (color0 <= color1) if punchThrough else np.zeros(n, bool)
+
+        # Round the position of each color on the line between the endpoints
+        steps = np.where(threeColors, 2, 3)[:, None]
+        direction = palette[:, 0, :3] - palette[:, 1, :3]
+        length = (direction ** 2).sum(1)[:, None]
+        dot = ((rgb - palette[:, None, 1, :3]) * direction[:, None]).sum(2)
+
+        positions = np.clip((2 * steps * dot + length) // np.maximum(2 * length, 1), 0, steps)
+        indices = np.where(threeColors[:, None], np.array([1, 2, 0, 0])[positions], np.array([1, 3, 2, 0])[positions])
+        indices = np.where(transparent, 3, indices)
+
+    indices = indices.astype(np.uint32)
+
+    blocks = np.empty((n, 2), '<u4')
+    blocks[:, 0] = color0 | (color1 << 16)
+    blocks[:, 1] = (indices << (2 * np.arange(16, dtype=np.uint32))).sum(1, dtype=np.uint32)
+
+    return blocks.view(np.uint8)
+
+
+def encodeAlphaBlocks(values, quality):
+    """
+    values: (n, 16) array of the values (0 to 255) of the pixels
+    quality: 0 to round the position of each value between the endpoints,
+             1 to pick the closest value of the palette for each pixel
+    Returns a (n, 8) array of BC3 alpha / BC4 blocks, using the 8 values mode.
+    """
+
+    n = len(values)
+    a0 = values.max(1)
+    a1 = values.min(1)
+
+    if quality:
+        palette = alphaPalette(a0, a1)
+        indices = np.abs(values[:, :, None] - palette[:, None, :]).argmin(2)
+
+    else:
+        span = (a0 - a1)[:, None]
+        positions = ((values - a1[:, None]) * 14 + span) // np.maximum(2 * span, 1)
+        indices = np.array([1, 7, 6, 5, 4, 3, 2, 0])[positions]
+
+    indices = indices.astype(np.uint64)
+
+    blocks = np.empty(n, '<u8')
+    blocks[:] = (a0.astype(np.uint64) | (a1.astype(np.uint64) << np.uint64(8))
+                 | (indices << (16 + 3 * np.arange(16, dtype=np.uint64))).sum(1, dtype=np.uint64))
+
+    return blocks.view(np.uint8).reshape(n, 8)
+
+
+def fitETC1Subblocks(rgb, bases, subblocks):
+    """
+    Pick the modifier table of each sub-block of ETC1 blocks, and the modifier of each pixel,
+    minimizing the squared error of the colors.
+    rgb: (n, 16, 3) array of the colors of the pixels
+    bases: (n, 2, 3) array of the base colors of the sub-blocks
+    subblocks: (16,) array of the sub-block of each pixel
+    Returns (errors, tables, indices): (n,), (n, 2) and (n, 16) arrays.
+    """
+
+    n = len(rgb)
+    base = bases[:, subblocks]
+
+    tableErrors = np.empty((n, 2, 8), np.int64)
+    tableIndices = np.empty((n, 16, 8), np.intp)
+
+    for table in range(8):
+        values = np.clip(base[:, :, None, :] + etc1Modifiers[table][None, None, :, None], 0, 255)
+        errors = ((values - rgb[:, :, None, :]) ** 2).sum(3)
+
+        tableIndices[:, :, table] = errors.argmin(2)
+        errors = errors.min(2)
+
+        for subblock in range(2):
+            tableErrors[:, subblock, table] = errors[:, subblocks == subblock].sum(1)
+
+    tables = tableErrors.argmin(2)
+    indices = tableIndices[np.arange(n)[:, None], np.arange(16), tables[:, subblocks]]
+
+    return tableErrors.min(2).sum(1), tables, indices
+
+
+def encodeETC1Blocks(pixels, quality):
+    """
+    pixels: (n, 16, 4) array of RGBA pixels (the alpha is ignored)
+    quality: 0 to only try splitting the blocks vertically, using the differential mode when the average colors
+             of the sub-blocks are close enough, 1 to also try splitting them horizontally and the individual mode
+    Returns a (n, 8) array of ETC1 blocks.
+    """
+
+    n = len(pixels)
+    rgb = pixels[:, :, :3]
+
+    y, x = np.divmod(np.arange(16), 4)
+    bits = (x * 4 + y).astype(np.uint32)
+
+    bestErrors = None
+    for flip in ([0, 1] if quality else [0]):
+        subblocks = (y >= 2 if flip else x >= 2).astype(np.intp)
+
+        averages = np.stack([(rgb[:, subblocks == subblock].sum(1) + 4) // 8 for subblock in range(2)], 1)
+        colors5 = (averages * 31 + 127) // 255
+        colors4 = (averages * 15 + 127) // 255
+
+        delta = colors5[:, 1] - colors5[:, 0]
+        canDiff = ((delta >= -4) & (delta <= 3)).all(1)
+
+        for diff in ([canDiff, np.zeros(n, bool)] if quality else [canDiff]):
+            bases = np.where(diff[:, None, None], expand(colors5, 5), colors4 * 17)
+            errors, tables, indices = fitETC1Subblocks(rgb, bases, subblocks)
+
+            high = np.where(diff, 2, 0).astype(np.uint32) | flip | (tables[:, 0] << 5) | (tables[:, 1] << 2)
+            for channel, shift in enumerate([24, 16, 8]):
+                high |= np.where(diff,
+                                 (colors5[:, 0, channel] << (shift + 3)) | ((delta[:, channel] & 7) << shift),
+                                 (colors4[:, 0, channel] << (shift + 4)) | (colors4[:, 1, channel] << shift)
+                                 ).astype(np.uint32)
+
+            indices = indices.astype(np.uint32)
+            low = (((indices >> 1) << (bits + 16)) | ((indices & 1) << bits)).sum(1, dtype=np.uint32)
+
+            if bestErrors is None:
+                bestErrors, bestHigh, bestLow = errors, high, low
+
+            else:
+                better = errors < bestErrors
+                bestErrors = np.where(better, errors, bestErrors)
+                bestHigh = np.where(better, high, bestHigh)
+                bestLow = np.where(better, low, bestLow)
+
+    blocks = np.empty((n, 2), '>u4')
+    blocks[:, 0] = bestHigh
+    blocks[:, 1] = bestLow
+
+    return blocks.view(np.uint8)
+
+
+def encodeBlocks(format_, pixels, quality):
+    """
+    Encode a (n, 16, 4) array of RGBA pixels to a (n, blockSize) array of blocks of format_.
+    """
+
+    if format_ == "BC1":
+        return encodeColorBlocks(pixels, quality, True)
+
+    elif format_ == "ETC1":
+        return encodeETC1Blocks(pixels, quality)
+
+    elif format_ == "BC3":
+        return np.hstack([encodeAlphaBlocks(pixels[:, :, 3], quality), encodeColorBlocks(pixels, quality, False)])
+
+    elif format_ == "BC4U":
+        return encodeAlphaBlocks(pixels[:, :, 0], quality)
+
+    return np.hstack([encodeAlphaBlocks(pixels[:, :, 0], quality), encodeAlphaBlocks(pixels[:, :, 1], quality)])
+
+
+def encode(format_, data, width, height, quality=1, threads=1):
+    """
+    Encode a RGBA8 image to BC1, BC3, BC4, BC5 or ETC1 blocks, ready to be swizzled.
+    format_: "BC1", "BC3", "BC4U", "BC5U" or "ETC1" (BC4 and BC5 encode the R and G channels)
+    data: any contiguous buffer holding the width * height * 4 bytes of the image
+    quality: 0 for the fast tier, 1 for the better but slower one
+             (see encodeColorBlocks(), encodeAlphaBlocks() and encodeETC1Blocks())
+    threads: number of threads the rows of blocks are split across (0 uses one per CPU)
+    The pixels of BC1 blocks with an alpha < 128 are encoded as transparent black.
+    Returns the blocks, row by row.
+    """
+
+    if format_ not in encodeFormats:
+        raise ValueError("Unsupported block format for encoding: " + str(format_))
+
+    if threads <= 0:
+        threads = os.cpu_count() or 1
+
+    blockSize = blockSizes[format_]
+    blocksWidth = (width + 3) // 4
+    blocksHeight = (height + 3) // 4
+
+    image = np.frombuffer(data, np.uint8)
+    if len(image) < width * height * 4:
+        raise ValueError("Not enough data for a %dx%d RGBA8 image" % (width, height))
+
+    if blocksWidth * blocksHeight == 0:
+        return b''
+
+    # Fill the partial blocks by repeating the last row and column
+    image = image[:width * height * 4].reshape(height, width, 4)
+    image = np.pad(image, ((0, blocksHeight * 4 - height), (0, blocksWidth * 4 - width), (0, 0)), 'edge')
+
+    result = np.empty((blocksHeight, blocksWidth, blockSize), np.uint8)
+
+    def encodeRows(rows):
+        pixels = image[rows.start * 4:rows.stop * 4].reshape(-1, 4, blocksWidth, 4, 4).transpose(0, 2, 1, 3, 4)
+        blocks = encodeBlocks(format_, pixels.reshape(-1, 16, 4).astype(np.int32), quality)
+        result[rows] = blocks.reshape(-1, blocksWidth, blockSize)
+
+    processRows(encodeRows, blocksWidth, blocksHeight, threads)
+
+    return result.tobytes()
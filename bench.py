@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# BFLIM Extractor
+# Version v2.3
+# Copyright © 2016-2019 AboodXD
+
+# This file is part of BFLIM Extractor.
+
+# BFLIM Extractor is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# BFLIM Extractor is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""bench.py: Benchmarks of the texture codecs and the extraction paths of BFLIM Extractor."""
+
+import io
+import os
+import struct
+import sys
+import time
+
+backends = {}
+
+try:
+    import pyximport
+
+    pyximport.install()
+    import bcn_cy
+    backends['cython'] = bcn_cy
+
+except ImportError:
+    pass
+
+try:
+    import bcn_np
+    backends['numpy'] = bcn_np
+
+except ImportError:
+    pass
+
+
+def timeit(func, repeat):
+    # Best time of repeat runs
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+
+        if best is None or elapsed < best:
+            best = elapsed
+
+    return best
+
+
+def makeImage(size):
+    """
+    Make a size x size RGBA8 gradient with noise, smooth enough for the block endpoints to matter,
+    noisy enough for the indices to.
+    """
+
+    image = bytearray(os.urandom(size * size * 4))
+    for i in range(0, len(image), 4):
+        x = (i // 4) % size
+        y = (i // 4) // size
+        image[i:i + 4] = bytes(((x + (image[i] & 15)) & 0xFF, (y + (image[i + 1] & 15)) & 0xFF,
+                                ((x + y) // 2) & 0xFF, 255 if image[i + 3] & 7 else 0))
+
+    return image
+
+
+def benchDecoders(size=1024, threads=1, repeat=5):
+    """
+    Decode a size x size texture of random blocks of each format with each backend,
+    and print the throughput in MB/s of decoded RGBA8 output.
+    """
+
+    print("Decoding %dx%d textures to RGBA8, %d thread(s):" % (size, size, threads))
+
+    for name, module in backends.items():
+        for format_, blockSize in module.blockSizes.items():
+            data = os.urandom(((size + 3) // 4) * ((size + 3) // 4) * blockSize)
+            elapsed = timeit(lambda: module.decode(format_, data, size, size, threads), repeat)
+
+            print("  %-6s %-4s %8.1f MB/s" % (name, format_, size * size * 4 / elapsed / 1e6))
+
+
+def benchEncoders(size=1024, threads=1, repeat=3):
+    """
+    Encode a size x size RGBA8 gradient with noise to each format with each backend and quality,
+    and print the throughput in blocks/s.
+    """
+
+    print("Encoding %dx%d RGBA8 textures, %d thread(s):" % (size, size, threads))
+
+    image = makeImage(size)
+    numBlocks = ((size + 3) // 4) ** 2
+
+    for name, module in backends.items():
+        for format_ in module.encodeFormats:
+            for quality in [0, 1]:
+                elapsed = timeit(lambda: module.encode(format_, image, size, size, quality, threads), repeat)
+
+                print("  %-6s %-4s quality %d %10.0f blocks/s" % (name, format_, quality, numBlocks / elapsed))
+
+
+def benchExport(size=1024, threads=1, repeat=3):
+    """
+    Extract a size x size RGBA8 BFLIM texture to DDS and to PNG at several compression levels,
+    and print the throughput in MB/s of image data and the size of the files.
+    """
+
+    import bflim_extract
+
+    print("Extracting a %dx%d RGBA8 BFLIM texture, %d thread(s):" % (size, size, threads))
+
+    # RGBA8 DDS header
+    hdr = bytearray(128)
+    hdr[:4] = b'DDS '
+    struct.pack_into('<7I', hdr, 4, 124, 0x100f, size, size, 0, 0, 1)
+    struct.pack_into('<2I4s6I', hdr, 76, 32, 0x41, b'', 32, 0xff, 0xff00, 0xff0000, 0xff000000, 0x1000)
+
+    _, output = bflim_extract.encodeFLIM(bytes(hdr) + makeImage(size))
+    flim = bflim_extract.readFLIM(output)
+
+    def writeDDS():
+        f = io.BytesIO()
+        for chunk in bflim_extract.iter_deswizzled_data(flim):
+            f.write(chunk)
+
+        return f.tell()
+
+    elapsed = timeit(writeDDS, repeat)
+    print("  DDS           %8.1f MB/s %10d bytes" % (size * size * 4 / elapsed / 1e6, writeDDS()))
+
+    for level in [1, 6, 9]:
+        def writePNG():
+            return bflim_extract.write_png(flim, io.BytesIO(), level=level, threads=threads)
+
+        elapsed = timeit(writePNG, repeat)
+        print("  PNG, level %d  %8.1f MB/s %10d bytes" % (level, size * size * 4 / elapsed / 1e6, writePNG()))
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 1024
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+
+    if not backends:
+        print("NumPy or Cython is required to benchmark the decoders and encoders!")
+
+    else:
+        benchDecoders(size, threads)
+        print("")
+        benchEncoders(size, threads)
+        print("")
+
+    benchExport(size, threads)
+
+
+if __name__ == '__main__':
+    main()
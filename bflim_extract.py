@@ -22,13 +22,20 @@
 
 """bflim_extract.py: Decode and encode BFLIM files."""
 
+import glob
+import json
+import mmap
 import os
 import struct
 import sys
 import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
 
-import addrlib
-import dds
+# The modules (un)swizzling, converting, decoding and encoding the image data load NumPy and compile or import
+# Cython extensions, so they are only imported when needed by importCodecs(), which --info doesn't call
+addrlib = dds = png = tga = bcn = None
 
 __author__ = "AboodXD"
 __copyright__ = "Copyright 2016-2019 AboodXD"
@@ -57,11 +64,110 @@ formats = {
 
 BCn_formats = [0x31, 0x431, 0x32, 0x432, 0x33, 0x433, 0x34, 0x35]
 
+# Names of the formats -compress accepts
+compressFormats = {"BC1": "BC1", "BC3": "BC3", "BC4": "BC4U", "BC5": "BC5U", "ETC1": "ETC1"}
+
+# Formats -format accepts for PNG and TGA files: (GX2 format, component selectors of the BFLIM format)
+imageFormats = {
+    "RGBA8": (0x1a, (0, 1, 2, 3)),
+    "RGB10A2": (0x19, (0, 1, 2, 3)),
+    "RGB565": (0x08, (2, 1, 0, 5)),
+    "RGB5A1": (0x0a, (0, 1, 2, 3)),
+    "RGBA4": (0x0b, (2, 1, 0, 3)),
+    "L8": (0x01, (0, 0, 0, 5)),
+    "A8": (0x01, (5, 5, 5, 0)),
+    "LA8": (0x07, (0, 0, 0, 1)),
+    "LA4": (0x02, (0, 0, 0, 1)),
+}
+
+# Extensions of the files converted to BFLIM
+encodeExtensions = ('.dds', '.png', '.tga')
+
+
+def importCodecs():
+    """
+    Import addrlib, dds, png, tga and the best available bcn backend (None if there's none) the first time
+    one of them is needed.
+    """
+
+    global addrlib, dds, png, tga, bcn
+
+    if addrlib is not None:
+        return
+
+    import dds
+    import png
+    import tga
+
+    try:
+        import pyximport
+
+        pyximport.install()
+        import bcn_cy as bcn
+
+    except ImportError:
+        try:
+            import bcn_np as bcn
+
+        except ImportError:
+            bcn = None
+
+    # Imported last, importCodecs() checks it to know that all of them are
+    import addrlib
+
 
 class FLIMData:
     pass
 
 
+class FLIMError(Exception):
+    """
+    Base class of the errors raised when decoding or encoding BFLIM files.
+    """
+
+
+class InvalidFLIMError(FLIMError, ValueError):
+    """
+    Raised for files that aren't valid BFLIM files.
+    """
+
+
+class InvalidDDSError(FLIMError, ValueError):
+    """
+    Raised when encoding files that aren't valid DDS files.
+    """
+
+
+class InvalidImageError(FLIMError, ValueError):
+    """
+    Raised when encoding files that aren't valid PNG or TGA files.
+    """
+
+
+class InvalidArgumentError(FLIMError, ValueError):
+    """
+    Raised for invalid arguments, e.g. swizzle patterns or regions outside of the image.
+    """
+
+
+class UnsupportedFormatError(FLIMError):
+    """
+    Raised for texture formats that can't be decoded or encoded.
+    """
+
+
+class UnsupportedTileModeError(FLIMError):
+    """
+    Raised for invalid or unsupported tileModes.
+    """
+
+
+class UnsupportedDepthError(FLIMError):
+    """
+    Raised for surfaces whose tiling depth isn't 1.
+    """
+
+
 class FLIMHeader(struct.Struct):
     def __init__(self, bom):
         super().__init__(bom + '4s2H2IH2x')
@@ -102,10 +208,42 @@ def computeSwizzleTileMode(tileModeAndSwizzlePattern):
     return tileModeAndSwizzlePattern[0] << 5 | tileModeAndSwizzlePattern[1]  # swizzlePattern << 5 | tileMode
 
 
-def readFLIM(f):
-    flim = FLIMData()
+# FLIM format: (GX2 format, compSel)
+flimFormats = {
+    0x00: (0x01, [0, 0, 0, 5]),
+    0x01: (0x01, [5, 5, 5, 0]),
+    0x02: (0x02, [0, 0, 0, 1]),
+    0x03: (0x07, [0, 0, 0, 1]),
+    0x05: (0x08, [2, 1, 0, 5]),
+    0x06: (0x1a, [0, 1, 2, 5]),
+    0x07: (0x0a, [0, 1, 2, 3]),
+    0x08: (0x0b, [2, 1, 0, 3]),
+    0x09: (0x1a, [0, 1, 2, 3]),
+    0x0a: (0x31, [0, 1, 2, 3]),  # ETC1
+    0x0C: (0x31, [0, 1, 2, 3]),
+    0x0D: (0x32, [0, 1, 2, 3]),
+    0x0E: (0x33, [0, 1, 2, 3]),
+    0x0F: (0x34, [0, 1, 2, 3]),
+    0x10: (0x34, [0, 1, 2, 3]),
+    0x11: (0x35, [0, 1, 2, 3]),
+    0x14: (0x41a, [0, 1, 2, 3]),
+    0x15: (0x431, [0, 1, 2, 3]),
+    0x16: (0x432, [0, 1, 2, 3]),
+    0x17: (0x433, [0, 1, 2, 3]),
+    0x18: (0x19, [0, 1, 2, 3]),
+    0x19: (0x08, [2, 1, 0, 5]),
+}
+
+
+def readHeaders(f):
+    """
+    Unpack the FLIM and imag headers in place from the last 0x28 bytes of f.
+    Returns (header, info).
+    """
 
     pos = len(f) - 0x28
+    if pos < 0:
+        raise InvalidFLIMError("Invalid file header!")
 
     if f[pos + 4:pos + 6] == b'\xFF\xFE':
         bom = '<'
@@ -113,11 +251,14 @@ def readFLIM(f):
     elif f[pos + 4:pos + 6] == b'\xFE\xFF':
         bom = '>'
 
+    else:
+        raise InvalidFLIMError("Invalid file header!")
+
     header = FLIMHeader(bom)
     header.data(f, pos)
 
     if header.magic != b'FLIM':
-        raise ValueError("Invalid file header!")
+        raise InvalidFLIMError("Invalid file header!")
 
     pos += header.size
 
@@ -125,111 +266,44 @@ def readFLIM(f):
     info.data(f, pos)
 
     if info.magic != b'imag':
-        raise ValueError("Invalid imag header!")
-
-    flim.width = info.width
-    flim.height = info.height
+        raise InvalidFLIMError("Invalid imag header!")
 
-    if info.format_ == 0x00:
-        flim.format = 0x01
-        flim.compSel = [0, 0, 0, 5]
+    return header, info
 
-    elif info.format_ == 0x01:
-        flim.format = 0x01
-        flim.compSel = [5, 5, 5, 0]
 
-    elif info.format_ == 0x02:
-        flim.format = 0x02
-        flim.compSel = [0, 0, 0, 1]
+def readFLIM(f):
+    """
+    Parse a BFLIM file held in f (any bytes-like object, e.g. an mmap) without copying its image data.
+    Returns a FLIMData, raises FLIMError if the file isn't supported.
+    """
 
-    elif info.format_ == 0x03:
-        flim.format = 0x07
-        flim.compSel = [0, 0, 0, 1]
+    importCodecs()
 
-    elif info.format_ in [0x05, 0x19]:
-        flim.format = 0x08
-        flim.compSel = [2, 1, 0, 5]
+    flim = FLIMData()
 
-    elif info.format_ == 0x06:
-        flim.format = 0x1a
-        flim.compSel = [0, 1, 2, 5]
+    header, info = readHeaders(f)
 
-    elif info.format_ == 0x07:
-        flim.format = 0x0a
-        flim.compSel = [0, 1, 2, 3]
+    flim.width = info.width
+    flim.height = info.height
 
-    elif info.format_ == 0x08:
-        flim.format = 0x0b
-        flim.compSel = [2, 1, 0, 3]
+    if info.format_ not in flimFormats:
+        raise UnsupportedFormatError("Unsupported texture format: " + hex(info.format_))
 
-    elif info.format_ == 0x09:
-        flim.format = 0x1a
-        flim.compSel = [0, 1, 2, 3]
+    flim.format, compSel = flimFormats[info.format_]
+    flim.compSel = list(compSel)
 
-    elif info.format_ == 0x0a:
-        flim.format = 0x31
+    if info.format_ == 0x0a:
         flim.format_ = "ETC1"
-        flim.compSel = [0, 1, 2, 3]
-
-    elif info.format_ == 0x0C:
-        flim.format = 0x31
-        flim.format_ = "BC1"
-        flim.compSel = [0, 1, 2, 3]
-
-    elif info.format_ == 0x0D:
-        flim.format = 0x32
-        flim.compSel = [0, 1, 2, 3]
-
-    elif info.format_ == 0x0E:
-        flim.format = 0x33
-        flim.compSel = [0, 1, 2, 3]
-
-    elif info.format_ in [0x0F, 0x10]:
-        flim.format = 0x34
-        flim.compSel = [0, 1, 2, 3]
-
-    elif info.format_ == 0x11:
-        flim.format = 0x35
-        flim.compSel = [0, 1, 2, 3]
-
-    elif info.format_ == 0x14:
-        flim.format = 0x41a
-        flim.compSel = [0, 1, 2, 3]
 
-    elif info.format_ == 0x15:
-        flim.format = 0x431
+    elif flim.format in [0x31, 0x431]:
         flim.format_ = "BC1"
-        flim.compSel = [0, 1, 2, 3]
-
-    elif info.format_ == 0x16:
-        flim.format = 0x432
-        flim.compSel = [0, 1, 2, 3]
-
-    elif info.format_ == 0x17:
-        flim.format = 0x433
-        flim.compSel = [0, 1, 2, 3]
-
-    elif info.format_ == 0x18:
-        flim.format = 0x19
-        flim.compSel = [0, 1, 2, 3]
-
-    else:
-        print("")
-        print("Unsupported texture format: " + hex(info.format_))
-        print("Exiting in 5 seconds...")
-        time.sleep(5)
-        sys.exit(1)
 
     flim.imageSize = info.imageSize
 
     # Calculate swizzle and tileMode
     flim.swizzle, flim.tileMode = computeSwizzleTileMode(info.swizzle_tileMode)
     if not 1 <= flim.tileMode <= 16:
-            print("")
-            print("Invalid tileMode!")
-            print("Exiting in 5 seconds...")
-            time.sleep(5)
-            sys.exit(1)
+        raise UnsupportedTileModeError("Invalid tileMode!")
 
     flim.alignment = info.alignment
 
@@ -240,15 +314,15 @@ def readFLIM(f):
         tilingDepth //= 4
 
     if tilingDepth != 1:
-        print("")
-        print("Unsupported depth!")
-        print("Exiting in 5 seconds...")
-        time.sleep(5)
-        sys.exit(1)
+        raise UnsupportedDepthError("Unsupported depth!")
 
     flim.pitch = surfOut.pitch
 
-    flim.data = f[:info.imageSize]
+    # The image data comes before the headers, a shorter file was truncated
+    if info.imageSize > len(f) - 0x28 or header.fileSize > len(f):
+        raise InvalidFLIMError("Truncated file!")
+
+    flim.data = memoryview(f)[:info.imageSize]
 
     flim.surfOut = surfOut
 
@@ -262,7 +336,99 @@ def readFLIM(f):
     return flim
 
 
-def get_deswizzled_data(flim):
+def readFLIMInfo(filename, surfaceInfo=False):
+    """
+    Read the properties of a BFLIM file from its headers only, seeking to its last 0x28 bytes.
+    filename: path of the BFLIM file
+    surfaceInfo: also compute the pitch and the surface size and alignment with addrlib
+    Returns a dict.
+    """
+
+    with open(filename, "rb") as inf:
+        inf.seek(max(0, os.fstat(inf.fileno()).st_size - 0x28))
+        header, info = readHeaders(inf.read(0x28))
+
+    format_ = flimFormats[info.format_][0] if info.format_ in flimFormats else None
+    swizzle, tileMode = computeSwizzleTileMode(info.swizzle_tileMode)
+
+    result = {
+        'file': filename,
+        'width': info.width,
+        'height': info.height,
+        'flimFormat': info.format_,
+        'format': formats.get(format_, hex(info.format_)),
+        'imageSize': info.imageSize,
+        'tileMode': tileMode,
+        'swizzle': swizzle,
+        'alignment': info.alignment,
+    }
+
+    if surfaceInfo and format_ is not None and 1 <= tileMode <= 16:
+        import addrlib
+
+        surfOut = addrlib.getSurfaceInfo(format_, info.width, info.height, 1, 1, tileMode, 0, 0)
+
+        result['pitch'] = surfOut.pitch
+        result['surfSize'] = surfOut.surfSize
+        result['baseAlign'] = surfOut.baseAlign
+
+    return result
+
+
+def printFLIMInfo(paths, surfaceInfo=False):
+    """
+    Print readFLIMInfo() of every BFLIM file in paths (files or directories, searched recursively)
+    as one JSON line per file.
+    """
+
+    for path in paths:
+        if os.path.isdir(path):
+            files = sorted(os.path.join(root, name) for root, _, names in os.walk(path)
+                           for name in names if name.endswith('.bflim'))
+
+        else:
+            files = [path]
+
+        for filename in files:
+            try:
+                result = readFLIMInfo(filename, surfaceInfo)
+
+            except (OSError, ValueError, struct.error) as e:
+                result = {'file': filename, 'error': str(e)}
+
+            print(json.dumps(result))
+
+
+@contextmanager
+def mapFLIM(filename):
+    """
+    Memory-map a BFLIM file and parse it in place with readFLIM(),
+    so its data is a memoryview of the mapping rather than a copy of the file.
+    The FLIMData is only valid inside the with block.
+    The file must not change while it's mapped: readFLIM() checks its size against its headers,
+    but reading a mapping that another writer truncated afterwards kills the process (SIGBUS).
+    Never map a file the same run may be writing.
+    """
+
+    with open(filename, "rb") as inf:
+        try:
+            f = mmap.mmap(inf.fileno(), 0, access=mmap.ACCESS_READ)
+
+        except ValueError:
+            # Empty files can't be mapped
+            raise InvalidFLIMError("Invalid file header!") from None
+
+    with f:
+        flim = readFLIM(f)
+
+        try:
+            yield flim
+
+        finally:
+            flim.data.release()
+
+
+def get_dds_format(flim):
     if flim.format == 0x01:
         format_ = 61
 
@@ -302,68 +468,453 @@ def get_deswizzled_data(flim):
     elif flim.format == 0x35:
         format_ = "BC5U"
 
-    result = addrlib.deswizzle(flim.width, flim.height, 1, flim.format, 0, 1, flim.surfOut.tileMode,
-                               flim.swizzle, flim.pitch, flim.surfOut.bpp, 0, 0, flim.data)
+    return format_
+
+
+def checkRegion(flim, region):
+    """
+    Raise InvalidArgumentError if region isn't a (x, y, width, height) rectangle inside of the image.
+    """
+
+    if len(region) != 4:
+        raise InvalidArgumentError("Invalid region: " + str(region))
+
+    x, y, width, height = region
+    if width <= 0 or height <= 0 or x < 0 or y < 0 or x + width > flim.width or y + height > flim.height:
+        raise InvalidArgumentError("Region (%d, %d, %d, %d) is outside of the %dx%d image"
+                                   % (x, y, width, height, flim.width, flim.height))
+
+
+def get_deswizzled_data(flim, region=None):
+    """
+    flim: FLIMData returned by readFLIM()
+    region: (x, y, width, height) rectangle to extract in pixels, the whole image if None
+    Raises InvalidArgumentError if region is outside of the image.
+    """
+
+    if region is not None:
+        checkRegion(flim, region)
+
+    format_ = get_dds_format(flim)
+
+    if region is None:
+        x, y, width, height = 0, 0, flim.width, flim.height
+        result = addrlib.deswizzle(flim.width, flim.height, 1, flim.format, 0, 1, flim.surfOut.tileMode,
+                                   flim.swizzle, flim.pitch, flim.surfOut.bpp, 0, 0, flim.data)
+
+    else:
+        x, y, width, height = region
+        result = addrlib.deswizzleRegion(flim.width, flim.height, 1, flim.format, 0, 1, flim.surfOut.tileMode,
+                                         flim.swizzle, flim.pitch, flim.surfOut.bpp, 0, 0, flim.data,
+                                         x, y, width, height)
 
     if flim.format in BCn_formats:
-        size = ((flim.width + 3) >> 2) * ((flim.height + 3) >> 2) * (addrlib.surfaceGetBitsPerPixel(flim.format) >> 3)
+        # The region is expanded to whole blocks
+        width = min(flim.width, (x + width + 3) & ~3) - (x & ~3)
+        height = min(flim.height, (y + height + 3) & ~3) - (y & ~3)
+
+        size = ((width + 3) >> 2) * ((height + 3) >> 2) * (addrlib.surfaceGetBitsPerPixel(flim.format) >> 3)
 
     else:
-        size = flim.width * flim.height * (addrlib.surfaceGetBitsPerPixel(flim.format) >> 3)
+        size = width * height * (addrlib.surfaceGetBitsPerPixel(flim.format) >> 3)
 
     result = result[:size]
 
-    hdr = dds.generateHeader(1, flim.width, flim.height, format_, flim.compSel, size, flim.format in BCn_formats)
+    hdr = dds.generateHeader(1, width, height, format_, flim.compSel, size, flim.format in BCn_formats)
 
     return hdr, result
 
 
-def warn_color():
-    print("")
-    print("Warning: colors might mess up!!")
+def get_decoded_data(flim, threads=1, region=None):
+    """
+    Decode a BCn or ETC1 texture to RGBA8.
+    flim: FLIMData returned by readFLIM()
+    threads: number of threads decoding the blocks (0 uses one per CPU)
+    region: (x, y, width, height) rectangle to decode in pixels, the whole image if None
+    Returns (width, height, data): the size of the decoded image (the one of the region if any)
+    and its width * height * 4 bytes.
+    Raises UnsupportedFormatError for the other formats, or if no decoder is available (NumPy or Cython missing),
+    InvalidArgumentError if region is outside of the image.
+    """
 
+    if flim.format not in BCn_formats:
+        raise UnsupportedFormatError("Only BCn and ETC1 textures can be decoded!")
 
-def writeFLIM(f, tileMode, swizzle_, SRGB):
-    width, height, format_, fourcc, dataSize, compSel, numMips, data = dds.readDDS(f, SRGB)
+    if bcn is None:
+        raise UnsupportedFormatError("Decoding BCn and ETC1 textures requires NumPy or Cython!")
+
+    if region is not None:
+        checkRegion(flim, region)
+
+    format_ = get_dds_format(flim)
+
+    if region is None:
+        data = addrlib.deswizzle(flim.width, flim.height, 1, flim.format, 0, 1, flim.surfOut.tileMode,
+                                 flim.swizzle, flim.pitch, flim.surfOut.bpp, 0, 0, flim.data, threads)
+
+        return flim.width, flim.height, bcn.decode(format_, data, flim.width, flim.height, threads)
+
+    x, y, width, height = region
+    data = addrlib.deswizzleRegion(flim.width, flim.height, 1, flim.format, 0, 1, flim.surfOut.tileMode,
+                                   flim.swizzle, flim.pitch, flim.surfOut.bpp, 0, 0, flim.data,
+                                   x, y, width, height)
+
+    # Decode the whole blocks of the region, then crop them to it
+    blocksWidth = min(flim.width, (x + width + 3) & ~3) - (x & ~3)
+    blocksHeight = min(flim.height, (y + height + 3) & ~3) - (y & ~3)
+    data = bcn.decode(format_, data, blocksWidth, blocksHeight, threads)
+
+    rows = []
+    for row in range(y & 3, (y & 3) + height):
+        start = (row * blocksWidth + (x & 3)) * 4
+        rows.append(data[start:start + width * 4])
+
+    return width, height, b''.join(rows)
+
+
+def get_decoded_dds(flim, threads=1, region=None):
+    """
+    Decode a BCn or ETC1 texture with get_decoded_data().
+    Returns (hdr, data): the header and data of a RGBA8 DDS file.
+    """
+
+    width, height, data = get_decoded_data(flim, threads, region)
+    hdr = dds.generateHeader(1, width, height, 28, [0, 1, 2, 3], len(data), False)
+
+    return hdr, data
+
+
+def iter_rgba8_data(flim, threads=1, region=None):
+    """
+    Generator yielding the image (or the (x, y, width, height) rectangle region of it) converted to RGBA8
+    with the compSel of the texture, one row band at a time.
+    BCn and ETC1 textures are decoded at once with get_decoded_data().
+    """
+
+    if flim.format in BCn_formats:
+        _, _, data = get_decoded_data(flim, threads, region)
+        yield dds.form_conv.toRGBA8(data, 0x1a, flim.compSel)
+        return
+
+    # RGBA4 pixels are stored with their alpha in the low bits, see encodeFLIM()
+    remap = dds.form_conv.getRemapPlan('argb4_to_rgba4') if flim.format == 0xb else None
+
+    if region is None:
+        bands = addrlib.deswizzleBands(flim.width, flim.height, 1, flim.format, 0, 1, flim.surfOut.tileMode,
+                                       flim.swizzle, flim.pitch, flim.surfOut.bpp, 0, 0, flim.data)
+
+    else:
+        bands = [get_deswizzled_data(flim, region)[1]]
+
+    for band in bands:
+        if remap is not None:
+            band = dds.form_conv.remapPixels(band, remap, 2)
+
+        yield dds.form_conv.toRGBA8(band, flim.format, flim.compSel)
+
+
+def write_png(flim, f, region=None, level=6, threads=1):
+    """
+    Write the image (or the (x, y, width, height) rectangle region of it) as a RGBA8 PNG file to the file object f,
+    streaming it with iter_rgba8_data().
+    level: zlib compression level (0 to 9)
+    threads: number of threads decoding and compressing the image (0 uses one per CPU)
+    Returns the size of the file.
+    Raises InvalidArgumentError if region is outside of the image or level is invalid.
+    """
+
+    if not 0 <= level <= 9:
+        raise InvalidArgumentError("Invalid compression level: " + str(level))
+
+    if region is None:
+        width, height = flim.width, flim.height
+
+    else:
+        width, height = region[2], region[3]
+
+    return png.writePNG(f, width, height, iter_rgba8_data(flim, threads, region), level, threads)
+
+
+def iter_deswizzled_data(flim):
+    """
+    Generator yielding the DDS header, then the deswizzled image one row band at a time,
+    so that it can be written out without holding the whole deswizzled image in memory.
+    flim: FLIMData returned by readFLIM()
+    """
+
+    yield dds.generateHeader(1, flim.width, flim.height, get_dds_format(flim), flim.compSel, flim.realSize,
+                             flim.format in BCn_formats)
+
+    yield from addrlib.deswizzleBands(flim.width, flim.height, 1, flim.format, 0, 1, flim.surfOut.tileMode,
+                                      flim.swizzle, flim.pitch, flim.surfOut.bpp, 0, 0, flim.data)
+
+
+def warn_color(flim):
+    flim.warnings.append("Warning: colors might mess up!!")
+
+
+def decodeFLIM(f, region=None):
+    """
+    Decode a BFLIM file held in f (any bytes-like object, e.g. an mmap).
+    region: (x, y, width, height) rectangle to extract in pixels, the whole image if None
+    Returns (flim, hdr, data): the FLIMData describing the texture, and the header and data of the DDS file.
+    Raises FLIMError if the file isn't supported.
+    """
+
+    flim = readFLIM(f)
+    hdr, data = get_deswizzled_data(flim, region)
+
+    return flim, hdr, data
+
+
+def compressData(data, width, height, compSel, compress, quality=1, threads=1):
+    """
+    Compress an uncompressed RGBA8 texture to BCn or ETC1.
+    compSel: component selectors of the R, G, B and A channels in the pixels of data
+    compress: "BC1", "BC3", "BC4U", "BC5U" or "ETC1"
+    quality, threads: see bcn_np.encode()
+    Returns the blocks, ready to be swizzled.
+    """
+
+    importCodecs()
+
+    if bcn is None:
+        raise UnsupportedFormatError("Compressing textures requires NumPy or Cython!")
+
+    if compress not in bcn.encodeFormats:
+        raise UnsupportedFormatError("Unsupported compression format: " + str(compress))
+
+    try:
+        remap = dds.form_conv.getCompSelPlan(0x1a, tuple(compSel), (0, 1, 2, 3))
+
+    except ValueError:
+        raise UnsupportedFormatError("Unsupported DDS format for compression!") from None
+
+    if remap is not None:
+        data = dds.form_conv.remapPixels(data, remap, 4)
+
+    return bcn.encode(compress, data, width, height, quality, threads)
+
+
+def parseImage(f, SRGB=0, imageFormat="RGBA8"):
+    """
+    Read a PNG or an uncompressed TGA file held in f (any bytes-like object),
+    converting its pixels to an uncompressed GX2 format in the layout of the matching BFLIM format.
+    SRGB: 1 if RGBA8 pixels should use the SRGB format, else 0
+    imageFormat: name of the format in imageFormats, the channels are rounded to its components
+    Returns (width, height, format_, compSel, data), data being ready to be swizzled.
+    Raises InvalidImageError if the file is invalid, InvalidArgumentError if imageFormat is.
+    """
+
+    importCodecs()
+
+    if imageFormat not in imageFormats:
+        raise InvalidArgumentError("Unsupported format: " + str(imageFormat))
+
+    try:
+        if bytes(f[:8]) == png.signature:
+            width, height, data = png.readPNG(f)
+
+        else:
+            width, height, data = tga.readTGA(f)
+
+    except (png.PNGError, tga.TGAError) as e:
+        raise InvalidImageError(str(e)) from e
+
+    format_, compSel = imageFormats[imageFormat]
+
+    if format_ == 0x1a:
+        if SRGB:
+            format_ = 0x41a
+
+    else:
+        data = dds.form_conv.fromRGBA8(data, format_, compSel)
+
+    return width, height, format_, list(compSel), data
+
+
+def isLossless(stats, format_, compSel):
+    """
+    Check whether RGBA8 pixels survive a round trip through an uncompressed GX2 format unchanged.
+    stats: statistics of the pixels returned by form_conv.getChannelStats()
+    format_, compSel: the format and the component selectors of the R, G, B and A channels (see imageFormats)
+    """
+
+    importCodecs()
+
+    values, gray = stats
+    components = dds.form_conv.formatComponents[format_][1]
+
+    for channel, sel in enumerate(compSel):
+        if sel in [4, 5]:
+            if not values[channel] <= {0 if sel == 4 else 255}:
+                return False
+
+            continue
+
+        # Channels reading the component another channel is stored in must be equal to that channel
+        first = compSel.index(sel)
+        if first != channel and not (gray and first < 3 and channel < 3):
+            return False
+
+        width = components[sel][1]
+        if width < 8:
+            for value in values[channel]:
+                if dds.form_conv.resizeBitfield((value * ((1 << width) - 1) + 127) // 255, width, 8) != value:
+                    return False
+
+    return True
 
-    if 0 in [width, dataSize] and data == []:
-        print("Exiting in 5 seconds...")
-        time.sleep(5)
-        sys.exit(1)
+
+def findLosslessFormat(data):
+    """
+    Find the smallest format of imageFormats holding RGBA8 pixels losslessly, using their channel statistics.
+    Returns its name, "RGBA8" if no smaller format fits.
+    """
+
+    importCodecs()
+
+    stats = dds.form_conv.getChannelStats(data)
+
+    for name in sorted(imageFormats, key=lambda name: dds.form_conv.formatComponents[imageFormats[name][0]][0]):
+        if isLossless(stats, *imageFormats[name]):
+            return name
+
+
+def findSmallestTileMode(format_, width, height):
+    """
+    Find the tileMode giving the smallest surface for a texture, trying every tileMode but LINEAR_SPECIAL (16),
+    which isn't used for textures.
+    The ones addrlib replaces with another tileMode or whose tiling depth isn't 1 are skipped.
+    Ties go to the default tileMode, then to the smallest base alignment.
+    Surface infos are cached by addrlib, so trying every tileMode is cheap.
+    Returns (tileMode, saved): saved is the number of bytes saved compared to getDefaultGX2TileMode().
+    """
+
+    importCodecs()
+
+    default = addrlib.getDefaultGX2TileMode(1, width, height, 1, format_, 0, 1)
+    defaultSize = addrlib.getSurfaceInfo(format_, width, height, 1, 1, default, 0, 0).surfSize
+
+    best = None
+    for tileMode in range(1, 16):
+        surfOut = addrlib.getSurfaceInfo(format_, width, height, 1, 1, tileMode, 0, 0)
+
+        tilingDepth = surfOut.depth
+        if surfOut.tileMode == 3:
+            tilingDepth //= 4
+
+        if surfOut.tileMode != tileMode or tilingDepth != 1:
+            continue
+
+        key = (surfOut.surfSize, tileMode != default, surfOut.baseAlign, tileMode)
+        if best is None or key < best:
+            best = key
+
+    return best[3], defaultSize - best[0]
+
+
+def encodeFLIM(f, tileMode=0, swizzle_=0, SRGB=0, compress=None, quality=1, threads=1, imageFormat="RGBA8",
+               downsize=False, smallestTileMode=False):
+    """
+    Encode a DDS, PNG or uncompressed TGA file held in f (any bytes-like object) to BFLIM.
+    tileMode: GX2TileMode to use, 0 to select the optimal one (or the smallest one if smallestTileMode)
+    swizzle_: swizzle pattern (0 to 7)
+    SRGB: 1 if the destination format should be SRGB, else 0
+    compress: "BC1", "BC3", "BC4U", "BC5U" or "ETC1" to compress RGBA8 DDS files to that format,
+              None to keep their format
+    quality: 0 for the fast compression, 1 for the better one
+    threads: number of threads to compress with (0 uses one per CPU)
+    imageFormat: format PNG and TGA files are converted to, see parseImage()
+    downsize: store uncompressed RGBA8 textures in the smallest format holding them losslessly,
+              see findLosslessFormat()
+    smallestTileMode: with tileMode 0, use the tileMode giving the smallest surface, see findSmallestTileMode()
+    Returns (flim, output): a FLIMData describing the texture and the BFLIM file (a bytearray).
+    flim.warnings lists the problems which didn't stop the conversion.
+    flim.compressTime is the time compression took in seconds, None if the texture wasn't compressed.
+    flim.downsizedFrom is the bits per pixel of the texture before downsize changed its format, else None.
+    flim.tileModeSaved is the number of bytes smallestTileMode saved, None if it wasn't used.
+    Raises FLIMError if the file isn't supported, InvalidArgumentError if an argument is invalid.
+    """
+
+    importCodecs()
+
+    if not 0 <= tileMode <= 16:
+        raise UnsupportedTileModeError("Invalid tileMode!")
+
+    if not 0 <= swizzle_ <= 7:
+        raise InvalidArgumentError("Invalid swizzle pattern!")
+
+    if quality not in [0, 1]:
+        raise InvalidArgumentError("Invalid compression quality: " + str(quality))
+
+    if bytes(f[:4]) != b'DDS ' and (bytes(f[:8]) == png.signature or tga.isTGA(f)):
+        width, height, format_, compSel, data = parseImage(f, SRGB, imageFormat)
+        fourcc = b''
+        dataSize = len(data)
+
+    else:
+        try:
+            width, height, format_, fourcc, dataSize, compSel, numMips, data = dds.parseDDS(f, SRGB)
+
+        except dds.DDSError as e:
+            raise InvalidDDSError(str(e)) from e
 
     if format_ not in formats:
-        print("")
-        print("Unsupported DDS format!")
-        print("Exiting in 5 seconds...")
-        time.sleep(5)
-        sys.exit(1)
+        raise UnsupportedFormatError("Unsupported DDS format!")
+
+    flim = FLIMData()
+    flim.warnings = []
+    flim.compressTime = None
+    flim.downsizedFrom = None
+    flim.tileModeSaved = None
 
     data = data[:dataSize]
 
-    if format_ == 0xb:
-        data = dds.form_conv.rgba4_to_argb4(data)
+    if downsize and compress is None and format_ == 0x1a:
+        rgba = dds.form_conv.toRGBA8(data, format_, compSel)
+        name = findLosslessFormat(rgba)
+
+        if name != "RGBA8":
+            format_, compSel = imageFormats[name]
+            compSel = list(compSel)
+
+            data = dds.form_conv.fromRGBA8(rgba, format_, compSel)
+            dataSize = len(data)
+            flim.downsizedFrom = 32
+
+    if compress is not None:
+        if format_ not in [0x1a, 0x41a]:
+            raise UnsupportedFormatError("Only RGBA8 textures can be compressed!")
+
+        start = time.perf_counter()
+        data = compressData(data, width, height, compSel, compress, quality, threads)
+        flim.compressTime = time.perf_counter() - start
+
+        format_ = {"BC1": 0x31, "BC3": 0x33, "BC4U": 0x34, "BC5U": 0x35, "ETC1": 0x31}[compress]
+        if SRGB and compress in ["BC1", "BC3"]:
+            format_ |= 0x400
+
+        fourcc = b'ETC1' if compress == "ETC1" else b''
+        dataSize = len(data)
+        compSel = [0, 1, 2, 3]
 
     if not tileMode:
-        tileMode = addrlib.getDefaultGX2TileMode(1, width, height, 1, format_, 0, 1)
+        if smallestTileMode:
+            tileMode, flim.tileModeSaved = findSmallestTileMode(format_, width, height)
 
-    bpp = addrlib.surfaceGetBitsPerPixel(format_) >> 3
+        else:
+            tileMode = addrlib.getDefaultGX2TileMode(1, width, height, 1, format_, 0, 1)
 
     surfOut = addrlib.getSurfaceInfo(format_, width, height, 1, 1, tileMode, 0, 0)
     alignment = surfOut.baseAlign
 
-    padSize = surfOut.surfSize - dataSize
-    data += padSize * b"\x00"
-
     tilingDepth = surfOut.depth
     if surfOut.tileMode == 3:
         tilingDepth //= 4
 
     if tilingDepth != 1:
-        print("")
-        print("Unsupported depth!")
-        print("Exiting in 5 seconds...")
-        time.sleep(5)
-        sys.exit(1)
+        raise UnsupportedDepthError("Unsupported depth!")
 
     swizzle_tileMode = computeSwizzleTileMode((swizzle_, tileMode))
 
@@ -371,22 +922,16 @@ def writeFLIM(f, tileMode, swizzle_, SRGB):
     if tileMode not in [1, 2, 3, 16]:
         s |= 0xd0000
 
-    print("")
-    print("  width           = " + str(width))
-    print("  height          = " + str(height))
-    print("  format          = " + formats[format_])
-    print("  imageSize       = " + str(len(data)))
-    print("  tileMode        = " + str(tileMode))
-    print("  swizzle         = " + str(s) + ", " + hex(s))
-    print("  alignment       = " + str(alignment))
-    print("  pitch           = " + str(surfOut.pitch))
-    print("")
-    print("  bits per pixel  = " + str(bpp << 3))
-    print("  bytes per pixel = " + str(bpp))
-    print("  realSize        = " + str(dataSize))
-
-    swizzled_data = addrlib.swizzle(width, height, 1, format_, 0, 1, surfOut.tileMode,
-                                    s, surfOut.pitch, surfOut.bpp, 0, 0, data)
+    flim.width = width
+    flim.height = height
+    flim.format = format_
+    flim.imageSize = surfOut.surfSize
+    flim.tileMode = tileMode
+    flim.swizzle = s
+    flim.alignment = alignment
+    flim.pitch = surfOut.pitch
+    flim.surfOut = surfOut
+    flim.realSize = dataSize
 
     if format_ == 1:
         if compSel[3] == 0:
@@ -429,87 +974,331 @@ def writeFLIM(f, tileMode, swizzle_, SRGB):
 
         format_ = fmt[format_]
 
-    if format_ == 0:
-        if compSel not in [[0, 0, 0, 5], [0, 5, 5, 5]]:
-            warn_color()
+    # Convert the pixels from the layout compSel describes to the one of the BFLIM format while swizzling them
+    remap = None
+    flim.compSel = list(flimFormats[format_][1])
 
-    elif format_ == 1:
-        if compSel != [5, 5, 5, 0]:
-            warn_color()
+    conversions = []
+    if flim.format == 0xb:
+        conversions.append('rgba4_to_argb4')
 
-    elif format_ in [2, 3]:
-        if compSel not in [[0, 0, 0, 1], [0, 5, 5, 1]]:
-            warn_color()
+    if flim.format in dds.form_conv.formatComponents:
+        try:
+            remap = dds.form_conv.getCompSelPlan(flim.format, tuple(compSel), tuple(flim.compSel), *conversions)
 
-    elif format_ == 5:
-        if compSel != [2, 1, 0, 5]:
-            if compSel == [0, 1, 2, 5]:
-                swizzled_data = dds.form_conv.swapRB_16bpp(swizzled_data, 'rgb565')
+        except ValueError:
+            warn_color(flim)
 
-            else:
-                warn_color()
+            if conversions:
+                remap = dds.form_conv.getRemapPlan(*conversions)
 
-    elif format_ == 6:
-        if compSel != [0, 1, 2, 5]:
-            if compSel == [2, 1, 0, 5]:
-                swizzled_data = dds.form_conv.swapRB_32bpp(swizzled_data, 'rgba8')
+        if remap is not None and surfOut.bpp == 8:
+            # Only 16 and 32 bpp elements can be converted by addrlib
+            data = dds.form_conv.remapPixels(data, remap, 1)
+            remap = None
 
-            else:
-                warn_color()
+    # Swizzle straight into the output file, which is padded to the size of the surface,
+    # converting the pixels on the way
+    output = bytearray(surfOut.surfSize + 0x28)
 
-    elif format_ == 7:
-        if compSel != [0, 1, 2, 3]:
-            if compSel == [2, 1, 0, 3]:
-                swizzled_data = dds.form_conv.swapRB_16bpp(swizzled_data, 'rgb5a1')
+    addrlib.swizzle(width, height, 1, flim.format, 0, 1, surfOut.tileMode, s, surfOut.pitch, surfOut.bpp, 0, 0,
+                    data, out=memoryview(output)[:surfOut.surfSize], remap=remap)
 
-            else:
-                warn_color()
+    head_struct = FLIMHeader('>')
+    head_struct.pack_into(output, surfOut.surfSize,
+                          b"FLIM", 0xFEFF, 0x14, 0x2020000, surfOut.surfSize + 0x28, 1)
+
+    img_head_struct = imagHeader('>')
+    img_head_struct.pack_into(output, surfOut.surfSize + head_struct.size,
+                              b"imag", 16, width, height, alignment, format_, swizzle_tileMode,
+                              surfOut.surfSize)
+
+    return flim, output
+
+
+def printFLIM(flim):
+    print("")
+    print("  width           = " + str(flim.width))
+    print("  height          = " + str(flim.height))
+
+    if flim.format in formats:
+        print("  format          = " + formats[flim.format])
+
+    else:
+        print("  format          = " + hex(flim.format))
+
+    print("  imageSize       = " + str(flim.imageSize))
+    print("  tileMode        = " + str(flim.tileMode))
+    print("  swizzle         = " + str(flim.swizzle) + ", " + hex(flim.swizzle))
+    print("  alignment       = " + str(flim.alignment))
+    print("  pitch           = " + str(flim.pitch))
+
+    bpp = addrlib.surfaceGetBitsPerPixel(flim.format)
+
+    print("")
+    print("  bits per pixel  = " + str(bpp))
+    print("  bytes per pixel = " + str(bpp // 8))
+    print("  realSize        = " + str(flim.realSize))
+
+
+def writeFLIM(f, tileMode, swizzle_, SRGB, compress=None, quality=1, threads=0, imageFormat="RGBA8", downsize=False,
+              smallestTileMode=False):
+    """
+    Encode the DDS, PNG or TGA file named f with encodeFLIM(), printing its properties and warnings.
+    """
+
+    with open(f, "rb") as inf:
+        inb = inf.read()
 
-    elif format_ == 8:
-        if compSel != [2, 1, 0, 3]:
-            if compSel == [0, 1, 2, 3]:
-                swizzled_data = dds.form_conv.swapRB_16bpp(swizzled_data, 'argb4')
+    flim, output = encodeFLIM(inb, tileMode, swizzle_, SRGB, compress, quality, threads, imageFormat, downsize,
+                              smallestTileMode)
+
+    printFLIM(flim)
+
+    if flim.downsizedFrom is not None:
+        print("")
+        print("  Downsized losslessly from %d to %d bits per pixel"
+              % (flim.downsizedFrom, addrlib.surfaceGetBitsPerPixel(flim.format)))
+
+    if flim.tileModeSaved is not None:
+        print("")
+        print("  Smallest tileMode saved %d bytes over the default one" % flim.tileModeSaved)
+
+    if flim.compressTime is not None:
+        numBlocks = ((flim.width + 3) // 4) * ((flim.height + 3) // 4)
+
+        print("")
+        print("  Compressed %d blocks in %.3f seconds (%.0f blocks/s)"
+              % (numBlocks, flim.compressTime, numBlocks / max(flim.compressTime, 1e-9)))
+
+    for warning in flim.warnings:
+        print("")
+        print(warning)
+
+    return output
+
+
+def convertFile(input_, output_, tileMode=0, swizzle=0, SRGB=0, compress=None, quality=1, decode=False, level=6,
+                imageFormat="RGBA8", downsize=False, smallestTileMode=False):
+    """
+    Convert a BFLIM file to DDS (or PNG if output_ ends with .png) or a DDS, PNG or TGA file to BFLIM,
+    depending on the extension of input_.
+    decode: decode BCn and ETC1 BFLIM files to RGBA8 DDS files
+    level: zlib compression level of PNG files
+    imageFormat: format PNG and TGA files are converted to, see parseImage()
+    downsize: store RGBA8 textures in the smallest format holding them losslessly
+    smallestTileMode: with tileMode 0, use the tileMode giving the smallest surface
+    Returns the sizes of the input and output files.
+    """
+
+    if input_.endswith(encodeExtensions):
+        with open(input_, "rb") as inf:
+            _, data = encodeFLIM(inf.read(), tileMode, swizzle, SRGB, compress, quality,
+                                 imageFormat=imageFormat, downsize=downsize, smallestTileMode=smallestTileMode)
+
+        with open(output_, "wb+") as output:
+            output.write(data)
+
+    else:
+        with mapFLIM(input_) as flim, open(output_, "wb+") as output:
+            if output_.endswith('.png'):
+                write_png(flim, output, level=level)
+
+            elif decode and flim.format in BCn_formats:
+                for chunk in get_decoded_dds(flim):
+                    output.write(chunk)
 
             else:
-                warn_color()
+                for chunk in iter_deswizzled_data(flim):
+                    output.write(chunk)
 
-    elif format_ in [9, 0x14, 0x18]:
-        if compSel != [0, 1, 2, 3]:
-            if compSel == [2, 1, 0, 3]:
-                if format_ == 0x18:
-                    swizzled_data = dds.form_conv.swapRB_32bpp(swizzled_data, 'bgr10a2')
+    return os.path.getsize(input_), os.path.getsize(output_)
 
-                else:
-                    swizzled_data = dds.form_conv.swapRB_32bpp(swizzled_data, 'rgba8')
+
+def batchConvertFiles(chunk):
+    # Runs in the worker processes: convert a chunk of tasks at once to cut the inter-process overhead
+    return [batchConvertFile(args) for args in chunk]
+
+
+def batchConvertFile(args):
+    # Runs in the worker processes: return the error message instead of raising it
+    input_ = args[0]
+
+    try:
+        return input_, convertFile(*args), None
+
+    except Exception as e:
+        return input_, None, str(e) or type(e).__name__
+
+
+def findBatchInputs(paths):
+    """
+    Expand the BFLIM, DDS, PNG and TGA files, directories (searched recursively) and glob patterns of paths.
+    Returns a list of (input file, output file name relative to the output folder).
+    """
+
+    inputs = []
+
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                for name in sorted(names):
+                    if name.endswith(('.bflim',) + encodeExtensions):
+                        input_ = os.path.join(root, name)
+                        inputs.append((input_, os.path.relpath(input_, path)))
+
+        else:
+            for input_ in sorted(glob.glob(path, recursive=True)) or [path]:
+                if input_.endswith(('.bflim',) + encodeExtensions):
+                    inputs.append((input_, os.path.basename(input_)))
+
+    return inputs
+
+
+def batchConvert(paths, outputDir=None, jobs=0, tileMode=0, swizzle=0, SRGB=0, compress=None, quality=1,
+                 decode=False, toPNG=False, level=6, imageFormat="RGBA8", downsize=False, smallestTileMode=False):
+    """
+    Convert every BFLIM, DDS, PNG and TGA file of paths (files, directories or glob patterns)
+    across a pool of jobs processes.
+    outputDir: folder to write the converted files into, next to their input files if None
+    jobs: number of worker processes (0 uses one per CPU)
+    compress, quality: compression of the RGBA8 DDS, PNG and TGA files, see encodeFLIM()
+    decode: decode BCn and ETC1 BFLIM files to RGBA8 DDS files
+    toPNG, level: convert BFLIM files to PNG files instead of DDS ones, compressed with the zlib level level
+    imageFormat: format PNG and TGA files are converted to, see parseImage()
+    downsize: store RGBA8 textures in the smallest format holding them losslessly
+    smallestTileMode: with tileMode 0, use the tileMode giving the smallest surface
+    Files whose output would be the input of another conversion, or the output of an earlier one, are skipped
+    and reported as failed, so that no conversion reads a file another one is writing.
+    Returns the list of (input file, error message) of the files that failed to convert.
+    """
+
+    errors = []
+    numFiles = 0
+    numBytes = 0
+    start = time.perf_counter()
+
+    inputs = findBatchInputs(paths)
+    inputPaths = {os.path.normcase(os.path.realpath(input_)) for input_, _ in inputs}
+    outputPaths = set()
+
+    tasks = []
+    for input_, name in inputs:
+        if input_.endswith(encodeExtensions):
+            name = os.path.splitext(name)[0] + ".bflim"
+
+        else:
+            name = os.path.splitext(name)[0] + (".png" if toPNG else ".dds")
+
+        if outputDir is None:
+            output_ = os.path.join(os.path.dirname(input_), os.path.basename(name))
+
+        else:
+            output_ = os.path.join(outputDir, name)
+
+        outputPath = os.path.normcase(os.path.realpath(output_))
+        if outputPath in inputPaths:
+            error = "Output file %s is also an input file" % output_
+
+        elif outputPath in outputPaths:
+            error = "Output file %s is also written by another input file" % output_
+
+        else:
+            error = None
+
+        if error is not None:
+            errors.append((input_, error))
+            print('Failed: ' + input_ + ': ' + error)
+            continue
+
+        outputPaths.add(outputPath)
+
+        if outputDir is not None:
+            os.makedirs(os.path.dirname(output_) or outputDir, exist_ok=True)
+
+        tasks.append((input_, output_, tileMode, swizzle, SRGB, compress, quality, decode, level, imageFormat,
+                      downsize, smallestTileMode))
+
+    if jobs <= 0:
+        jobs = os.cpu_count() or 1
+
+    def report(results):
+        nonlocal numFiles, numBytes
+
+        for input_, sizes, error in results:
+            if error is None:
+                numFiles += 1
+                numBytes += sizes[0]
+                print('Converted: ' + input_)
 
             else:
-                warn_color()
+                errors.append((input_, error))
+                print('Failed: ' + input_ + ': ' + error)
 
-    head_struct = FLIMHeader('>')
-    head = head_struct.pack(b"FLIM", 0xFEFF, 0x14, 0x2020000, len(swizzled_data) + 0x28, 1)
+    if jobs == 1:
+        report(map(batchConvertFile, tasks))
 
-    img_head_struct = imagHeader('>')
-    imag_head = img_head_struct.pack(b"imag", 16, width, height, alignment, format_, swizzle_tileMode,
-                                     len(swizzled_data))
+    else:
+        chunkSize = max(1, len(tasks) // (jobs * 16))
+        chunks = [tasks[i:i + chunkSize] for i in range(0, len(tasks), chunkSize)]
 
-    output = swizzled_data + head + imag_head
+        with ProcessPoolExecutor(jobs) as executor:
+            futures = [executor.submit(batchConvertFiles, chunk) for chunk in chunks]
 
-    return output
+            for chunk, future in zip(chunks, futures):
+                try:
+                    results = future.result()
+
+                except BrokenProcessPool:
+                    # A worker died (e.g. killed by a signal), fail the files of every chunk that didn't finish
+                    results = [(args[0], None, "The process converting it died") for args in chunk]
+
+                report(results)
+
+    elapsed = max(time.perf_counter() - start, 1e-9)
+
+    print("")
+    print("Converted %d files, %d failed, in %.2f seconds using %d processes" % (numFiles, len(errors), elapsed, jobs))
+    print("Throughput: %.1f files/s, %.2f MB/s" % (numFiles / elapsed, numBytes / elapsed / 1024 / 1024))
+
+    return errors
 
 
 def printInfo():
     print("")
     print("Usage:")
     print("  bflim_extract [option...] input")
+    print("  bflim_extract --info [--surface-info] input...")
+    print("  bflim_extract --batch [--jobs <n>] [option...] input...")
     print("")
     print("Options:")
     print(
         " -o <output>           Output file, if not specified, the output file will have the same name as the intput file")
+    print(" --info                print the properties of every input (BFLIM files or directories) as JSON lines,")
+    print("                       reading only the headers")
+    print(" --surface-info        with --info, also compute the pitch, surfSize and baseAlign of the surfaces")
+    print(" --batch               convert every input (BFLIM, DDS, PNG or TGA files, directories or glob patterns)")
+    print("                       both ways, -o is then the output folder")
+    print(" --jobs <n>            with --batch, number of processes to convert with (one per CPU by default)")
+    print("")
+    print("BFLIM to DDS options:")
+    print(" -region <x,y,w,h>     only extract the w x h rectangle at (x, y), e.g. a sprite of an atlas")
+    print("                       (expanded to whole 4x4 blocks for BCn formats)")
+    print(" -decode               decode BCn and ETC1 textures, writing RGBA8 DDS files")
+    print(" -png                  write PNG files instead of DDS files (also used if the output file ends with .png)")
+    print(" -level <n>            with -png, the zlib compression level, from 0 to 9 (6 is the default)")
     print("")
-    print("DDS to BFLIM options:")
+    print("DDS, PNG and TGA to BFLIM options:")
     print(" -tileMode <tileMode>  tileMode (by default, the optimal tileMode will be selected)")
+    print(" -smallestTileMode     without -tileMode, select the tileMode giving the smallest surface instead")
     print(" -swizzle <swizzle>    the swizzle pattern, only values from 0 to 7 are allowed (0 is the default)")
     print(" -SRGB <n>             1 if the desired destination format is SRGB, else 0 (0 is the default)")
+    print(" -compress <format>    compress RGBA8 textures to BC1, BC3, BC4, BC5 or ETC1")
+    print(" -quality <n>          with -compress, 0 for the fast compression, 1 for the better one (1 is the default)")
+    print(" -format <format>      format of the PNG and TGA files: RGBA8 (the default), RGB10A2, RGB565, RGB5A1,")
+    print("                       RGBA4, L8, A8, LA8 or LA4")
+    print(" -downsize             store RGBA8 textures in the smallest format holding them losslessly,")
+    print("                       e.g. L8 for opaque grayscale ones")
     print("")
     print("Supported tileModes:")
     print(" - GX2_TILE_MODE_DEFAULT (0)")
@@ -567,95 +1356,200 @@ def printInfo():
     print(" - BC4")
     print(" - BC5")
     print("")
+    print("Supported PNG and TGA files:")
+    print(" - PNG: every color type and bit depth, non-interlaced")
+    print(" - TGA: uncompressed truecolor and grayscale")
+    print("")
     print("Exiting in 5 seconds...")
     time.sleep(5)
     sys.exit(1)
 
 
+def batchMain():
+    args = sys.argv[sys.argv.index("--batch") + 1:]
+    decode = "-decode" in args
+    toPNG = "-png" in args
+    downsize = "-downsize" in args
+    smallestTileMode = "-smallestTileMode" in args
+    args = [arg for arg in args if arg not in ["-decode", "-png", "-downsize", "-smallestTileMode"]]
+
+    options = {"-o": None, "--jobs": "0", "-tileMode": "0", "-swizzle": "0", "-SRGB": "0",
+               "-compress": None, "-quality": "1", "-level": "6", "-format": "RGBA8"}
+    paths = []
+
+    i = 0
+    while i < len(args):
+        if args[i] in options and i + 1 < len(args):
+            options[args[i]] = args[i + 1]
+            i += 2
+
+        else:
+            paths.append(args[i])
+            i += 1
+
+    tileMode = int(options["-tileMode"], 0)
+    swizzle = int(options["-swizzle"], 0)
+    SRGB = int(options["-SRGB"], 0)
+    compress = compressFormats.get(options["-compress"], options["-compress"])
+    quality = int(options["-quality"], 0)
+    level = int(options["-level"], 0)
+
+    if (not paths or SRGB > 1 or not 0 <= tileMode <= 16 or not 0 <= swizzle <= 7
+            or compress not in [None] + list(compressFormats.values()) or quality not in [0, 1]
+            or not 0 <= level <= 9 or options["-format"] not in imageFormats):
+        printInfo()
+
+    print("")
+    errors = batchConvert(paths, options["-o"], int(options["--jobs"], 0), tileMode, swizzle, SRGB,
+                          compress, quality, decode, toPNG, level, options["-format"], downsize, smallestTileMode)
+
+    if errors:
+        sys.exit(1)
+
+
 def main():
+    if "--info" in sys.argv:
+        args = sys.argv[sys.argv.index("--info") + 1:]
+        surfaceInfo = "--surface-info" in args
+        printFLIMInfo([arg for arg in args if arg != "--surface-info"], surfaceInfo)
+        return
+
     print("BFLIM Extractor v2.3")
     print("(C) 2016-2019 AboodXD")
 
+    if "--batch" in sys.argv:
+        batchMain()
+        return
+
     input_ = sys.argv[-1]
 
-    if not (input_.endswith('.bflim') or input_.endswith('.dds')):
+    if not input_.endswith(('.bflim',) + encodeExtensions):
         printInfo()
 
     toFLIM = False
 
-    if input_.endswith('.dds'):
+    if input_.endswith(encodeExtensions):
         toFLIM = True
 
     if "-o" in sys.argv:
         output_ = sys.argv[sys.argv.index("-o") + 1]
 
     else:
-        output_ = os.path.splitext(input_)[0] + (".bflim" if toFLIM else ".dds")
+        output_ = os.path.splitext(input_)[0] + (".bflim" if toFLIM else ".png" if "-png" in sys.argv else ".dds")
 
     print("")
     print('Converting: ' + input_)
 
-    if toFLIM:
-        if "-tileMode" in sys.argv:
-            tileMode = int(sys.argv[sys.argv.index("-tileMode") + 1], 0)
+    try:
+        if toFLIM:
+            if "-tileMode" in sys.argv:
+                tileMode = int(sys.argv[sys.argv.index("-tileMode") + 1], 0)
 
-        else:
-            tileMode = 0
+            else:
+                tileMode = 0
 
-        if "-swizzle" in sys.argv:
-            swizzle = int(sys.argv[sys.argv.index("-swizzle") + 1], 0)
+            if "-swizzle" in sys.argv:
+                swizzle = int(sys.argv[sys.argv.index("-swizzle") + 1], 0)
 
-        else:
-            swizzle = 0
+            else:
+                swizzle = 0
 
-        if "-SRGB" in sys.argv:
-            SRGB = int(sys.argv[sys.argv.index("-SRGB") + 1], 0)
+            if "-SRGB" in sys.argv:
+                SRGB = int(sys.argv[sys.argv.index("-SRGB") + 1], 0)
 
-        else:
-            SRGB = 0
+            else:
+                SRGB = 0
 
-        if SRGB > 1 or not 0 <= tileMode <= 16 or not 0 <= swizzle <= 7:
-            printInfo()
+            if "-compress" in sys.argv:
+                compress = sys.argv[sys.argv.index("-compress") + 1]
+                compress = compressFormats.get(compress, compress)
 
-        data = writeFLIM(input_, tileMode, swizzle, SRGB)
+            else:
+                compress = None
 
-        with open(output_, "wb+") as output:
-            output.write(data)
+            if "-quality" in sys.argv:
+                quality = int(sys.argv[sys.argv.index("-quality") + 1], 0)
 
-    else:
-        with open(input_, "rb") as inf:
-            inb = inf.read()
+            else:
+                quality = 1
 
-        flim = readFLIM(inb)
+            if "-format" in sys.argv:
+                imageFormat = sys.argv[sys.argv.index("-format") + 1]
 
-        print("")
-        print("  width           = " + str(flim.width))
-        print("  height          = " + str(flim.height))
+            else:
+                imageFormat = "RGBA8"
 
-        if flim.format in formats:
-            print("  format          = " + formats[flim.format])
+            if (SRGB > 1 or not 0 <= tileMode <= 16 or not 0 <= swizzle <= 7
+                    or compress not in [None] + list(compressFormats.values()) or quality not in [0, 1]
+                    or imageFormat not in imageFormats):
+                printInfo()
+
+            downsize = "-downsize" in sys.argv
+            smallestTileMode = "-smallestTileMode" in sys.argv
+
+            data = writeFLIM(input_, tileMode, swizzle, SRGB, compress, quality, 0, imageFormat, downsize,
+                             smallestTileMode)
+
+            with open(output_, "wb+") as output:
+                output.write(data)
 
         else:
-            print("  format          = " + hex(flim.format))
+            with mapFLIM(input_) as flim:
+                printFLIM(flim)
 
-        print("  imageSize       = " + str(flim.imageSize))
-        print("  tileMode        = " + str(flim.tileMode))
-        print("  swizzle         = " + str(flim.swizzle) + ", " + hex(flim.swizzle))
-        print("  alignment       = " + str(flim.alignment))
-        print("  pitch           = " + str(flim.pitch))
+                if "-region" in sys.argv:
+                    try:
+                        region = tuple(int(n, 0) for n in sys.argv[sys.argv.index("-region") + 1].split(","))
 
-        bpp = addrlib.surfaceGetBitsPerPixel(flim.format)
+                    except ValueError:
+                        printInfo()
 
-        print("")
-        print("  bits per pixel  = " + str(bpp))
-        print("  bytes per pixel = " + str(bpp // 8))
-        print("  realSize        = " + str(flim.realSize))
+                    # Check the region before creating the output file
+                    checkRegion(flim, region)
 
-        hdr, data = get_deswizzled_data(flim)
+                else:
+                    region = None
 
-        with open(output_, "wb+") as output:
-            output.write(hdr)
-            output.write(data)
+                if "-level" in sys.argv:
+                    level = int(sys.argv[sys.argv.index("-level") + 1], 0)
+                    if not 0 <= level <= 9:
+                        printInfo()
+
+                else:
+                    level = 6
+
+                try:
+                    with open(output_, "wb+") as output:
+                        if output_.endswith('.png') or "-png" in sys.argv:
+                            write_png(flim, output, region, level, 0)
+
+                        elif "-decode" in sys.argv and flim.format in BCn_formats:
+                            hdr, data = get_decoded_dds(flim, 0, region)
+
+                            output.write(hdr)
+                            output.write(data)
+
+                        elif region is None:
+                            for chunk in iter_deswizzled_data(flim):
+                                output.write(chunk)
+
+                        else:
+                            hdr, data = get_deswizzled_data(flim, region)
+
+                            output.write(hdr)
+                            output.write(data)
+
+                except FLIMError:
+                    # Don't leave a partial output file behind
+                    os.remove(output_)
+                    raise
+
+    except FLIMError as e:
+        print("")
+        print(e)
+        print("Exiting in 5 seconds...")
+        time.sleep(5)
+        sys.exit(1)
 
     print('')
     print('Finished converting: ' + output_)
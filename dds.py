@@ -34,25 +34,57 @@ try:
     import form_conv_cy as form_conv
 
 except ImportError:
-    import form_conv
+    try:
+        import form_conv_np as form_conv
+
+    except ImportError:
+        import form_conv
 
 dx10_formats = ["BC4U", "BC4S", "BC5U", "BC5S"]
 
 
+class DDSError(ValueError):
+    """
+    Raised by parseDDS() for invalid or unsupported DDS files.
+    """
+
+
 def readDDS(f, SRGB):
+    """
+    Read and parse the DDS file named f with parseDDS(),
+    printing the error and returning zeros if it's invalid.
+    """
+
     with open(f, "rb") as inf:
         inb = inf.read()
 
-    if len(inb) < 0x80 or inb[:4] != b'DDS ':
+    try:
+        width, height, format_, fourcc, size, compSel, numMips, data = parseDDS(inb, SRGB)
+        return width, height, format_, fourcc, size, compSel, numMips, bytes(data)
+
+    except DDSError as e:
         print("")
-        print(f + " is not a valid DDS file!")
+        print(f + ": " + str(e))
 
         return 0, 0, 0, b'', 0, [], 0, []
 
+
+def parseDDS(inb, SRGB):
+    """
+    inb: contents of a DDS file (any bytes-like object)
+    SRGB: whether the GX2 format should be the SRGB one if there is one
+    Returns (width, height, format_, fourcc, size, compSel, numMips, data).
+    data is a memoryview of inb, without copying it, unless the pixels had to be converted.
+    Raises DDSError if the file is invalid or its format isn't supported.
+    """
+
+    if len(inb) < 0x80 or bytes(inb[:4]) != b'DDS ':
+        raise DDSError("Not a valid DDS file!")
+
     width = struct.unpack("<I", inb[16:20])[0]
     height = struct.unpack("<I", inb[12:16])[0]
 
-    fourcc = inb[84:88]
+    fourcc = bytes(inb[84:88])
 
     pflags = struct.unpack("<I", inb[80:84])[0]
     bpp = struct.unpack("<I", inb[88:92])[0] >> 3
@@ -63,10 +95,7 @@ def readDDS(f, SRGB):
     caps = struct.unpack("<I", inb[108:112])[0]
 
     if caps not in [0x1000, 0x401008]:
-        print("")
-        print("Invalid texture.")
-
-        return 0, 0, 0, b'', 0, [], 0, []
+        raise DDSError("Invalid texture.")
 
     abgr8_masks = {0xff: 0, 0xff00: 1, 0xff0000: 2, 0xff000000: 3, 0: 5}
     bgr8_masks = {0xff: 0, 0xff00: 1, 0xff0000: 2, 0: 5}
@@ -101,20 +130,14 @@ def readDDS(f, SRGB):
         has_alpha = True
 
     else:
-        print("")
-        print("Invalid texture.")
-
-        return 0, 0, 0, b'', 0, [], 0, []
+        raise DDSError("Invalid texture.")
 
     format_ = 0
     compSel = [0, 1, 2, 3]
 
     if fourcc == b'DX10':
         if not compressed:
-            print("")
-            print("Uncompressed DX10 DDS files are not supported.")
-
-            return 0, 0, 0, b'', 0, [], 0, []
+            raise DDSError("Uncompressed DX10 DDS files are not supported.")
 
         headSize = 0x94
 
@@ -155,19 +178,19 @@ def readDDS(f, SRGB):
             bpp = 16
 
         elif fourcc == b'DX10':
-            if inb[128:148] == b"\x50\x00\x00\x00\x03\x00\x00\x00\x00\x00\x00\x00\x01\x00\x00\x00\x00\x00\x00\x00":
+            if bytes(inb[128:148]) == b"\x50\x00\x00\x00\x03\x00\x00\x00\x00\x00\x00\x00\x01\x00\x00\x00\x00\x00\x00\x00":
                 format_ = 0x34
                 bpp = 8
 
-            elif inb[128:148] == b"\x51\x00\x00\x00\x03\x00\x00\x00\x00\x00\x00\x00\x01\x00\x00\x00\x00\x00\x00\x00":
+            elif bytes(inb[128:148]) == b"\x51\x00\x00\x00\x03\x00\x00\x00\x00\x00\x00\x00\x01\x00\x00\x00\x00\x00\x00\x00":
                 format_ = 0x234
                 bpp = 8
 
-            elif inb[128:148] == b"\x53\x00\x00\x00\x03\x00\x00\x00\x00\x00\x00\x00\x01\x00\x00\x00\x00\x00\x00\x00":
+            elif bytes(inb[128:148]) == b"\x53\x00\x00\x00\x03\x00\x00\x00\x00\x00\x00\x00\x01\x00\x00\x00\x00\x00\x00\x00":
                 format_ = 0x35
                 bpp = 16
 
-            elif inb[128:148] == b"\x54\x00\x00\x00\x03\x00\x00\x00\x00\x00\x00\x00\x01\x00\x00\x00\x00\x00\x00\x00":
+            elif bytes(inb[128:148]) == b"\x54\x00\x00\x00\x03\x00\x00\x00\x00\x00\x00\x00\x01\x00\x00\x00\x00\x00\x00\x00":
                 format_ = 0x235
                 bpp = 16
 
@@ -243,25 +266,19 @@ def readDDS(f, SRGB):
         mipSize = 0
 
     if len(inb) < headSize + size + mipSize:
-        print("")
-        print(f + " is not a valid DDS file!")
-
-        return 0, 0, 0, b'', 0, [], 0, []
+        raise DDSError("Not a valid DDS file!")
 
     if format_ == 0:
-        print("")
-        print("Unsupported DDS format!")
-
-        return 0, 0, 0, b'', 0, [], 0, []
+        raise DDSError("Unsupported DDS format!")
 
-    data = bytearray(inb[headSize:headSize + size + mipSize])
+    data = memoryview(inb)[headSize:headSize + size + mipSize]
 
     if format_ in [0x1a, 0x41a] and bpp == 3:
-        data = form_conv.rgb8torgbx8(data)
+        data = form_conv.rgb8torgbx8(bytearray(data))
         bpp += 1
         size = width * height * bpp
 
-    return width, height, format_, fourcc, size, compSel, numMips, bytes(data)
+    return width, height, format_, fourcc, size, compSel, numMips, data
 
 
 def get_mipSize(width, height, bpp, numMips, compressed):
@@ -6,17 +6,18 @@
 ################################################################
 ################################################################
 
+import functools
+import threading
+
 
 def rgb8torgbx8(data):
     numPixels = len(data) // 3
 
-    new_data = bytearray(numPixels * 4)
+    new_data = bytearray(b'\xFF' * (numPixels * 4))
 
-    for i in range(numPixels):
-        new_data[4 * i + 0] = data[3 * i + 0]
-        new_data[4 * i + 1] = data[3 * i + 1]
-        new_data[4 * i + 2] = data[3 * i + 2]
-        new_data[4 * i + 3] = 0xFF
+    # Copy each channel at once with extended slices
+    for i in range(3):
+        new_data[i::4] = data[i:numPixels * 3:3]
 
     return bytes(new_data)
 
@@ -56,55 +57,39 @@ def _swapRB_argb4(pixel):
     return (red << 12) | (green << 8) | (blue << 4) | alpha
 
 
-def swapRB_16bpp(data, format_):
-    numPixels = len(data) // 2
-
-    new_data = bytearray(numPixels * 2)
-
-    for i in range(numPixels):
-        pixel = (
-            (data[2 * i + 1] << 8) |
-            data[2 * i + 0]
-        )
-
-        if format_ == 'rgb565':
-            new_pixel = _swapRB_rgb565(pixel)
+def swapRB_16bpp(data, format_, out=None):
+    """
+    out: writable buffer to write the result into and return (can be data itself),
+         a new bytes object if None
+    """
 
-        elif format_ == 'rgb5a1':
-            new_pixel = _swapRB_rgb5a1(pixel)
+    if format_ not in ['rgb565', 'rgb5a1', 'rgba4']:
+        format_ = 'argb4'
 
-        elif format_ == 'rgba4':
-            new_pixel = _swapRB_rgba4(pixel)
+    return remapPixels(data, getRemapPlan(format_), 2, out)
 
-        else:
-            new_pixel = _swapRB_argb4(pixel)
-
-        new_data[2 * i + 1] = (new_pixel & 0xFF00) >> 8
-        new_data[2 * i + 0] = new_pixel & 0xFF
-
-    return bytes(new_data)
 
+def _rgba4_to_argb4(pixel):
+    rgb = (pixel & 0xFFF)
+    alpha = (pixel & 0xF000) >> 12
 
-def rgba4_to_argb4(data):
-    numPixels = len(data) // 2
+    return (rgb << 4) | alpha
 
-    new_data = bytearray(numPixels * 2)
 
-    for i in range(numPixels):
-        pixel = (
-            (data[2 * i + 1] << 8) |
-            data[2 * i + 0]
-        )
+def _argb4_to_rgba4(pixel):
+    rgb = (pixel & 0xFFF0) >> 4
+    alpha = pixel & 0xF
 
-        rgb = (pixel & 0xFFF)
-        alpha = (pixel & 0xF000) >> 12
+    return (alpha << 12) | rgb
 
-        new_pixel = (rgb << 4) | alpha
 
-        new_data[2 * i + 1] = (new_pixel & 0xFF00) >> 8
-        new_data[2 * i + 0] = new_pixel & 0xFF
+def rgba4_to_argb4(data, out=None):
+    """
+    out: writable buffer to write the result into and return (can be data itself),
+         a new bytes object if None
+    """
 
-    return bytes(new_data)
+    return remapPixels(data, getRemapPlan('rgba4_to_argb4'), 2, out)
 
 
 def _swapRB_bgr10a2(pixel):
@@ -125,28 +110,412 @@ def _swapRB_rgba8(pixel):
     return (alpha << 24) | (red << 16) | (green << 8) | blue
 
 
-def swapRB_32bpp(data, format_):
+def swapRB_32bpp(data, format_, out=None):
+    """
+    out: writable buffer to write the result into and return (can be data itself),
+         a new bytes object if None
+    """
+
+    if format_ != 'bgr10a2':
+        format_ = 'rgba8'
+
+    return remapPixels(data, getRemapPlan(format_), 4, out)
+
+
+remapConversions = {
+    'rgb565': (_swapRB_rgb565, 16),
+    'rgb5a1': (_swapRB_rgb5a1, 16),
+    'rgba4': (_swapRB_rgba4, 16),
+    'argb4': (_swapRB_argb4, 16),
+    'rgba4_to_argb4': (_rgba4_to_argb4, 16),
+    'argb4_to_rgba4': (_argb4_to_rgba4, 16),
+    'bgr10a2': (_swapRB_bgr10a2, 32),
+    'rgba8': (_swapRB_rgba8, 32),
+}
+
+
+def traceBits(convert, bitsPerPixel):
+    """
+    Find where convert, which may only move, copy, clear or set bits, takes each bit of a pixel.
+    Returns (srcBits, const): the source bit of each destination bit taken from the pixel,
+    and the value of the bits it sets.
+    """
+
+    const = convert(0)
+
+    srcBits = {}
+    for bit in range(bitsPerPixel):
+        moved = convert(1 << bit) & ~const
+        for dst in range(bitsPerPixel):
+            if (moved >> dst) & 1:
+                srcBits[dst] = bit
+
+    return srcBits, const
+
+
+def compileRemapPlan(srcBits, const):
+    """
+    Compile srcBits and const returned by traceBits() into a remap plan, merging runs of consecutive bits into bitfields.
+    Returns (fields, const): each element becomes const | ((element >> srcShift) & mask) << dstShift
+    for every (srcShift, mask, dstShift) in fields.
+    """
+
+    fields = []
+    for dst in sorted(srcBits):
+        src = srcBits[dst]
+        if fields:
+            srcShift, length, dstShift = fields[-1]
+            if srcShift + length == src and dstShift + length == dst:
+                fields[-1][1] += 1
+                continue
+
+        fields.append([src, 1, dst])
+
+    return tuple((srcShift, (1 << length) - 1, dstShift) for srcShift, length, dstShift in fields), const
+
+
+def convertChain(conversions):
+    def convert(pixel):
+        for name in conversions:
+            pixel = remapConversions[name][0](pixel)
+
+        return pixel
+
+    return convert
+
+
+@functools.lru_cache()
+def getRemapPlan(*conversions, inverse=False):
+    """
+    Compile conversions (names from remapConversions, applied one after the other) into a remap plan,
+    which addrlib.swizzle() and addrlib.deswizzle() apply to each element while (un)swizzling it,
+    so that the pixels are only read and written once.
+    inverse: compile the plan undoing the conversions instead
+    Returns (fields, const), see compileRemapPlan().
+    """
+
+    bitsPerPixel = {remapConversions[name][1] for name in conversions}
+    if len(bitsPerPixel) != 1:
+        raise ValueError("Conversions of different pixel sizes can't be combined")
+
+    srcBits, const = traceBits(convertChain(conversions), bitsPerPixel.pop())
+
+    if inverse:
+        srcBits = {src: dst for dst, src in srcBits.items()}
+
+    return compileRemapPlan(srcBits, const)
+
+
+# Bits per pixel and (shift, width) bitfields of the components of the uncompressed GX2 formats,
+# in the order compSel indexes them
+formatComponents = {
+    0x01: (8, ((0, 8),)),
+    0x02: (8, ((0, 4), (4, 4))),
+    0x07: (16, ((0, 8), (8, 8))),
+    0x08: (16, ((0, 5), (5, 6), (11, 5))),
+    0x0a: (16, ((0, 5), (5, 5), (10, 5), (15, 1))),
+    0x0b: (16, ((0, 4), (4, 4), (8, 4), (12, 4))),
+    0x19: (32, ((0, 10), (10, 10), (20, 10), (30, 2))),
+    0x1a: (32, ((0, 8), (8, 8), (16, 8), (24, 8))),
+    0x41a: (32, ((0, 8), (8, 8), (16, 8), (24, 8))),
+}
+
+
+def resizeBitfield(value, width, newWidth):
+    # Truncate the bitfield, or repeat its bits to fill the new width (so that its maximum stays the maximum)
+    if width >= newWidth:
+        return value >> (width - newWidth)
+
+    result = 0
+    for shift in range(newWidth - width, -width, -width):
+        result |= (value << shift) if shift >= 0 else (value >> -shift)
+
+    return result & ((1 << newWidth) - 1)
+
+
+@functools.lru_cache()
+def getCompSelPlan(format_, compSel, dstCompSel, *conversions):
+    """
+    Compile the remap plan moving the channels of pixels of the uncompressed GX2 format format_
+    from the components compSel selects into the ones dstCompSel selects, then applying conversions
+    (names from remapConversions, applied one after the other).
+    compSel, dstCompSel: tuples of the GX2 component selectors of the R, G, B and A channels:
+        0 to 3 for a component of the format, 4 for a constant 0 and 5 for a constant 1
+    A component dstCompSel selects for a channel gets the component compSel selects for it,
+    truncated or widened, or is filled with zeros or ones if compSel selects a constant.
+    Components dstCompSel doesn't select are left as they are.
+    Returns the plan (see compileRemapPlan()), None if the pixels don't need to be converted.
+    Raises ValueError if format_ isn't supported or compSel selects a component format_ doesn't have.
+    """
+
+    if format_ not in formatComponents:
+        raise ValueError("Unsupported format for channel remapping: " + hex(format_))
+
+    bitsPerPixel, components = formatComponents[format_]
+
+    if any(sel > 5 or (3 >= sel >= len(components)) for sel in compSel + dstCompSel):
+        raise ValueError("Invalid component selectors for format %s: %s -> %s"
+                         % (hex(format_), compSel, dstCompSel))
+
+    # Component of the result for each channel, the first channel setting a component wins
+    targets = {}
+    for channel, component in enumerate(dstCompSel):
+        if component < 4:
+            targets.setdefault(component, compSel[channel])
+
+    def convert(pixel):
+        result = 0
+        for component, (shift, width) in enumerate(components):
+            sel = targets.get(component, component)
+            if sel == 4:
+                continue
+
+            elif sel == 5:
+                value = (1 << width) - 1
+
+            else:
+                srcShift, srcWidth = components[sel]
+                value = resizeBitfield((pixel >> srcShift) & ((1 << srcWidth) - 1), srcWidth, width)
+
+            result |= value << shift
+
+        return convertChain(conversions)(result)
+
+    if conversions and {remapConversions[name][1] for name in conversions} != {bitsPerPixel}:
+        raise ValueError("Conversions of different pixel sizes can't be combined")
+
+    remap = compileRemapPlan(*traceBits(convert, bitsPerPixel))
+    if remap == (((0, (1 << bitsPerPixel) - 1, 0),), 0):
+        return None
+
+    return remap
+
+
+@functools.lru_cache()
+def getRGBA8Plan(format_, compSel):
+    """
+    Compile the remap plan converting the pixels of the uncompressed GX2 format format_, widened to 32 bits,
+    to RGBA8 pixels.
+    compSel: tuple of the GX2 component selectors of the R, G, B and A channels (see getCompSelPlan()),
+             the components they select are truncated or widened to 8 bits
+    Returns the plan (see compileRemapPlan()).
+    Raises ValueError if format_ isn't supported or compSel selects a component format_ doesn't have.
+    """
+
+    if format_ not in formatComponents:
+        raise ValueError("Unsupported format for channel remapping: " + hex(format_))
+
+    components = formatComponents[format_][1]
+
+    if len(compSel) != 4 or any(sel > 5 or (3 >= sel >= len(components)) for sel in compSel):
+        raise ValueError("Invalid component selectors for format %s: %s" % (hex(format_), compSel))
+
+    def convert(pixel):
+        result = 0
+        for channel, sel in enumerate(compSel):
+            if sel == 4:
+                continue
+
+            elif sel == 5:
+                value = 0xFF
+
+            else:
+                shift, width = components[sel]
+                value = resizeBitfield((pixel >> shift) & ((1 << width) - 1), width, 8)
+
+            result |= value << (8 * channel)
+
+        return result
+
+    return compileRemapPlan(*traceBits(convert, 32))
+
+
+def toRGBA8(data, format_, compSel):
+    """
+    Convert the pixels of the uncompressed GX2 format format_ to RGBA8, see getRGBA8Plan().
+    Returns a bytes-like object, data itself if it's already RGBA8.
+    """
+
+    remap = getRGBA8Plan(format_, tuple(compSel))
+    bytesPerPixel = formatComponents[format_][0] // 8
+    numPixels = len(data) // bytesPerPixel
+
+    if bytesPerPixel == 4 and remap == (((0, 0xFFFFFFFF, 0),), 0):
+        return data
+
+    if bytesPerPixel != 4:
+        # Widen the pixels to 32 bits with extended slices
+        widened = bytearray(numPixels * 4)
+        for i in range(bytesPerPixel):
+            widened[i::4] = data[i:numPixels * bytesPerPixel:bytesPerPixel]
+
+        data = widened
+
+    return remapPixels(data, remap, 4)
+
+
+def getQuantizeInfo(format_, compSel):
+    """
+    Find which channel of RGBA8 pixels each component of the uncompressed GX2 format format_ is taken from.
+    compSel: tuple of the GX2 component selectors of the R, G, B and A channels (see getCompSelPlan()),
+             a component is taken from the first channel selecting it, the ones no channel selects are set to ones
+    Returns (bitsPerPixel, channels): the (channel or None, shift, width) of each component.
+    Raises ValueError if format_ isn't supported or compSel selects a component format_ doesn't have.
+    """
+
+    if format_ not in formatComponents:
+        raise ValueError("Unsupported format for channel remapping: " + hex(format_))
+
+    bitsPerPixel, components = formatComponents[format_]
+
+    if len(compSel) != 4 or any(sel > 5 or (3 >= sel >= len(components)) for sel in compSel):
+        raise ValueError("Invalid component selectors for format %s: %s" % (hex(format_), compSel))
+
+    channels = []
+    for component, (shift, width) in enumerate(components):
+        channel = compSel.index(component) if component in compSel else None
+        channels.append((channel, shift, width))
+
+    return bitsPerPixel, tuple(channels)
+
+
+def quantizeTable(width):
+    # Round 8 bits values to width bits, kept in the top bits of the byte
+    return bytes(((value * ((1 << width) - 1) + 127) // 255) << (8 - width) for value in range(256))
+
+
+@functools.lru_cache()
+def getFromRGBA8Plan(format_, compSel):
+    """
+    Compile the remap plan packing RGBA8 pixels, whose channels are already rounded to the width
+    of the components they go to (see fromRGBA8()), to pixels of the uncompressed GX2 format format_
+    (in the low bits of 32 bits elements).
+    Returns the plan (see compileRemapPlan()).
+    """
+
+    channels = getQuantizeInfo(format_, compSel)[1]
+
+    def convert(pixel):
+        result = 0
+        for channel, shift, width in channels:
+            if channel is None:
+                value = (1 << width) - 1
+
+            else:
+                value = resizeBitfield((pixel >> (8 * channel)) & 0xFF, 8, width)
+
+            result |= value << shift
+
+        return result
+
+    return compileRemapPlan(*traceBits(convert, 32))
+
+
+def fromRGBA8(data, format_, compSel):
+    """
+    Convert RGBA8 pixels to the uncompressed GX2 format format_, rounding the channels to the width
+    of the components compSel moves them to (see getQuantizeInfo()), or widening them by repeating their bits.
+    Returns the converted pixels as bytes.
+    """
+
+    compSel = tuple(compSel)
+    bitsPerPixel, channels = getQuantizeInfo(format_, compSel)
+
     numPixels = len(data) // 4
+    data = bytearray(data[:numPixels * 4])
+
+    # Round each channel with a translation table, one extended slice at a time
+    for channel, _, width in channels:
+        if channel is not None and width < 8:
+            data[channel::4] = data[channel::4].translate(quantizeTable(width))
+
+    data = remapPixels(data, getFromRGBA8Plan(format_, compSel), 4)
+
+    bytesPerPixel = bitsPerPixel // 8
+    if bytesPerPixel == 4:
+        return data
+
+    result = bytearray(numPixels * bytesPerPixel)
+    for i in range(bytesPerPixel):
+        result[i::bytesPerPixel] = data[i::4]
+
+    return bytes(result)
+
+
+def getChannelStats(data):
+    """
+    Gather the statistics of RGBA8 pixels used to find a smaller format holding them losslessly.
+    Returns (values, gray): the frozenset of the values of each of the R, G, B and A channels,
+    and whether R, G and B are equal in every pixel.
+    """
+
+    data = bytes(data[:len(data) // 4 * 4])
+    red, green, blue = data[0::4], data[1::4], data[2::4]
+
+    return tuple(frozenset(data[i::4]) for i in range(4)), red == green == blue
 
-    new_data = bytearray(numPixels * 4)
 
-    for i in range(numPixels):
-        pixel = (
-            (data[4 * i + 3] << 24) |
-            (data[4 * i + 2] << 16) |
-            (data[4 * i + 1] << 8) |
-            data[4 * i + 0]
-        )
+def remapPixels(data, remap, bytesPerPixel, out=None):
+    """
+    Apply a plan returned by getRemapPlan() or getCompSelPlan() to every little endian pixel of data.
+    The whole buffer is processed at once as a single integer, masking and shifting
+    the bitfields of all of the pixels together.
+    out: writable buffer to write the result into and return (can be data itself),
+         a new bytes object if None
+    """
 
-        if format_ == 'bgr10a2':
-            new_pixel = _swapRB_bgr10a2(pixel)
+    fields, const = remap
+    size = len(data) // bytesPerPixel * bytesPerPixel
+    numPixels = size // bytesPerPixel
+
+    pixels = int.from_bytes(data[:size], 'little')
+
+    # Bitfields moved by the same amount are moved together
+    masks = {}
+    for srcShift, mask, dstShift in fields:
+        masks[dstShift - srcShift] = masks.get(dstShift - srcShift, 0) | (mask << srcShift)
+
+    result = int.from_bytes(const.to_bytes(bytesPerPixel, 'little') * numPixels, 'little')
+    for shift, mask in masks.items():
+        bitfields = pixels & int.from_bytes(mask.to_bytes(bytesPerPixel, 'little') * numPixels, 'little')
+
+        if shift >= 0:
+            result |= bitfields << shift
 
         else:
-            new_pixel = _swapRB_rgba8(pixel)
+            result |= bitfields >> -shift
 
-        new_data[4 * i + 3] = (new_pixel & 0xFF000000) >> 24
-        new_data[4 * i + 2] = (new_pixel & 0xFF0000) >> 16
-        new_data[4 * i + 1] = (new_pixel & 0xFF00) >> 8
-        new_data[4 * i + 0] = new_pixel & 0xFF
+    result = result.to_bytes(size, 'little')
 
-    return bytes(new_data)
+    if out is None:
+        return result
+
+    out[:size] = result
+    return out
+
+
+tables16 = {}
+tables16Lock = threading.Lock()
+
+
+def getTable16(*conversions):
+    """
+    Translation table of the 16 bpp conversions (names from remapConversions, applied one after the other)
+    giving the converted value of each of the 65536 possible pixels, as bytes holding little endian uint16s.
+    Built on first use and cached; tables are immutable, so they can be shared between threads.
+    """
+
+    table = tables16.get(conversions)
+    if table is None:
+        if any(remapConversions[name][1] != 16 for name in conversions):
+            raise ValueError("Only 16 bpp conversions have translation tables")
+
+        with tables16Lock:
+            table = tables16.get(conversions)
+            if table is None:
+                table = remapPixels(b''.join(pixel.to_bytes(2, 'little') for pixel in range(0x10000)),
+                                    getRemapPlan(*conversions), 2)
+
+                tables16[conversions] = table
+
+    return table
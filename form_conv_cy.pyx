@@ -7,188 +7,171 @@
 ################################################################
 
 from cpython cimport array
+from cpython.bytes cimport PyBytes_FromStringAndSize, PyBytes_AS_STRING
+cimport cython
 from cython cimport view
-from libc.stdlib cimport malloc, free
+
+# The remap plans and the 16 bpp tables are built once in Python
+from form_conv import (remapConversions, getRemapPlan, getTable16, formatComponents, getCompSelPlan, getRGBA8Plan,
+                       resizeBitfield)
+
+# The whole image conversions to and from RGBA8, the channel statistics and the compSel remaps
+# are vectorized with NumPy when it's available
+try:
+    from form_conv_np import toRGBA8, fromRGBA8, getChannelStats, remapPixels
+
+except ImportError:
+    from form_conv import toRGBA8, fromRGBA8, getChannelStats, remapPixels
 
 
 ctypedef unsigned char u8
 ctypedef unsigned short u16
 ctypedef unsigned int u32
 
+ctypedef u32 (*swapRB32_t)(u32) noexcept nogil
+
 
 cpdef bytes rgb8torgbx8(bytearray data):
     cdef:
         u32 numPixels = len(data) // 3
 
-        u8 *new_data = <u8 *>malloc(numPixels * 4)
+        bytes result = PyBytes_FromStringAndSize(NULL, numPixels * 4)
+        u8 *new_data = <u8 *>PyBytes_AS_STRING(result)
         u32 i
 
-    try:
-        for i in range(numPixels):
-            new_data[4 * i + 0] = data[3 * i + 0]
-            new_data[4 * i + 1] = data[3 * i + 1]
-            new_data[4 * i + 2] = data[3 * i + 2]
-            new_data[4 * i + 3] = 0xFF
-
-        return bytes(<u8[:numPixels * 4]>new_data)
-
-    finally:
-        free(new_data)
-
+    for i in range(numPixels):
+        new_data[4 * i + 0] = data[3 * i + 0]
+        new_data[4 * i + 1] = data[3 * i + 1]
+        new_data[4 * i + 2] = data[3 * i + 2]
+        new_data[4 * i + 3] = 0xFF
 
-cdef u16 _swapRB_rgb565(u16 pixel):
-    cdef:
-        u8 red = pixel & 0x1F
-        u8 green = (pixel & 0x7E0) >> 5
-        u8 blue = (pixel & 0xF800) >> 11
+    return result
 
-    return <u16>((red << 11) | (green << 5) | blue)
 
+cdef u8 *outputBuffer(u8[::1] out, u32 size) except? NULL:
+    if <u32>out.shape[0] < size:
+        raise ValueError("out is smaller than data!")
 
-cdef u16 _swapRB_rgb5a1(u16 pixel):
-    cdef:
-        u8 red = pixel & 0x1F
-        u8 green = (pixel & 0x3E0) >> 5
-        u8 blue = (pixel & 0x7c00) >> 10
-        u8 alpha = (pixel & 0x8000) >> 15
+    if not size:
+        return NULL
 
-    return <u16>((alpha << 15) | (red << 10) | (green << 5) | blue)
+    return &out[0]
 
 
-cdef u16 _swapRB_rgba4(u16 pixel):
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef object lookup16(const u8[::1] data, const u8[::1] table, object out):
     cdef:
-        u8 red = pixel & 0xF
-        u8 green = (pixel & 0xF0) >> 4
-        u8 blue = (pixel & 0xF00) >> 8
-        u8 alpha = (pixel & 0xF000) >> 12
+        u32 numPixels = data.shape[0] // 2
 
-    return <u16>((alpha << 12) | (red << 8) | (green << 4) | blue)
+        object result = out
+        u8 *new_data
+        u32 i, pixel
 
+    if table.shape[0] != 0x20000:
+        raise ValueError("Invalid 16 bpp translation table!")
 
-cdef u16 _swapRB_argb4(u16 pixel):
-    cdef:
-        u8 alpha = pixel & 0xF
-        u8 red = (pixel & 0xF0) >> 4
-        u8 green = (pixel & 0xF00) >> 8
-        u8 blue = (pixel & 0xF000) >> 12
+    if out is None:
+        result = PyBytes_FromStringAndSize(NULL, numPixels * 2)
+        new_data = <u8 *>PyBytes_AS_STRING(result)
 
-    return <u16>((red << 12) | (green << 8) | (blue << 4) | alpha)
+    else:
+        new_data = outputBuffer(out, numPixels * 2)
 
+    for i in range(numPixels):
+        pixel = (
+            (data[2 * i + 1] << 8) |
+            data[2 * i + 0]
+        )
 
-cpdef bytes swapRB_16bpp(bytes data, str format_):
-    cdef:
-        u32 numPixels = len(data) // 2
+        new_data[2 * i + 1] = table[2 * pixel + 1]
+        new_data[2 * i + 0] = table[2 * pixel + 0]
 
-        u8 *new_data = <u8 *>malloc(numPixels * 2)
-        u16 pixel, new_pixel
-        u32 i
-
-    try:
-        for i in range(numPixels):
-            pixel = (
-                (data[2 * i + 1] << 8) |
-                data[2 * i + 0]
-            )
+    return result
 
-            if format_ == 'rgb565':
-                new_pixel = _swapRB_rgb565(pixel)
 
-            elif format_ == 'rgb5a1':
-                new_pixel = _swapRB_rgb5a1(pixel)
+cpdef swapRB_16bpp(const u8[::1] data, str format_, object out=None):
+    """
+    out: writable buffer to write the result into and return (can be data itself),
+         a new bytes object if None
+    """
 
-            elif format_ == 'rgba4':
-                new_pixel = _swapRB_rgba4(pixel)
+    if format_ not in ['rgb565', 'rgb5a1', 'rgba4']:
+        format_ = 'argb4'
 
-            else:
-                new_pixel = _swapRB_argb4(pixel)
+    return lookup16(data, getTable16(format_), out)
 
-            new_data[2 * i + 1] = (new_pixel & 0xFF00) >> 8
-            new_data[2 * i + 0] = new_pixel & 0xFF
 
-        return bytes(<u8[:numPixels * 2]>new_data)
+cpdef rgba4_to_argb4(const u8[::1] data, object out=None):
+    """
+    out: writable buffer to write the result into and return (can be data itself),
+         a new bytes object if None
+    """
 
-    finally:
-        free(new_data)
+    return lookup16(data, getTable16('rgba4_to_argb4'), out)
 
 
-cpdef bytes rgba4_to_argb4(bytes data):
-    cdef:
-        u32 numPixels = len(data) // 2
-
-        u8 *new_data = <u8 *>malloc(numPixels * 2)
-        u8 alpha
-        u16 rgb, pixel, new_pixel
-        u32 i
-
-    try:
-        for i in range(numPixels):
-            pixel = (
-                (data[2 * i + 1] << 8) |
-                data[2 * i + 0]
-            )
-
-            rgb = (pixel & 0xFFF)
-            alpha = (pixel & 0xF000) >> 12
-
-            new_pixel = (rgb << 4) | alpha
-
-            new_data[2 * i + 1] = (new_pixel & 0xFF00) >> 8
-            new_data[2 * i + 0] = new_pixel & 0xFF
-
-        return bytes(<u8[:numPixels * 2]>new_data)
-
-    finally:
-        free(new_data)
-
-
-cdef u32 _swapRB_bgr10a2(u32 pixel):
+cdef u32 _swapRB_bgr10a2(u32 pixel) noexcept nogil:
     cdef:
         u16 red = (pixel & 0x3FF00000) >> 20
         u16 green = (pixel & 0xFFC00) >> 10
         u16 blue = pixel & 0x3FF
-        u8 alpha = (pixel & 0xC0000000) >> 30
+        u8 alpha = (pixel & 0xC0000000U) >> 30
 
     return <u32>((alpha << 30) | (blue << 20) | (green << 10) | red)
 
 
-cdef u32 _swapRB_rgba8(u32 pixel):
+cdef u32 _swapRB_rgba8(u32 pixel) noexcept nogil:
     cdef:
         u8 red = pixel & 0xFF
         u8 green = (pixel & 0xFF00) >> 8
         u8 blue = (pixel & 0xFF0000) >> 16
-        u8 alpha = (pixel & 0xFF000000) >> 24
+        u8 alpha = (pixel & 0xFF000000U) >> 24
 
     return <u32>((alpha << 24) | (red << 16) | (green << 8) | blue)
 
 
-cpdef bytes swapRB_32bpp(bytes data, str format_):
+cpdef swapRB_32bpp(const u8[::1] data, str format_, object out=None):
+    """
+    out: writable buffer to write the result into and return (can be data itself),
+         a new bytes object if None
+    """
+
     cdef:
-        u32 numPixels = len(data) // 4
+        u32 numPixels = data.shape[0] // 4
 
-        u8 *new_data = <u8 *>malloc(numPixels * 4)
+        object result = out
+        u8 *new_data
         u32 i, pixel, new_pixel
+        swapRB32_t swapRB
+
+    # Dispatch on the format once, not for every pixel
+    if format_ == 'bgr10a2':
+        swapRB = _swapRB_bgr10a2
+
+    else:
+        swapRB = _swapRB_rgba8
 
-    try:
-        for i in range(numPixels):
-            pixel = (
-                (data[4 * i + 3] << 24) |
-                (data[4 * i + 2] << 16) |
-                (data[4 * i + 1] << 8) |
-                data[4 * i + 0]
-            )
+    if out is None:
+        result = PyBytes_FromStringAndSize(NULL, numPixels * 4)
+        new_data = <u8 *>PyBytes_AS_STRING(result)
 
-            if format_ == 'bgr10a2':
-                new_pixel = _swapRB_bgr10a2(pixel)
+    else:
+        new_data = outputBuffer(out, numPixels * 4)
 
-            else:
-                new_pixel = _swapRB_rgba8(pixel)
+    for i in range(numPixels):
+        pixel = (
+            (data[4 * i + 3] << 24) |
+            (data[4 * i + 2] << 16) |
+            (data[4 * i + 1] << 8) |
+            data[4 * i + 0]
+        )
 
-            new_data[4 * i + 3] = (new_pixel & 0xFF000000) >> 24
-            new_data[4 * i + 2] = (new_pixel & 0xFF0000) >> 16
-            new_data[4 * i + 1] = (new_pixel & 0xFF00) >> 8
-            new_data[4 * i + 0] = new_pixel & 0xFF
+        new_pixel = swapRB(pixel)
 
-        return bytes(<u8[:numPixels * 4]>new_data)
+        new_data[4 * i + 3] = (new_pixel & 0xFF000000U) >> 24
+        new_data[4 * i + 2] = (new_pixel & 0xFF0000) >> 16
+        new_data[4 * i + 1] = (new_pixel & 0xFF00) >> 8
+        new_data[4 * i + 0] = new_pixel & 0xFF
 
-    finally:
-        free(new_data)
+    return result
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright © 2016-2018 AboodXD
+
+################################################################
+################################################################
+
+import numpy as np
+
+from form_conv import (remapConversions, getRemapPlan, getTable16, formatComponents, getCompSelPlan, getRGBA8Plan,
+                       getQuantizeInfo, resizeBitfield)
+
+
+def rgb8torgbx8(data):
+    data = np.frombuffer(data, np.uint8)
+    numPixels = len(data) // 3
+
+    new_data = np.full((numPixels, 4), 0xFF, np.uint8)
+    new_data[:, :3] = data[:numPixels * 3].reshape(numPixels, 3)
+
+    return new_data.tobytes()
+
+
+def swapRB_16bpp(data, format_, out=None):
+    """
+    out: writable buffer to write the result into and return (can be data itself),
+         a new bytes object if None
+    """
+
+    if format_ not in ['rgb565', 'rgb5a1', 'rgba4']:
+        format_ = 'argb4'
+
+    return lookup16(data, getTable16(format_), out)
+
+
+def rgba4_to_argb4(data, out=None):
+    """
+    out: writable buffer to write the result into and return (can be data itself),
+         a new bytes object if None
+    """
+
+    return lookup16(data, getTable16('rgba4_to_argb4'), out)
+
+
+def swapRB_32bpp(data, format_, out=None):
+    """
+    out: writable buffer to write the result into and return (can be data itself),
+         a new bytes object if None
+    """
+
+    if format_ != 'bgr10a2':
+        format_ = 'rgba8'
+
+    return remapPixels(data, getRemapPlan(format_), 4, out)
+
+
+def toRGBA8(data, format_, compSel):
+    """
+    Convert the pixels of the uncompressed GX2 format format_ to RGBA8, see form_conv.getRGBA8Plan().
+    Returns a bytes-like object, data itself if it's already RGBA8.
+    """
+
+    remap = getRGBA8Plan(format_, tuple(compSel))
+    bytesPerPixel = formatComponents[format_][0] // 8
+
+    if bytesPerPixel == 4 and remap == (((0, 0xFFFFFFFF, 0),), 0):
+        return data
+
+    data = np.frombuffer(data, np.uint8)
+    numPixels = len(data) // bytesPerPixel
+
+    widened = np.zeros((numPixels, 4), np.uint8)
+    widened[:, :bytesPerPixel] = data[:numPixels * bytesPerPixel].reshape(numPixels, bytesPerPixel)
+
+    return remapPixels(widened, remap, 4)
+
+
+def fromRGBA8(data, format_, compSel):
+    """
+    Convert RGBA8 pixels to the uncompressed GX2 format format_, see form_conv.fromRGBA8(),
+    rounding and packing all of the pixels at once.
+    Returns the converted pixels as bytes.
+    """
+
+    bitsPerPixel, channels = getQuantizeInfo(format_, tuple(compSel))
+    elemType = np.dtype('<u%d' % (bitsPerPixel // 8))
+
+    data = np.frombuffer(data, np.uint8)
+    pixels = data[:len(data) // 4 * 4].reshape(-1, 4).astype(np.uint32)
+
+    result = np.zeros(len(pixels), np.uint32)
+    for channel, shift, width in channels:
+        if channel is None:
+            value = (1 << width) - 1
+
+        elif width < 8:
+            value = (pixels[:, channel] * ((1 << width) - 1) + 127) // 255
+
+        else:
+            value = resizeBitfield(pixels[:, channel], 8, width)
+
+        result |= np.asarray(value, np.uint32) << np.uint32(shift)
+
+    return result.astype(elemType).tobytes()
+
+
+def getChannelStats(data):
+    """
+    Gather the statistics of RGBA8 pixels used to find a smaller format holding them losslessly,
+    see form_conv.getChannelStats(), with a histogram of each channel.
+    """
+
+    data = np.frombuffer(data, np.uint8)
+    pixels = data[:len(data) // 4 * 4].reshape(-1, 4)
+
+    values = tuple(frozenset(np.flatnonzero(np.bincount(pixels[:, i], minlength=256)).tolist()) for i in range(4))
+    gray = np.array_equal(pixels[:, 0], pixels[:, 1]) and np.array_equal(pixels[:, 1], pixels[:, 2])
+
+    return values, bool(gray)
+
+
+def output(result, out):
+    if out is None:
+        return result.tobytes()
+
+    result_ = np.frombuffer(out, np.uint8)
+    if not result_.flags.writeable:
+        raise BufferError("out is not writable")
+
+    result_[:result.nbytes] = result.view(np.uint8)
+    return out
+
+
+def lookup16(data, table, out=None):
+    """
+    Convert every little endian 16 bpp pixel of data with a table returned by getTable16(),
+    using a single take.
+    out: writable buffer to write the result into and return (can be data itself),
+         a new bytes object if None
+    """
+
+    data = np.frombuffer(data, np.uint8)
+    pixels = data[:len(data) // 2 * 2].view('<u2')
+
+    return output(np.frombuffer(table, '<u2').take(pixels), out)
+
+
+def remapPixels(data, remap, bytesPerPixel, out=None):
+    """
+    Apply a plan returned by getRemapPlan() to every little endian pixel of data,
+    shifting and masking uint16/uint32 views of the buffers.
+    out: writable buffer to write the result into and return (can be data itself),
+         a new bytes object if None
+    """
+
+    fields, const = remap
+    elemType = np.dtype('<u%d' % bytesPerPixel)
+
+    data = np.frombuffer(data, np.uint8)
+    size = len(data) // bytesPerPixel * bytesPerPixel
+    pixels = data[:size].view(elemType)
+
+    # Bitfields moved by the same amount are moved together
+    masks = {}
+    for srcShift, mask, dstShift in fields:
+        masks[dstShift - srcShift] = masks.get(dstShift - srcShift, 0) | (mask << srcShift)
+
+    result = np.full(len(pixels), const, elemType)
+    for shift, mask in masks.items():
+        bitfields = pixels & elemType.type(mask)
+
+        if shift >= 0:
+            result |= bitfields << elemType.type(shift)
+
+        else:
+            result |= bitfields >> elemType.type(-shift)
+
+    return output(result, out)
@@ -0,0 +1,451 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright © 2016-2018 AboodXD
+
+# Feel free to include this in your own program if you want, just give credits. :)
+
+"""png.py: Streaming RGBA8 PNG writer, compressing the image data across threads, and PNG reader."""
+
+import collections
+import os
+import struct
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+signature = b'\x89PNG\r\n\x1a\n'
+
+# Uncompressed size of the pieces of the image data compressed independently
+pieceSize = 0x40000
+
+# Number of samples of each color type
+channelCounts = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}
+
+
+class PNGError(ValueError):
+    """Raised when reading invalid or unsupported PNG files."""
+
+
+def writeChunk(f, type_, data):
+    f.write(struct.pack('>I', len(data)))
+    f.write(type_)
+    f.write(data)
+    f.write(struct.pack('>I', zlib.crc32(data, zlib.crc32(type_)) & 0xFFFFFFFF))
+
+    return len(data) + 12
+
+
+def adler32Combine(adler1, adler2, length2):
+    """
+    Combine the Adler-32 checksums of two buffers into the one of their concatenation (like zlib's adler32_combine()).
+    length2: length of the second buffer
+    """
+
+    base = 65521
+    rem = length2 % base
+
+    sum1 = adler1 & 0xFFFF
+    sum2 = (rem * sum1) % base
+    sum1 += (adler2 & 0xFFFF) + base - 1
+    sum2 += (adler1 >> 16) + (adler2 >> 16) + base - rem
+
+    return (sum1 % base) | ((sum2 % base) << 16)
+
+
+def zlibHeader(level):
+    # CMF: deflate with a 32K window, FLG: the compression level and the check bits
+    cmf = 0x78
+    flg = (0 if level in [0, 1] else 1 if level < 6 else 2 if level == 6 else 3) << 6
+
+    return bytes([cmf, flg | (31 - ((cmf << 8) | flg) % 31)])
+
+
+def compressPiece(piece, level):
+    """
+    Compress a piece of the image data to a raw deflate stream ending on a byte boundary (Z_SYNC_FLUSH),
+    so that the streams of consecutive pieces can be concatenated.
+    Runs in the threads of writePNG(), zlib releases the GIL while compressing.
+    Returns (compressed data, Adler-32 checksum of the piece, length of the piece).
+    """
+
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    compressed = compressor.compress(piece) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    return compressed, zlib.adler32(piece), len(piece)
+
+
+def iterPieces(width, bands):
+    """
+    Generator turning bands of RGBA8 rows into pieces of about pieceSize bytes of filtered scanlines.
+    Every scanline uses the filter type 0 (None).
+    """
+
+    rowSize = width * 4
+    rowsPerPiece = max(1, pieceSize // (rowSize + 1))
+
+    pending = b''
+    for band in bands:
+        band = memoryview(band).cast('B')
+        if pending:
+            band = memoryview(pending + band)
+
+        numRows = len(band) // rowSize
+
+        for y in range(0, numRows, rowsPerPiece):
+            rows = min(rowsPerPiece, numRows - y)
+
+            piece = bytearray(rows * (rowSize + 1))
+            for row in range(rows):
+                start = (y + row) * rowSize
+                piece[row * (rowSize + 1) + 1:(row + 1) * (rowSize + 1)] = band[start:start + rowSize]
+
+            yield piece
+
+        # Keep the partial row, if any, for the next band
+        pending = bytes(band[numRows * rowSize:])
+
+
+def writePNG(f, width, height, bands, level=6, threads=1):
+    """
+    Write a RGBA8 image as a PNG file, streaming its rows.
+    f: file object opened for writing in binary mode
+    bands: iterable of bytes-like objects holding the consecutive rows of the image, e.g. the bands of
+           addrlib.deswizzleBands() converted to RGBA8
+    level: zlib compression level (0 to 9)
+    threads: number of threads compressing the pieces of the image data in parallel (0 uses one per CPU)
+    The pieces are compressed independently and written as IDAT chunks in order, after a zlib header,
+    and followed by an empty final deflate block and the combined Adler-32 checksum of the pieces.
+    Returns the size of the file.
+    """
+
+    if not 0 <= level <= 9:
+        raise ValueError("Invalid compression level: " + str(level))
+
+    if threads <= 0:
+        threads = os.cpu_count() or 1
+
+    size = len(signature)
+    f.write(signature)
+
+    size += writeChunk(f, b'IHDR', struct.pack('>2I5B', width, height, 8, 6, 0, 0, 0))
+    size += writeChunk(f, b'IDAT', zlibHeader(level))
+
+    adler = 1
+
+    def writePiece(result):
+        nonlocal adler, size
+
+        compressed, pieceAdler, length = result
+        adler = adler32Combine(adler, pieceAdler, length)
+
+        if compressed:
+            size += writeChunk(f, b'IDAT', compressed)
+
+    if threads == 1:
+        for piece in iterPieces(width, bands):
+            writePiece(compressPiece(piece, level))
+
+    else:
+        # Keep a few pieces per thread in flight, writing them out in order
+        with ThreadPoolExecutor(threads) as executor:
+            futures = collections.deque()
+
+            for piece in iterPieces(width, bands):
+                futures.append(executor.submit(compressPiece, piece, level))
+
+                if len(futures) >= threads * 2:
+                    writePiece(futures.popleft().result())
+
+            while futures:
+                writePiece(futures.popleft().result())
+
+    # Empty final fixed Huffman block
+    size += writeChunk(f, b'IDAT', b'\x03\x00' + struct.pack('>I', adler))
+    size += writeChunk(f, b'IEND', b'')
+
+    return size
+
+
+def addBytes(a, b, size):
+    # Add two rows of size bytes byte per byte, modulo 256, as integers
+    low = int.from_bytes(b'\x7F' * size, 'little')
+    high = int.from_bytes(b'\x80' * size, 'little')
+
+    return ((a & low) + (b & low)) ^ ((a ^ b) & high)
+
+
+def unfilterRow(filterType, row, prior, bpp):
+    """
+    Reverse the filter of a scanline.
+    row: bytearray of the filtered scanline, unfiltered in place
+    prior: the previous unfiltered scanline (zeros for the first one)
+    bpp: number of bytes per complete pixel (at least 1)
+    """
+
+    size = len(row)
+
+    if filterType == 0:
+        pass
+
+    elif filterType == 1:
+        # Sub: prefix sums of the bytes of each channel, doubling the distance every pass
+        value = int.from_bytes(row, 'little')
+        mask = (1 << (size * 8)) - 1
+        distance = bpp
+        while distance < size:
+            value = addBytes(value, (value << (distance * 8)) & mask, size)
+            distance *= 2
+
+        row[:] = value.to_bytes(size, 'little')
+
+    elif filterType == 2:
+        value = addBytes(int.from_bytes(row, 'little'), int.from_bytes(prior, 'little'), size)
+        row[:] = value.to_bytes(size, 'little')
+
+    elif filterType == 3:
+        for i in range(bpp):
+            row[i] = (row[i] + (prior[i] >> 1)) & 0xFF
+
+        for i in range(bpp, size):
+            row[i] = (row[i] + ((row[i - bpp] + prior[i]) >> 1)) & 0xFF
+
+    elif filterType == 4:
+        for i in range(bpp):
+            row[i] = (row[i] + prior[i]) & 0xFF
+
+        for i in range(bpp, size):
+            a = row[i - bpp]
+            b = prior[i]
+            c = prior[i - bpp]
+            pa = abs(b - c)
+            pb = abs(a - c)
+            pc = abs(a + b - c - c)
+
+            if pa <= pb and pa <= pc:
+                row[i] = (row[i] + a) & 0xFF
+
+            elif pb <= pc:
+                row[i] = (row[i] + b) & 0xFF
+
+            else:
+                row[i] = (row[i] + c) & 0xFF
+
+    else:
+        raise PNGError("Invalid filter type: " + str(filterType))
+
+
+def unfilterImage(filtered, height, rowSize, bpp):
+    """
+    Reverse the filters of all the scanlines of an image, one scanline at a time with unfilterRow().
+    filtered: the decompressed image data, each scanline preceded by its filter type
+    rowSize: size of a scanline without its filter type
+    bpp: number of bytes per complete pixel (at least 1)
+    Returns a bytearray of the unfiltered scanlines.
+    """
+
+    unfiltered = bytearray(rowSize * height)
+    prior = bytearray(rowSize)
+
+    for y in range(height):
+        start = y * (rowSize + 1)
+        row = bytearray(filtered[start + 1:start + 1 + rowSize])
+        unfilterRow(filtered[start], row, prior, bpp)
+
+        unfiltered[y * rowSize:(y + 1) * rowSize] = row
+        prior = row
+
+    return unfiltered
+
+
+def applyColorKey(pixels, color):
+    """
+    Make the RGBA8 pixels of the given RGB color transparent, in place.
+    pixels: bytearray of RGBA8 pixels
+    color: bytes of the 3 channels of the color
+    """
+
+    for i in range(len(pixels) // 4):
+        if pixels[i * 4:i * 4 + 3] == color:
+            pixels[i * 4 + 3] = 0
+
+
+def toSamples(row, width, bitDepth, channels):
+    """
+    Unpack the samples of an unfiltered scanline to one byte each.
+    Samples of 16 bits keep their most significant byte, the ones of 1, 2 or 4 bits are returned as is.
+    """
+
+    if bitDepth == 8:
+        return row
+
+    if bitDepth == 16:
+        return row[::2]
+
+    perByte = 8 // bitDepth
+    mask = (1 << bitDepth) - 1
+
+    samples = bytearray(len(row) * perByte)
+    for i in range(perByte):
+        shift = 8 - bitDepth * (i + 1)
+        samples[i::perByte] = row.translate(bytes((value >> shift) & mask for value in range(256)))
+
+    return samples[:width * channels]
+
+
+def readPNG(data):
+    """
+    Read a PNG file to RGBA8 pixels.
+    Supports every color type and bit depth of non-interlaced images, 16 bits samples are truncated to 8 bits,
+    grayscale samples of less than 8 bits are scaled up, and the transparency of tRNS chunks is applied.
+    data: the whole file
+    Returns (width, height, pixels).
+    Raises PNGError if the file is invalid or interlaced.
+    """
+
+    if data[:8] != signature:
+        raise PNGError("Invalid PNG file!")
+
+    pos = 8
+    header = palette = transparency = None
+    compressed = []
+
+    while True:
+        if pos + 8 > len(data):
+            raise PNGError("Truncated PNG file!")
+
+        length, type_ = struct.unpack_from('>I4s', data, pos)
+        chunk = data[pos + 8:pos + 8 + length]
+        if len(chunk) != length or pos + 12 + length > len(data):
+            raise PNGError("Truncated PNG file!")
+
+        if struct.unpack_from('>I', data, pos + 8 + length)[0] != zlib.crc32(chunk, zlib.crc32(type_)) & 0xFFFFFFFF:
+            raise PNGError("Corrupted chunk: " + type_.decode('latin-1'))
+
+        pos += length + 12
+
+        if type_ == b'IHDR':
+            header = struct.unpack('>2I5B', chunk)
+
+        elif type_ == b'PLTE':
+            palette = chunk
+
+        elif type_ == b'tRNS':
+            transparency = chunk
+
+        elif type_ == b'IDAT':
+            compressed.append(chunk)
+
+        elif type_ == b'IEND':
+            break
+
+        elif not type_[0] & 0x20:
+            raise PNGError("Unsupported critical chunk: " + type_.decode('latin-1'))
+
+    if header is None:
+        raise PNGError("Missing IHDR chunk!")
+
+    width, height, bitDepth, colorType, compression, filterMethod, interlace = header
+
+    if colorType not in channelCounts or bitDepth not in ([8, 16] if colorType in [2, 4, 6] else [1, 2, 4, 8, 16])\
+            or (colorType == 3 and bitDepth == 16) or compression or filterMethod:
+        raise PNGError("Invalid color type %d and bit depth %d!" % (colorType, bitDepth))
+
+    if not width or not height:
+        raise PNGError("Invalid image size %dx%d!" % (width, height))
+
+    if interlace:
+        raise PNGError("Interlaced PNG files are not supported!")
+
+    if colorType == 3 and palette is None:
+        raise PNGError("Missing PLTE chunk!")
+
+    channels = channelCounts[colorType]
+    rowSize = (width * channels * bitDepth + 7) // 8
+    bpp = max(1, channels * bitDepth // 8)
+
+    try:
+        filtered = zlib.decompress(b''.join(compressed))
+
+    except zlib.error as e:
+        raise PNGError("Invalid image data: " + str(e))
+
+    if len(filtered) < (rowSize + 1) * height:
+        raise PNGError("Truncated image data!")
+
+    for filterType in set(filtered[:(rowSize + 1) * height:rowSize + 1]):
+        if filterType > 4:
+            raise PNGError("Invalid filter type: " + str(filterType))
+
+    # Unfilter the scanlines and unpack their samples to bytes
+    unfiltered = unfilterImage(filtered, height, rowSize, bpp)
+
+    if bitDepth == 8:
+        samples = unfiltered
+
+    else:
+        samples = bytearray(width * channels * height)
+        sampleRowSize = width * channels
+
+        for y in range(height):
+            row = unfiltered[y * rowSize:(y + 1) * rowSize]
+            samples[y * sampleRowSize:(y + 1) * sampleRowSize] = toSamples(row, width, bitDepth, channels)
+
+    numPixels = width * height
+    pixels = bytearray(numPixels * 4)
+
+    if colorType == 3:
+        # Palette entries as RGBA8, opaque unless tRNS says otherwise
+        entries = bytearray(256 * 4)
+        for i in range(min(256, len(palette) // 3)):
+            entries[i * 4:i * 4 + 3] = palette[i * 3:i * 3 + 3]
+            entries[i * 4 + 3] = transparency[i] if transparency is not None and i < len(transparency) else 255
+
+        for i in range(4):
+            pixels[i::4] = samples.translate(bytes(entries[i::4]))
+
+        return width, height, bytes(pixels)
+
+    if colorType in [0, 4] and bitDepth < 8:
+        samples = samples.translate(bytes(value * 255 // ((1 << bitDepth) - 1) & 0xFF for value in range(256)))
+
+    if colorType in [0, 4]:
+        for i in range(3):
+            pixels[i::4] = samples[::channels]
+
+    else:
+        for i in range(3):
+            pixels[i::4] = samples[i::channels]
+
+    if colorType in [4, 6]:
+        pixels[3::4] = samples[channels - 1::channels]
+
+    else:
+        pixels[3::4] = b'\xFF' * numPixels
+
+        if transparency is not None:
+            # The single color made transparent, compared on the most significant byte of 16 bits samples
+            key = struct.unpack('>%dH' % channels, transparency[:channels * 2])
+            if bitDepth == 16:
+                key = [value >> 8 for value in key]
+
+            elif bitDepth < 8:
+                key = [value * 255 // ((1 << bitDepth) - 1) for value in key]
+
+            applyColorKey(pixels, bytes(key * 3 if channels == 1 else key))
+
+    return width, height, bytes(pixels)
+
+
+# Unfilter the scanlines and apply the color key with Cython or NumPy when they're available
+try:
+    import pyximport
+
+    pyximport.install()
+    from png_cy import unfilterImage, applyColorKey
+
+except ImportError:
+    try:
+        from png_np import unfilterImage, applyColorKey
+
+    except ImportError:
+        pass
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright © 2016-2018 AboodXD
+
+# Feel free to include this in your own program if you want, just give credits. :)
+
+"""png_cy.pyx: Cython versions of the per-byte loops of the PNG reader."""
+
+cimport cython
+
+
+ctypedef unsigned char u8
+ctypedef unsigned int u32
+
+
+cdef inline int paeth(int a, int b, int c) noexcept nogil:
+    cdef:
+        int pa = abs(b - c)
+        int pb = abs(a - c)
+        int pc = abs(a + b - c - c)
+
+    if pa <= pb and pa <= pc:
+        return a
+
+    elif pb <= pc:
+        return b
+
+    return c
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cpdef bytearray unfilterImage(const u8[::1] filtered, u32 height, u32 rowSize, u32 bpp):
+    """
+    Reverse the filters of all the scanlines of an image.
+    filtered: the decompressed image data, each scanline preceded by its filter type (all of them valid)
+    rowSize: size of a scanline without its filter type
+    bpp: number of bytes per complete pixel (at least 1)
+    Returns a bytearray of the unfiltered scanlines.
+    """
+
+    cdef:
+        bytearray result = bytearray(rowSize * height)
+        u8[::1] unfiltered = result
+
+        # Prior scanline of the first one
+        bytearray zeros = bytearray(rowSize)
+        u8[::1] zeroRow = zeros
+
+        const u8 *row
+        u8 *out
+        u8 *prior
+        u32 y, i
+        u8 filterType
+
+    if <u32>filtered.shape[0] < (rowSize + 1) * height:
+        raise ValueError("Truncated image data!")
+
+    if not rowSize or not height:
+        return result
+
+    with nogil:
+        for y in range(height):
+            filterType = filtered[y * (rowSize + 1)]
+            row = &filtered[y * (rowSize + 1) + 1]
+            out = &unfiltered[y * rowSize]
+            prior = &unfiltered[(y - 1) * rowSize] if y else &zeroRow[0]
+
+            # The first pixel has no left neighbor
+            for i in range(min(bpp, rowSize)):
+                if filterType == 2 or filterType == 4:
+                    out[i] = row[i] + prior[i]
+
+                elif filterType == 3:
+                    out[i] = row[i] + (prior[i] >> 1)
+
+                else:
+                    out[i] = row[i]
+
+            if filterType == 1:
+                for i in range(bpp, rowSize):
+                    out[i] = row[i] + out[i - bpp]
+
+            elif filterType == 2:
+                for i in range(bpp, rowSize):
+                    out[i] = row[i] + prior[i]
+
+            elif filterType == 3:
+                for i in range(bpp, rowSize):
+                    out[i] = row[i] + ((out[i - bpp] + prior[i]) >> 1)
+
+            elif filterType == 4:
+                for i in range(bpp, rowSize):
+                    out[i] = row[i] + paeth(out[i - bpp], prior[i], prior[i - bpp])
+
+            else:
+                for i in range(bpp, rowSize):
+                    out[i] = row[i]
+
+    return result
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cpdef applyColorKey(u8[::1] pixels, const u8[::1] color):
+    """
+    Make the RGBA8 pixels of the given RGB color transparent, in place.
+    pixels: bytearray of RGBA8 pixels
+    color: bytes of the 3 channels of the color
+    """
+
+    cdef Py_ssize_t i
+
+    if color.shape[0] < 3:
+        raise ValueError("Invalid color key!")
+
+    with nogil:
+        for i in range(0, pixels.shape[0] - 3, 4):
+            if pixels[i] == color[0] and pixels[i + 1] == color[1] and pixels[i + 2] == color[2]:
+                pixels[i + 3] = 0
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright © 2016-2018 AboodXD
+
+# Feel free to include this in your own program if you want, just give credits. :)
+
+"""png_np.py: NumPy versions of the per-byte loops of the PNG reader."""
+
+import numpy as np
+
+# Number of scanlines unfiltered together by unfilterImage()
+stripHeight = 512
+
+
+def unfilterImage(filtered, height, rowSize, bpp):
+    """
+    Reverse the filters of all the scanlines of an image.
+    filtered: the decompressed image data, each scanline preceded by its filter type (all of them valid)
+    rowSize: size of a scanline without its filter type, a multiple of bpp
+    bpp: number of bytes per complete pixel (at least 1)
+    Every pixel only depends on its left, upper and upper left neighbors, so the pixels of each
+    antidiagonal of the image are unfiltered at once, from the top left corner to the bottom right one.
+    Returns a bytearray of the unfiltered scanlines.
+    """
+
+    width = rowSize // bpp
+
+    rows = np.frombuffer(filtered, np.uint8, (rowSize + 1) * height).reshape(height, rowSize + 1)
+    filterTypes = rows[:, :1].astype(np.int16)
+    raw = rows[:, 1:].reshape(height, width, bpp)
+
+    unfiltered = np.empty((height, width, bpp), np.uint8)
+    prior = np.zeros((width, bpp), np.int16)
+
+    for top in range(0, height, stripHeight):
+        numRows = min(stripHeight, height - top)
+
+        # Skew the strip so that the pixel (x, y) is at [x + y + 2, y + 1] and each antidiagonal is contiguous,
+        # with the prior scanline at [x + 1, 0] and zeros left of the strip
+        skewed = np.zeros((width + numRows + 1, numRows + 1, bpp), np.int16)
+        skewedRaw = np.zeros_like(skewed)
+
+        skewed[1:width + 1, 0] = prior
+        for y in range(numRows):
+            skewedRaw[y + 2:y + 2 + width, y + 1] = raw[top + y]
+
+        for diagonal in range(2, width + numRows + 1):
+            first = max(0, diagonal - width - 1)
+            last = min(numRows - 1, diagonal - 2)
+
+            types = filterTypes[top + first:top + last + 1]
+            a = skewed[diagonal - 1, first + 1:last + 2]
+            b = skewed[diagonal - 1, first:last + 1]
+            c = skewed[diagonal - 2, first:last + 1]
+
+            pa = np.abs(b - c)
+            pb = np.abs(a - c)
+            pc = np.abs(a + b - c - c)
+            paeth = np.where((pa <= pb) & (pa <= pc), a, np.where(pb <= pc, b, c))
+
+            predictor = np.where(types == 1, a, np.where(types == 2, b, np.where(types == 3, (a + b) >> 1,
+                                                                                  np.where(types == 4, paeth, 0))))
+
+            skewed[diagonal, first + 1:last + 2] = (skewedRaw[diagonal, first + 1:last + 2] + predictor) & 0xFF
+
+        for y in range(numRows):
+            unfiltered[top + y] = skewed[y + 2:y + 2 + width, y + 1]
+
+        prior = skewed[numRows + 1:numRows + 1 + width, numRows]
+
+    return bytearray(unfiltered.tobytes())
+
+
+def applyColorKey(pixels, color):
+    """
+    Make the RGBA8 pixels of the given RGB color transparent, in place.
+    pixels: bytearray of RGBA8 pixels
+    color: bytes of the 3 channels of the color
+    """
+
+    pixels = np.frombuffer(pixels, np.uint8).reshape(-1, 4)
+    pixels[(pixels[:, :3] == np.frombuffer(color, np.uint8)).all(1), 3] = 0
@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Image fixtures shared by the tests.
+
+import io
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import png
+
+
+def makeImage(width, height, pixel):
+    """
+    Make a width x height RGBA8 image, calling pixel(x, y) for the channels of each pixel.
+    """
+
+    return b''.join(bytes(pixel(x, y)) for y in range(height) for x in range(width))
+
+
+def makeGradient(width, height, seed=0):
+    """
+    Make a width x height RGBA8 image of smooth gradients in every channel.
+    """
+
+    return makeImage(width, height, lambda x, y: ((x * 3 + y + seed) & 0xFF, (255 - x * 2 - seed) & 0xFF,
+                                                  (y * 3) & 0xFF, (x + y * 2) & 0xFF))
+
+
+def encodePNG(width, height, pixels):
+    """
+    Write RGBA8 pixels to a PNG file in memory and return its bytes.
+    """
+
+    f = io.BytesIO()
+    png.writePNG(f, width, height, [pixels])
+
+    return f.getvalue()
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Decoding of known BC1-BC5 and ETC1 blocks, and the error of encoding then decoding images,
+# checked for every available bcn backend.
+
+import math
+import os
+import struct
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tests.images import makeGradient
+
+backends = {}
+
+try:
+    import pyximport
+
+    pyximport.install()
+    import bcn_cy
+    backends['cython'] = bcn_cy
+
+except ImportError:
+    pass
+
+try:
+    import bcn_np
+    backends['numpy'] = bcn_np
+
+except ImportError:
+    pass
+
+# BC1: color0 = red, color1 = blue, index i % 4 for the pixel i
+bc1Block = bytes.fromhex('00f81f00e4e4e4e4')
+bc1Palette = [(255, 0, 0, 255), (0, 0, 255, 255), (170, 0, 85, 255), (85, 0, 170, 255)]
+
+# BC1 with color0 <= color1: 3 colors and transparent black
+bc1PunchThroughBlock = bytes.fromhex('1f0000f8e4e4e4e4')
+bc1PunchThroughPalette = [(0, 0, 255, 255), (255, 0, 0, 255), (127, 0, 127, 255), (0, 0, 0, 0)]
+
+# BC4: 200 and 100 with 6 interpolated values, index i % 8 for the pixel i
+bc4Block = bytes.fromhex('c86488c6fa88c6fa')
+bc4Palette = [200, 100, 185, 171, 157, 142, 128, 114]
+
+# BC3 alpha: 50 and 150 with 4 interpolated values, 0 and 255
+bc3AlphaBlock = bytes.fromhex('329688c6fa88c6fa')
+bc3AlphaPalette = [50, 150, 70, 90, 110, 130, 0, 255]
+
+# ETC1 individual mode, split vertically: (136, 68, 34) with the table 0 on the left, index 0 (+2),
+# (255, 0, 170) with the table 7 on the right, index 2 (-47)
+etc1IndividualBlock = struct.pack('>2I', 0x8F40_2A1C, 0xFF00_0000)
+
+# ETC1 differential mode, split horizontally: (132, 0, 255) on top, (156, 0, 222) at the bottom, index 0 (+2)
+etc1DifferentialBlock = struct.pack('>2I', (16 << 27) | (3 << 24) | (31 << 11) | (4 << 8) | 3, 0)
+
+
+width, height = 64, 64
+
+
+def psnr(a, b, channels):
+    squared = sum((a[i + c] - b[i + c]) ** 2 for i in range(0, len(a), 4) for c in channels)
+    mse = squared / (len(a) // 4 * len(channels))
+
+    return 10 * math.log10(255 ** 2 / mse) if mse else math.inf
+
+
+@unittest.skipUnless(backends, "NumPy or Cython is required")
+class DecodeTest(unittest.TestCase):
+    def decodeBlock(self, format_, block):
+        results = {name: backend.decode(format_, block, 4, 4) for name, backend in backends.items()}
+        self.assertEqual(len(set(results.values())), 1, format_)
+
+        pixels = next(iter(results.values()))
+        return [tuple(pixels[i * 4:i * 4 + 4]) for i in range(16)]
+
+    def test_bc1(self):
+        self.assertEqual(self.decodeBlock("BC1", bc1Block), [bc1Palette[i % 4] for i in range(16)])
+
+    def test_bc1_punch_through(self):
+        self.assertEqual(self.decodeBlock("BC1", bc1PunchThroughBlock),
+                         [bc1PunchThroughPalette[i % 4] for i in range(16)])
+
+    def test_bc2(self):
+        # 4 bits alpha value i for the pixel i, the color block always uses the 4 colors mode
+        alpha = struct.pack('<Q', sum(i << (4 * i) for i in range(16)))
+        palette = [(0, 0, 255), (255, 0, 0), (85, 0, 170), (170, 0, 85)]
+
+        self.assertEqual(self.decodeBlock("BC2", alpha + bc1PunchThroughBlock),
+                         [palette[i % 4] + (i * 17,) for i in range(16)])
+
+    def test_bc3(self):
+        self.assertEqual(self.decodeBlock("BC3", bc3AlphaBlock + bc1Block),
+                         [bc1Palette[i % 4][:3] + (bc3AlphaPalette[i % 8],) for i in range(16)])
+
+    def test_bc4(self):
+        self.assertEqual(self.decodeBlock("BC4U", bc4Block), [(bc4Palette[i % 8], 0, 0, 255) for i in range(16)])
+
+    def test_bc4_snorm(self):
+        # 127 and -127 with the indices 0, 1 and 7, converted to unsigned
+        block = bytes.fromhex('7f81c80100000000')
+        self.assertEqual(self.decodeBlock("BC4S", block)[:3], [(255, 0, 0, 255), (0, 0, 0, 255), (36, 0, 0, 255)])
+
+    def test_bc5(self):
+        self.assertEqual(self.decodeBlock("BC5U", bc4Block + bc3AlphaBlock),
+                         [(bc4Palette[i % 8], bc3AlphaPalette[i % 8], 0, 255) for i in range(16)])
+
+    def test_etc1_individual(self):
+        self.assertEqual(self.decodeBlock("ETC1", etc1IndividualBlock),
+                         [(138, 70, 36, 255) if i % 4 < 2 else (208, 0, 123, 255) for i in range(16)])
+
+    def test_etc1_differential(self):
+        self.assertEqual(self.decodeBlock("ETC1", etc1DifferentialBlock),
+                         [(134, 2, 255, 255) if i < 8 else (158, 2, 224, 255) for i in range(16)])
+
+    def test_partial_blocks(self):
+        # The pixels outside of the image are dropped
+        for name, backend in backends.items():
+            with self.subTest(backend=name):
+                pixels = backend.decode("BC1", bc1Block, 3, 2)
+                self.assertEqual(pixels, b''.join(bytes(bc1Palette[(y * 4 + x) % 4])
+                                                  for y in range(2) for x in range(3)))
+
+    def test_not_enough_data(self):
+        for name, backend in backends.items():
+            with self.subTest(backend=name):
+                with self.assertRaises(ValueError):
+                    backend.decode("BC3", bc1Block, 4, 4)
+
+
+@unittest.skipUnless(backends, "NumPy or Cython is required")
+class EncodeTest(unittest.TestCase):
+    # Minimum PSNR in dB of the channels each format stores, for the fast and the better quality
+    minimumPSNR = {
+        "BC1": ([0, 1, 2], 38, 39.5),
+        "BC3": ([0, 1, 2, 3], 39.5, 40.5),
+        "BC4U": ([0], 51, 51),
+        "BC5U": ([0, 1], 52, 54),
+        "ETC1": ([0, 1, 2], 38, 38),
+    }
+
+    def setUp(self):
+        self.gradient = makeGradient(width, height)
+
+        # Opaque, so that BC1 doesn't encode any pixel as transparent
+        opaque = bytearray(self.gradient)
+        opaque[3::4] = b'\xFF' * (width * height)
+        self.opaque = bytes(opaque)
+
+    def imageFor(self, format_):
+        return self.opaque if format_ == "BC1" else self.gradient
+
+    def test_error_bound(self):
+        for format_, (channels, fast, better) in self.minimumPSNR.items():
+            for quality, minimum in enumerate([fast, better]):
+                for name, backend in backends.items():
+                    with self.subTest(format=format_, quality=quality, backend=name):
+                        image = self.imageFor(format_)
+                        blocks = backend.encode(format_, image, width, height, quality)
+                        self.assertEqual(len(blocks), (width // 4) * (height // 4) * backend.blockSizes[format_])
+
+                        decoded = backend.decode(format_, blocks, width, height)
+                        self.assertGreaterEqual(psnr(image, decoded, channels), minimum)
+
+    def test_better_quality(self):
+        # The better quality never gives a larger error than the fast one
+        for format_, (channels, _, _) in self.minimumPSNR.items():
+            for name, backend in backends.items():
+                with self.subTest(format=format_, backend=name):
+                    image = self.imageFor(format_)
+                    errors = [psnr(image, backend.decode(format_, backend.encode(format_, image, width, height, quality),
+                                                         width, height), channels) for quality in [0, 1]]
+
+                    self.assertGreaterEqual(errors[1], errors[0])
+
+    def test_backends_match(self):
+        for format_ in self.minimumPSNR:
+            for quality in [0, 1]:
+                with self.subTest(format=format_, quality=quality):
+                    results = {name: backend.encode(format_, self.imageFor(format_), width, height, quality)
+                               for name, backend in backends.items()}
+
+                    self.assertEqual(len(set(results.values())), 1)
+
+    def test_punch_through(self):
+        # Pixels with an alpha < 128 become transparent black in BC1, the others stay opaque
+        image = bytearray(self.opaque)
+        image[3::4] = bytes(0 if i % 3 else 255 for i in range(width * height))
+
+        for name, backend in backends.items():
+            with self.subTest(backend=name):
+                decoded = backend.decode("BC1", backend.encode("BC1", image, width, height), width, height)
+
+                for i in range(width * height):
+                    if image[i * 4 + 3] < 128:
+                        self.assertEqual(decoded[i * 4:i * 4 + 4], bytes(4), i)
+
+                    else:
+                        self.assertEqual(decoded[i * 4 + 3], 255, i)
+
+    def test_constant_color(self):
+        # A color exactly representable in RGB565 is encoded without any error
+        image = bytes((0x84, 0x82, 0x08, 0xFF)) * (width * height)
+
+        for format_ in ["BC1", "BC3"]:
+            for name, backend in backends.items():
+                with self.subTest(format=format_, backend=name):
+                    blocks = backend.encode(format_, image, width, height)
+                    self.assertEqual(backend.decode(format_, blocks, width, height), image)
+
+    def test_partial_blocks(self):
+        # The partial blocks repeat the last row and column of the image
+        for name, backend in backends.items():
+            with self.subTest(backend=name):
+                image = self.gradient[:6 * 5 * 4]
+                blocks = backend.encode("BC4U", image, 6, 5)
+
+                self.assertEqual(len(blocks), 2 * 2 * 8)
+                self.assertEqual(len(backend.decode("BC4U", blocks, 6, 5)), 6 * 5 * 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
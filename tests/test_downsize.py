@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Lossless automatic format downsizing: every image is stored in the smallest format holding it,
+# and exporting the BFLIM gives back the exact pixels that were encoded.
+
+import io
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bflim_extract
+import png
+from tests.images import makeImage, encodePNG
+
+width, height = 16, 8
+
+
+def expand(value, bits):
+    # Scale a value of the given number of bits to 8 bits by replicating its bits, like the GX2 formats
+    return (value << (8 - bits)) | (value >> (2 * bits - 8))
+
+
+class DownsizeTest(unittest.TestCase):
+    # Images each format is the smallest lossless one for
+    images = {
+        "L8": makeImage(width, height, lambda x, y: ((x * 37 + y * 7) & 0xFF,) * 3 + (255,)),
+        "A8": makeImage(width, height, lambda x, y: (255, 255, 255, (x * 16 + y) * 2 & 0xFF)),
+        "LA4": makeImage(width, height, lambda x, y: (x * 17,) * 3 + (y * 17,)),
+        "RGB565": makeImage(width, height, lambda x, y: (expand(x * 2 + y % 2, 5), expand(x * 4 + y % 4, 6),
+                                                         expand(y * 4, 5), 255)),
+        "RGB5A1": makeImage(width, height, lambda x, y: (expand(x * 2 + y % 2, 5), expand(y * 4, 5), 0,
+                                                         255 if (x + y) & 1 else 0)),
+        "RGBA4": makeImage(width, height, lambda x, y: (x * 17, y * 34, 34, (x + y) % 16 * 17)),
+        "LA8": makeImage(width, height, lambda x, y: ((x * 37 + y * 7) & 0xFF,) * 3 + ((x * 3 + y * 50) & 0xFF,)),
+        "RGBA8": makeImage(width, height, lambda x, y: ((x * 7 + y * 3) & 0xFF, (x * 3 + y * 11) & 0xFF,
+                                                        (x * 5 + y * 13) & 0xFF, (x * 11 + y * 7) & 0xFF)),
+    }
+
+    def test_smallest_format(self):
+        for name, pixels in self.images.items():
+            with self.subTest(format=name):
+                self.assertEqual(bflim_extract.findLosslessFormat(pixels), name)
+
+    def test_lossless_round_trip(self):
+        for name, pixels in self.images.items():
+            with self.subTest(format=name):
+                flim, output = bflim_extract.encodeFLIM(encodePNG(width, height, pixels), downsize=True)
+
+                self.assertEqual(flim.format, bflim_extract.imageFormats[name][0])
+                self.assertEqual(flim.downsizedFrom, None if name == "RGBA8" else 32)
+
+                f = io.BytesIO()
+                bflim_extract.write_png(bflim_extract.readFLIM(output), f)
+
+                self.assertEqual(png.readPNG(f.getvalue()), (width, height, pixels))
+
+    def test_no_downsize(self):
+        # Without downsize, the texture keeps its format even if a smaller one would do
+        flim, _ = bflim_extract.encodeFLIM(encodePNG(width, height, self.images["L8"]))
+
+        self.assertEqual(flim.format, 0x1a)
+        self.assertIsNone(flim.downsizedFrom)
+
+
+if __name__ == '__main__':
+    unittest.main()
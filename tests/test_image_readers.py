@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Reading tiny PNG and TGA files built in memory to RGBA8,
+# with every available backend of the PNG unfiltering.
+
+import importlib.util
+import io
+import os
+import struct
+import sys
+import unittest
+import zlib
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import png
+import tga
+
+
+def loadPurePNG():
+    # png.py without its Cython and NumPy versions, which fail to import when set to None in sys.modules
+    spec = importlib.util.spec_from_file_location('png_pure', png.__file__)
+    module = importlib.util.module_from_spec(spec)
+
+    with mock.patch.dict(sys.modules, {'png_cy': None, 'png_np': None}):
+        spec.loader.exec_module(module)
+
+    return module
+
+
+backends = {'python': loadPurePNG()}
+
+try:
+    import pyximport
+
+    pyximport.install()
+    import png_cy
+    backends['cython'] = png_cy
+
+except ImportError:
+    pass
+
+try:
+    import png_np
+    backends['numpy'] = png_np
+
+except ImportError:
+    pass
+
+
+def chunk(type_, data):
+    return struct.pack('>I', len(data)) + type_ + data + struct.pack('>I', zlib.crc32(data, zlib.crc32(type_)))
+
+
+def paeth(a, b, c):
+    pa, pb, pc = abs(b - c), abs(a - c), abs(a + b - c - c)
+    return a if pa <= pb and pa <= pc else b if pb <= pc else c
+
+
+def filterRow(filterType, row, prior, bpp):
+    # The filters of the PNG specification, applied to a scanline
+    result = bytearray([filterType])
+    for i, value in enumerate(row):
+        a = row[i - bpp] if i >= bpp else 0
+        b = prior[i]
+        c = prior[i - bpp] if i >= bpp else 0
+
+        predictor = [0, a, b, (a + b) >> 1, paeth(a, b, c)][filterType]
+        result.append((value - predictor) & 0xFF)
+
+    return result
+
+
+def makePNG(width, height, bitDepth, colorType, rows, filterTypes=(0,), chunks=(), interlace=0):
+    """
+    Build a PNG file of the given scanlines (bytes of packed samples), filtering them with filterTypes in turn.
+    chunks: (type, data) of the chunks between IHDR and IDAT
+    """
+
+    bpp = max(1, png.channelCounts[colorType] * bitDepth // 8)
+
+    filtered = bytearray()
+    prior = bytes(len(rows[0]))
+    for y, row in enumerate(rows):
+        filtered += filterRow(filterTypes[y % len(filterTypes)], row, prior, bpp)
+        prior = row
+
+    data = png.signature + chunk(b'IHDR', struct.pack('>2I5B', width, height, bitDepth, colorType, 0, 0, interlace))
+    for type_, content in chunks:
+        data += chunk(type_, content)
+
+    return data + chunk(b'IDAT', zlib.compress(bytes(filtered))) + chunk(b'IEND', b'')
+
+
+class ReadPNGTest(unittest.TestCase):
+    def readPNG(self, data):
+        # Read with every backend, which must agree
+        results = {}
+        for name, backend in backends.items():
+            with mock.patch.object(png, 'unfilterImage', backend.unfilterImage), \
+                    mock.patch.object(png, 'applyColorKey', backend.applyColorKey):
+                results[name] = png.readPNG(data)
+
+        self.assertEqual(len(set(results.values())), 1, results)
+        return next(iter(results.values()))
+
+    def test_rgba8_filters(self):
+        # Every filter type, including Average and Paeth next to each other
+        pixels = bytes((x * 37 + y * 91 + c * 53) & 0xFF for y in range(10) for x in range(7) for c in range(4))
+        rows = [pixels[y * 28:(y + 1) * 28] for y in range(10)]
+
+        self.assertEqual(self.readPNG(makePNG(7, 10, 8, 6, rows, (0, 1, 2, 3, 4, 4, 3, 2, 1, 0))),
+                         (7, 10, pixels))
+
+    def test_rgb16(self):
+        # 16 bits samples keep their most significant byte
+        rows = [bytes.fromhex('1234 5678 9abc ffff 0000 8001'), bytes.fromhex('0102 0304 0506 0708 090a 0b0c')]
+
+        self.assertEqual(self.readPNG(makePNG(2, 2, 16, 2, rows, (4,))),
+                         (2, 2, bytes([0x12, 0x56, 0x9a, 255, 255, 0, 0x80, 255, 1, 3, 5, 255, 7, 9, 11, 255])))
+
+    def test_grayscale_2bits(self):
+        # The samples of less than 8 bits are scaled up, the padding bits of the row are dropped
+        rows = [bytes([0b00011011, 0b11000000])]
+
+        self.assertEqual(self.readPNG(makePNG(5, 1, 2, 0, rows)),
+                         (5, 1, bytes.fromhex('000000ff 555555ff aaaaaaff ffffffff ffffffff'.replace(' ', ''))))
+
+    def test_gray_alpha(self):
+        rows = [bytes([10, 20, 30, 40]), bytes([50, 60, 70, 80])]
+
+        self.assertEqual(self.readPNG(makePNG(2, 2, 8, 4, rows, (1, 3))),
+                         (2, 2, bytes([10, 10, 10, 20, 30, 30, 30, 40, 50, 50, 50, 60, 70, 70, 70, 80])))
+
+    def test_palette(self):
+        # 4 bits indices, the entries past the end of tRNS are opaque
+        palette = bytes([255, 0, 0, 0, 255, 0, 0, 0, 255])
+        rows = [bytes([0x01, 0x20])]
+
+        self.assertEqual(self.readPNG(makePNG(3, 1, 4, 3, rows, chunks=[(b'PLTE', palette), (b'tRNS', b'\x80')])),
+                         (3, 1, bytes([255, 0, 0, 128, 0, 255, 0, 255, 0, 0, 255, 255])))
+
+    def test_color_key(self):
+        # The pixels of the color of tRNS become transparent, compared on the most significant byte
+        rows = [bytes.fromhex('0102 0304 0506 0102 0304 0507')]
+
+        self.assertEqual(self.readPNG(makePNG(2, 1, 16, 2, rows, chunks=[(b'tRNS', bytes.fromhex('0100 0300 0500'))])),
+                         (2, 1, bytes([1, 3, 5, 0, 1, 3, 5, 0])))
+
+        rows = [bytes([7, 8, 7])]
+
+        self.assertEqual(self.readPNG(makePNG(3, 1, 8, 0, rows, chunks=[(b'tRNS', b'\x00\x07')])),
+                         (3, 1, bytes([7, 7, 7, 0, 8, 8, 8, 255, 7, 7, 7, 0])))
+
+    def test_invalid_files(self):
+        valid = makePNG(1, 1, 8, 6, [bytes(4)])
+
+        corrupted = bytearray(valid)
+        corrupted[20] ^= 1
+
+        invalid = {
+            'signature': b'\x89PNG\r\n\x1a\x00' + valid[8:],
+            'crc': bytes(corrupted),
+            'truncated': valid[:-20],
+            'interlaced': makePNG(1, 1, 8, 6, [bytes(4)], interlace=1),
+            'bit depth': makePNG(1, 1, 4, 6, [bytes(2)]),
+            'filter type': valid[:33] + chunk(b'IDAT', zlib.compress(b'\x05' + bytes(4))) + chunk(b'IEND', b''),
+            'missing palette': makePNG(1, 1, 8, 3, [bytes(1)]),
+        }
+
+        for name, data in invalid.items():
+            with self.subTest(name):
+                with self.assertRaises(png.PNGError):
+                    self.readPNG(data)
+
+    def test_writer_round_trip(self):
+        pixels = bytes(range(256)) * 3
+
+        for threads in [1, 4]:
+            with self.subTest(threads=threads):
+                f = io.BytesIO()
+                png.writePNG(f, 12, 16, [pixels[:400], pixels[400:]], threads=threads)
+
+                self.assertEqual(self.readPNG(f.getvalue()), (12, 16, pixels))
+
+
+def makeTGA(width, height, imageType, depth, pixels, descriptor=0x20, idLength=0):
+    return (struct.pack('<3BHHB4H2B', idLength, 0, imageType, 0, 0, 0, 0, 0, width, height, depth, descriptor)
+            + b'x' * idLength + pixels)
+
+
+class ReadTGATest(unittest.TestCase):
+    def test_bgra32(self):
+        # Bottom-left origin: the rows are flipped
+        data = makeTGA(2, 2, 2, 32, bytes(range(16)), descriptor=0x08, idLength=3)
+
+        self.assertTrue(tga.isTGA(data))
+        self.assertEqual(tga.readTGA(data), (2, 2, bytes([10, 9, 8, 11, 14, 13, 12, 15, 2, 1, 0, 3, 6, 5, 4, 7])))
+
+    def test_bgr24(self):
+        self.assertEqual(tga.readTGA(makeTGA(2, 1, 2, 24, bytes([1, 2, 3, 4, 5, 6]))),
+                         (2, 1, bytes([3, 2, 1, 255, 6, 5, 4, 255])))
+
+    def test_a1r5g5b5(self):
+        # The alpha bit is used when the descriptor declares it
+        pixels = struct.pack('<2H', 0x8000 | (31 << 10) | (16 << 5), 0x001F)
+
+        self.assertEqual(tga.readTGA(makeTGA(2, 1, 2, 16, pixels, descriptor=0x21)),
+                         (2, 1, bytes([255, 131, 0, 255, 0, 0, 255, 0])))
+
+        self.assertEqual(tga.readTGA(makeTGA(2, 1, 2, 16, pixels)),
+                         (2, 1, bytes([255, 131, 0, 255, 0, 0, 255, 255])))
+
+    def test_grayscale(self):
+        self.assertEqual(tga.readTGA(makeTGA(2, 1, 3, 8, bytes([7, 200]))),
+                         (2, 1, bytes([7, 7, 7, 255, 200, 200, 200, 255])))
+
+        self.assertEqual(tga.readTGA(makeTGA(2, 1, 3, 16, bytes([7, 100, 200, 50]))),
+                         (2, 1, bytes([7, 7, 7, 100, 200, 200, 200, 50])))
+
+    def test_invalid_files(self):
+        invalid = {
+            'too short': bytes(10),
+            'compressed': makeTGA(1, 1, 10, 32, bytes(4)),
+            'bits per pixel': makeTGA(1, 1, 2, 8, bytes(1)),
+            'right-to-left': makeTGA(1, 1, 2, 32, bytes(4), descriptor=0x30),
+            'truncated': makeTGA(2, 2, 2, 32, bytes(15)),
+        }
+
+        for name, data in invalid.items():
+            with self.subTest(name):
+                with self.assertRaises(tga.TGAError):
+                    tga.readTGA(data)
+
+        self.assertFalse(tga.isTGA(invalid['compressed']))
+
+
+if __name__ == '__main__':
+    unittest.main()
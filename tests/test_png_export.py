@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Round trips of PNG files through BFLIM in every uncompressed format,
+# checking that the PNG export gives back the pixels that were encoded.
+
+import io
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bflim_extract
+import png
+from tests.images import encodePNG
+
+width, height = 37, 21
+
+
+def quantize(value, bits):
+    return (value * ((1 << bits) - 1) + 127) // 255 * 255 // ((1 << bits) - 1)
+
+
+class PNGExportTest(unittest.TestCase):
+    def setUp(self):
+        self.pixels = bytes((i * 7 + (i >> 2) * 13) & 0xFF for i in range(width * height * 4))
+
+    def roundTrip(self, imageFormat, region=None):
+        _, output = bflim_extract.encodeFLIM(encodePNG(width, height, self.pixels), imageFormat=imageFormat)
+        flim = bflim_extract.readFLIM(output)
+
+        f = io.BytesIO()
+        bflim_extract.write_png(flim, f, region)
+
+        return png.readPNG(f.getvalue())
+
+    def test_rgba8(self):
+        self.assertEqual(self.roundTrip("RGBA8"), (width, height, self.pixels))
+
+    def test_rgba4(self):
+        # RGBA4 is stored with its alpha in the low bits, the export has to undo that
+        expected = bytes(quantize(value, 4) for value in self.pixels)
+        self.assertEqual(self.roundTrip("RGBA4"), (width, height, expected))
+
+    def test_rgba4_region(self):
+        x, y, regionWidth, regionHeight = 3, 5, 20, 9
+        expected = b''.join(bytes(quantize(value, 4) for value in self.pixels[((y + row) * width + x) * 4:
+                                                                              ((y + row) * width + x + regionWidth) * 4])
+                            for row in range(regionHeight))
+
+        self.assertEqual(self.roundTrip("RGBA4", (x, y, regionWidth, regionHeight)),
+                         (regionWidth, regionHeight, expected))
+
+
+if __name__ == '__main__':
+    unittest.main()
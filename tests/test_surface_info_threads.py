@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Stress test of addrlib.getSurfaceInfo() called from many threads at once,
+# checked against a serial run of every backend.
+
+import itertools
+import os
+import sys
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import addrlib
+
+formats = [0x01, 0x07, 0x08, 0x19, 0x1a, 0x31, 0x33, 0x35]
+tileModes = range(1, 17)
+sizes = [(1, 1), (4, 4), (33, 17), (64, 64), (100, 3), (127, 255), (256, 256), (300, 200),
+         (512, 128), (1000, 10), (1024, 1024), (7, 900), (2048, 16), (17, 2048)]
+
+threads = 16
+
+
+class SurfaceInfoThreadsTest(unittest.TestCase):
+    def setUp(self):
+        self.inputs = [(format_, width, height, 1, 1, tileMode, 0, 0)
+                       for format_, tileMode, (width, height) in itertools.product(formats, tileModes, sizes)]
+
+    def tearDown(self):
+        for backend in addrlib.backends.values():
+            backend.setSurfaceInfoCacheSize(4096)
+            backend.clearSurfaceInfoCache()
+
+    def checkBackend(self, backend, cacheSize):
+        backend.setSurfaceInfoCacheSize(0)
+        expected = [backend.getSurfaceInfo(*args) for args in self.inputs]
+
+        backend.setSurfaceInfoCacheSize(cacheSize)
+        backend.clearSurfaceInfoCache()
+
+        # Every input several times, interleaved across the threads switching as often as possible
+        switchInterval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+
+        try:
+            with ThreadPoolExecutor(threads) as executor:
+                results = list(executor.map(lambda args: backend.getSurfaceInfo(*args), self.inputs * 4))
+
+        finally:
+            sys.setswitchinterval(switchInterval)
+
+        for i, result in enumerate(results):
+            self.assertEqual(result, expected[i % len(self.inputs)], self.inputs[i % len(self.inputs)])
+
+    def test_uncached(self):
+        for name, backend in addrlib.backends.items():
+            with self.subTest(backend=name):
+                self.checkBackend(backend, 0)
+
+    def test_cached(self):
+        for name, backend in addrlib.backends.items():
+            with self.subTest(backend=name):
+                self.checkBackend(backend, 4096)
+
+    def test_small_cache(self):
+        # A cache smaller than the inputs keeps evicting while the threads read it
+        for name, backend in addrlib.backends.items():
+            with self.subTest(backend=name):
+                self.checkBackend(backend, 64)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright © 2016-2018 AboodXD
+
+# Feel free to include this in your own program if you want, just give credits. :)
+
+"""tga.py: Uncompressed TGA reader."""
+
+import struct
+
+# Bits per pixel supported by each uncompressed image type
+imageTypes = {2: [15, 16, 24, 32], 3: [8, 16]}
+
+
+class TGAError(ValueError):
+    """Raised when reading invalid or unsupported TGA files."""
+
+
+def isTGA(data):
+    """
+    Check whether the header of data looks like the one of an uncompressed TGA file.
+    TGA files have no magic, so only the fields of the header are checked.
+    """
+
+    if len(data) < 18:
+        return False
+
+    colorMapType, imageType = data[1], data[2]
+    return colorMapType in [0, 1] and imageType in imageTypes and data[16] in imageTypes[imageType]
+
+
+def readTGA(data):
+    """
+    Read an uncompressed truecolor or grayscale TGA file to RGBA8 pixels.
+    data: the whole file
+    Returns (width, height, pixels).
+    Raises TGAError if the file is invalid, compressed or color-mapped.
+    """
+
+    if len(data) < 18:
+        raise TGAError("Invalid TGA file!")
+
+    (idLength, colorMapType, imageType, _, colorMapLength, colorMapDepth,
+     _, _, width, height, depth, descriptor) = struct.unpack_from('<3BHHB4H2B', data)
+
+    if imageType not in imageTypes or colorMapType not in [0, 1]:
+        raise TGAError("Unsupported TGA image type: " + str(imageType))
+
+    if depth not in imageTypes[imageType]:
+        raise TGAError("Unsupported bits per pixel: " + str(depth))
+
+    if descriptor & 0x10:
+        raise TGAError("Right-to-left TGA files are not supported!")
+
+    # Skip the image ID and the color map, unused by truecolor images
+    pos = 18 + idLength + (colorMapLength * ((colorMapDepth + 7) // 8) if colorMapType else 0)
+
+    bytesPerPixel = (depth + 7) // 8
+    size = width * height * bytesPerPixel
+
+    src = data[pos:pos + size]
+    if len(src) != size:
+        raise TGAError("Truncated image data!")
+
+    numPixels = width * height
+    pixels = bytearray(numPixels * 4)
+
+    if imageType == 3:
+        for i in range(3):
+            pixels[i::4] = src[::bytesPerPixel]
+
+        pixels[3::4] = src[1::2] if bytesPerPixel == 2 else b'\xFF' * numPixels
+
+    elif bytesPerPixel == 2:
+        # A1R5G5B5, the alpha bit is only used by 16 bits per pixel files declaring an alpha bit
+        hasAlpha = depth == 16 and descriptor & 0xF
+        expand5 = bytes(value * 255 // 31 for value in range(32))
+        for i in range(numPixels):
+            value = src[i * 2] | (src[i * 2 + 1] << 8)
+            pixels[i * 4:i * 4 + 4] = bytes((expand5[(value >> 10) & 31], expand5[(value >> 5) & 31],
+                                             expand5[value & 31], 0 if hasAlpha and not value & 0x8000 else 255))
+
+    else:
+        # BGR(A)
+        pixels[0::4] = src[2::bytesPerPixel]
+        pixels[1::4] = src[1::bytesPerPixel]
+        pixels[2::4] = src[0::bytesPerPixel]
+        pixels[3::4] = src[3::4] if bytesPerPixel == 4 else b'\xFF' * numPixels
+
+    if not descriptor & 0x20:
+        # Bottom-left origin, flip the rows
+        rowSize = width * 4
+        pixels = b''.join(pixels[y * rowSize:(y + 1) * rowSize] for y in range(height - 1, -1, -1))
+
+    return width, height, bytes(pixels)